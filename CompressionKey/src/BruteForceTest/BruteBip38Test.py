@@ -1,84 +1,372 @@
-eforce.py
 """
-Password brute-force algorithm.
+BIP38 passphrase recovery for keys we own.
+
+Every candidate passphrase is checked the same way `Bip38.decrypt` checks it:
+one scrypt derivation, an AES decryption and the addresshash comparison
+(standard 6P... keys) or a strict padding and plaintext length check plus
+an optional known address (keys produced by `Bip38.encrypt` in main.py). The key is decoded
+once per process, so scrypt is the only heavy work done per candidate.
 """
 
-import string
-from itertools import product
-from time import time
-from numpy import loadtxt
+import argparse
+import os
+import sys
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import Bip38, private_key_to_public_key, public_key_to_address
+from candidates import passphrase_batches
+from keyspace import Checkpoint, Keyspace
+from bloom_filter import BloomFilter
+from rules import MarkovModel, RuleStats, ranked_candidates
+from wordlists import count_lines, unique_candidates
+
+
+COMMON_PASSWORDS = 'probable-v2-top12000.txt'
+COMMON_NAMES = 'middle-names.txt'
+
+
+class RecoveryTarget:
+    """A parsed BIP38 key that candidate passphrases are checked against."""
+
+    def __init__(self, encrypted_key, address=None):
+        self.encrypted_key = encrypted_key
+        self.flag, self.salt, self.encrypted = Bip38.parse(encrypted_key)
+        self.standard = len(self.salt) == 4
+        self.address = address.lower() if address else None
+
+    def verify(self, private_key, compressed):
+        if self.standard:
+            return Bip38.address_hash(private_key, compressed) == self.salt
+        if self.address is not None:
+            public_key = private_key_to_public_key(private_key, compressed)
+            return public_key_to_address(public_key) == self.address
+        return True
+
+    def check(self, passphrase):
+        """Return the private key if `passphrase` unlocks the target, else None."""
+        key = Bip38.derive_key(passphrase, self.salt)
+        try:
+            private_key, compressed = Bip38.decrypt_with_key(
+                self.flag, self.salt, self.encrypted, key, strict=True)
+        except ValueError:
+            return None
+        if not self.verify(private_key, compressed):
+            return None
+        return private_key
+
+
+def batched(candidates, size):
+    batch = []
+    for c in candidates:
+        batch.append(c)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+_worker_target = None
+_worker_keyspace = None
+
 
+def _init_worker(encrypted_key, address, tiers=None):
+    global _worker_target, _worker_keyspace
+    _worker_target = RecoveryTarget(encrypted_key, address)
+    _worker_keyspace = Keyspace(tiers) if tiers is not None else None
 
-def product_loop(password, generator):
-    for p in generator:
-        if ''.join(p) == password:
-            print('\nPassword:', ''.join(p))
-            return ''.join(p)
-    return False
 
+def _check_batch(batch):
+    for passphrase in batch:
+        if _worker_target.check(passphrase) is not None:
+            return passphrase, len(batch)
+    return None, len(batch)
+
+
+def _find_in_batch(batch):
+    start = perf_counter()
+    for pos, passphrase in enumerate(batch):
+        if _worker_target.check(passphrase) is not None:
+            return pos, perf_counter() - start
+    return None, perf_counter() - start
+
+
+def _check_range(bounds):
+    start, stop = bounds
+    for first, batch in passphrase_batches(_worker_keyspace, start, stop):
+        for index, passphrase in enumerate(batch, first):
+            if _worker_target.check(passphrase) is not None:
+                return index, start, stop
+    return None, start, stop
+
+
+class Progress:
+    """Counts checked candidates and prints the rate every `report_every`."""
+
+    def __init__(self, report_every=100):
+        self.report_every = report_every
+        self.checked = 0
+        self.start = perf_counter()
+        self._next_report = report_every
+
+    def add(self, n):
+        self.checked += n
+        if self.checked >= self._next_report:
+            self._next_report += self.report_every
+            self.report()
+
+    @property
+    def rate(self):
+        elapsed = perf_counter() - self.start
+        return self.checked / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        print("\t..%d candidates, %.2f candidates/s" % (self.checked, self.rate))
+
+
+def recover(target, candidates, workers=1, batch_size=8, progress=None):
+    """Check candidates against the target and return the matching passphrase.
 
-def bruteforce(password, max_nchar=8):
-    """Password brute-force algorithm.
     Parameters
     ----------
-    password : string
-        To-be-found password.
+    target : RecoveryTarget
+        Parsed key to recover.
+    candidates : iterable of str
+        Passphrases to try, in order.
+    workers : int
+        Number of processes; 1 checks candidates in this process.
+    batch_size : int
+        Candidates sent to a worker at a time.
+    progress : Progress
+        Shared counter, so rates cover every phase of a run.
+    Return
+    ------
+    passphrase : string or None
+        Recovered passphrase, None if no candidate matched.
+    """
+    progress = progress or Progress()
+    if workers <= 1:
+        for passphrase in candidates:
+            found = target.check(passphrase) is not None
+            progress.add(1)
+            if found:
+                return passphrase
+        return None
+
+    with Pool(workers, initializer=_init_worker,
+              initargs=(target.encrypted_key, target.address)) as pool:
+        for found, n in pool.imap(_check_batch, batched(candidates, batch_size)):
+            progress.add(n)
+            if found is not None:
+                pool.terminate()
+                return found
+    return None
+
+
+def recover_ranked(target, ranked, workers=1, batch_size=8, progress=None, stats=None):
+    """Like `recover`, for (candidate, rule) pairs, recording per-rule stats.
+
+    Rule throughput is candidates per worker-second: each batch's checking
+    time, measured in the worker, is shared among its candidates.
+    """
+    progress = progress or Progress()
+    stats = stats if stats is not None else RuleStats()
+    pool = None
+    if workers > 1:
+        pool = Pool(workers, initializer=_init_worker,
+                    initargs=(target.encrypted_key, target.address))
+    else:
+        _init_worker(target.encrypted_key, target.address)
+
+    in_flight = deque()
+
+    def candidate_batches():
+        for batch in batched(ranked, batch_size):
+            in_flight.append(batch)
+            yield [candidate for candidate, _ in batch]
+
+    results = pool.imap(_find_in_batch, candidate_batches()) if pool else map(_find_in_batch, candidate_batches())
+    try:
+        for found, seconds in results:
+            batch = in_flight.popleft()
+            checked = batch if found is None else batch[:found + 1]
+            share = seconds / len(checked)
+            for pos, (_, rule) in enumerate(checked):
+                stats.add(rule, 1, share, hits=int(pos == found))
+            progress.add(len(checked))
+            if found is not None:
+                return batch[found][0]
+        return None
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def recover_range(target, keyspace, start, stop, state_path=None, workers=1,
+                  batch_size=8, checkpoint_every=5.0, progress=None):
+    """Check keyspace indices [start, stop), resuming from `state_path`.
+
+    Batches are index ranges unranked by the workers themselves, and results
+    come back in order, so the checkpoint only ever advances over a fully
+    checked prefix. Interrupting the job (Ctrl-C, crash) loses at most the
+    batches in flight, which are checked again on restart.
+    Return
+    ------
+    passphrase : string or None
+        Recovered passphrase, None if the range holds no match.
+    """
+    progress = progress or Progress()
+    checkpoint = Checkpoint.load(state_path, keyspace, start, stop)
+    if checkpoint.found is not None:
+        return keyspace.unrank(checkpoint.found)
+    if checkpoint.done:
+        return None
+    print("\t..checking [%d, %d) of %d" % (checkpoint.next, stop, keyspace.size))
+
+    ranges = ((a, min(a + batch_size, stop)) for a in range(checkpoint.next, stop, batch_size))
+    initargs = (target.encrypted_key, target.address, keyspace.tiers)
+    pool = Pool(workers, initializer=_init_worker, initargs=initargs) if workers > 1 else None
+    if pool is None:
+        _init_worker(*initargs)
+    results = pool.imap(_check_range, ranges) if pool else map(_check_range, ranges)
+
+    last_save = perf_counter()
+    try:
+        for found, a, b in results:
+            if found is not None:
+                # Everything below the match has been checked
+                checkpoint.found = found
+                progress.add(found - a + 1)
+                return keyspace.unrank(found)
+            checkpoint.next = b
+            progress.add(b - a)
+            if perf_counter() - last_save >= checkpoint_every:
+                checkpoint.save()
+                last_save = perf_counter()
+        return None
+    finally:
+        checkpoint.save()
+        if pool is not None:
+            pool.terminate()
+
+
+def bruteforce(encrypted_key, max_nchar=8, address=None, workers=1,
+               wordlists=(COMMON_PASSWORDS, COMMON_NAMES), rule_words=20000,
+               rule_candidates=50000, state=None):
+    """BIP38 passphrase recovery.
+    Parameters
+    ----------
+    encrypted_key : string
+        BIP38 key whose passphrase is to be recovered.
     max_nchar : int
-        Maximum number of characters of password.
+        Maximum number of characters of passphrase.
+    address : string
+        Known address of the key, used to confirm keys without an addresshash.
+    workers : int
+        Number of checking processes.
+    rule_words : int
+        Top dictionary words fed to the mutation rules and Markov model.
+    rule_candidates : int
+        Most likely mutated candidates tried before the exhaustive phases.
+    state : string
+        Prefix of the checkpoint files of steps 2 to 4, None to keep none.
+        A run with the same prefix resumes where the last one stopped.
     Return
     ------
     bruteforce_password : string
-        Brute-forced password
+        Recovered passphrase, None if every phase was exhausted.
     """
-    print('1) Comparing with most common passwords / first names')
-    common_pass = loadtxt('probable-v2-top12000.txt', dtype=str)
-    common_names = loadtxt('middle-names.txt', dtype=str)
-    cp = [c for c in common_pass if c == password]
-    cn = [c for c in common_names if c == password]
-    cnl = [c.lower() for c in common_names if c.lower() == password]
-
-    if len(cp) == 1:
-        print('\nPassword:', cp)
-        return cp
-    if len(cn) == 1:
-        print('\nPassword:', cn)
-        return cn
-    if len(cnl) == 1:
-        print('\nPassword:', cnl)
-        return cnl
- 
-    print('2) Digits cartesian product')
-    for l in range(1, 9):
-        generator = product(string.digits, repeat=int(l))
-        print("\t..%d digit" % l)
-        p = product_loop(password, generator)
-        if p is not False:
-            return p
+    target = RecoveryTarget(encrypted_key, address)
+    progress = Progress()
 
-    print('3) Digits + ASCII lowercase')
-    for l in range(1, max_nchar + 1):
-        print("\t..%d char" % l)
-        generator = product(string.digits + string.ascii_lowercase,
-                            repeat=int(l))
-        p = product_loop(password, generator)
-        if p is not False:
-            return p
+    for path in wordlists:
+        if not os.path.exists(path):
+            print("\t..skipping missing wordlist %s" % path)
+    # One filter across both dictionary phases, so a lowercased name that
+    # was already tried as a password is not checked twice
+    seen = BloomFilter(count_lines(wordlists) * 2 + rule_candidates, 1e-7)
+    stats = RuleStats()
+
+    def mutated():
+        words = list(islice(unique_candidates(wordlists), rule_words))
+        markov = MarkovModel().train(words) if words else None
+        return recover_ranked(target, ranked_candidates(words, markov=markov, seen=seen,
+                                                        limit=rule_candidates),
+                              workers=workers, progress=progress, stats=stats)
+
+    # Steps 2 to 4 are consecutive ranges of the keyspace the coordinator
+    # and --shard split, so each one can be checkpointed and resumed
+    keyspace = Keyspace.from_phases(max_nchar)
+    bounds = keyspace.offsets[::max_nchar] + [keyspace.size]
 
-    print('4) Digits + ASCII lower / upper + punctuation')
-    # If it fails, we start brute-forcing the 'hard' way
-    # Same as possible_char = string.printable[:-5]
-    all_char = string.digits + string.ascii_letters + string.punctuation
+    def exhaustive(step):
+        start, stop = bounds[step - 2], bounds[step - 1]
+        state_path = '%s.step%d.state' % (state, step) if state else None
+        return lambda: recover_range(target, keyspace, start, stop, state_path,
+                                     workers=workers, progress=progress)
 
-    for l in range(1, max_nchar + 1):
-        print("\t..%d char" % l)
-        generator = product(all_char, repeat=int(l))
-        p = product_loop(password, generator)
-        if p is not False:
+    phases = [
+        ('1) Most common passwords / first names',
+         lambda: recover(target, unique_candidates(wordlists, bloom=seen),
+                         workers=workers, progress=progress)),
+        ('1b) Lowercase first names',
+         lambda: recover(target, unique_candidates(wordlists[1:], lower=True, bloom=seen),
+                         workers=workers, progress=progress)),
+        ('1c) Mutation rules, word pairs and Markov candidates, most likely first',
+         mutated),
+        ('2) Digits cartesian product', exhaustive(2)),
+        ('3) Digits + ASCII lowercase', exhaustive(3)),
+        # Same as possible_char = string.printable[:-5]
+        ('4) Digits + ASCII lower / upper + punctuation', exhaustive(4)),
+    ]
+    for title, run in phases:
+        print(title)
+        p = run()
+        if stats.tried and title.startswith('1c'):
+            stats.report()
+        if p is not None:
+            if isinstance(p, bytes):
+                p = p.decode('utf-8', 'replace')
+            progress.report()
+            print('\nPassword:', p)
             return p
+    progress.report()
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recover the passphrase of a BIP38 key we own.")
+    parser.add_argument('encrypted_key', help="BIP38 key (6P...)")
+    parser.add_argument('--max-nchar', type=int, default=8)
+    parser.add_argument('--address', help="Known address, for keys without an addresshash")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--rule-candidates', type=int, default=50000,
+                        help="Mutated candidates tried before the exhaustive phases")
+    parser.add_argument('--shard', type=int, help="Check only this shard of the exhaustive keyspace")
+    parser.add_argument('--shards', type=int, default=1, help="Number of shards the keyspace is split into")
+    parser.add_argument('--state', help="Checkpoint file for the shard (default: <key>.<shard>.state); "
+                                        "without --shard, prefix of the per-step files (default: <key>)")
+    args = parser.parse_args()
+
+    start = perf_counter()
+    if args.shard is None:
+        bruteforce(args.encrypted_key, args.max_nchar, args.address, args.workers,
+                   rule_candidates=args.rule_candidates, state=args.state or args.encrypted_key[:12])
+    else:
+        keyspace = Keyspace.from_phases(args.max_nchar)
+        a, b = keyspace.shards(args.shards)[args.shard]
+        state = args.state or '%s.%d.state' % (args.encrypted_key[:12], args.shard)
+        target = RecoveryTarget(args.encrypted_key, args.address)
+        p = recover_range(target, keyspace, a, b, state, args.workers)
+        if p is not None:
+            print('\nPassword:', p)
+    print('Total time: %.2f seconds' % (perf_counter() - start))
 
 
-# EXAMPLE
-start = time()
-bruteforce('sunshine') # Try with '123456' or '751345' or 'test2018'
-end = time()
-print('Total time: %.2f seconds' % (end - start))
\ No newline at end of file
+if __name__ == '__main__':
+    main()
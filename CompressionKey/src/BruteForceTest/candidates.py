@@ -0,0 +1,126 @@
+"""
+Vectorized candidate generation for the exhaustive keyspace tiers.
+
+Instead of building a Python string per tuple from itertools.product, a
+batch of consecutive indices is converted to mixed-radix digits with NumPy
+and mapped through the charset in one step. The result is a fixed-width
+(n, length) uint8 array per batch. The checker receives a whole batch at
+a time as a list of bytes, built by NumPy in C: a view of each row as
+its own Python object costs more than the itertools.product loop saves.
+"""
+
+import string
+from itertools import product
+from time import perf_counter
+
+import numpy as np
+
+from keyspace import Keyspace
+
+
+def _block(base, length):
+    """Size of the int64-addressable blocks a tier is cut into (the whole tier if it fits)."""
+    low = length
+    while base ** low >= 2 ** 63:
+        low -= 1
+    return base ** low
+
+
+def tier_batch(charset, length, first, count):
+    """Candidates first .. first + count - 1 of one tier as an (count, length) uint8 array.
+
+    Tiers past int64 (94 characters from length 10) are walked in blocks:
+    the leading digits of the batch are fixed by the block number, and only
+    the trailing ones are computed with NumPy. A batch must not span blocks.
+    """
+    base = len(charset)
+    block = _block(base, length)
+    prefix, first = divmod(first, block)
+    if first + count > block:
+        raise ValueError("Batch spans two int64 blocks of the tier")
+    lut = np.frombuffer(charset.encode('ascii'), dtype=np.uint8)
+    indices = np.arange(first, first + count, dtype=np.int64)
+    digits = np.empty((count, length), dtype=np.intp)
+    high = length - 1
+    while block > 1:
+        indices, digits[:, high] = np.divmod(indices, base)
+        block //= base
+        high -= 1
+    for pos in range(high, -1, -1):
+        prefix, digits[:, pos] = divmod(prefix, base)
+    return lut[digits]
+
+
+def candidate_batches(keyspace, start, stop, batch_size=4096):
+    """Yield (first index, uint8 array) batches covering [start, stop).
+
+    Batches never span two tiers, so every array has a single width.
+    """
+    stop = min(stop, keyspace.size)
+    index = start
+    while index < stop:
+        tier, i = keyspace.locate(index)
+        charset, length = keyspace.tiers[tier]
+        tier_stop = min(stop, keyspace.offsets[tier] + len(charset) ** length)
+        block = _block(len(charset), length)
+        count = min(batch_size, tier_stop - index, block - i % block)
+        yield index, tier_batch(charset, length, i, count)
+        index += count
+
+
+def passphrases(batch):
+    """The rows of a uint8 batch as a list of bytes.
+
+    Charsets never contain NUL, so the fixed-width bytes view loses nothing.
+    """
+    return batch.view('S%d' % batch.shape[1]).ravel().tolist()
+
+
+def passphrase_batches(keyspace, start, stop, batch_size=4096):
+    """Yield (first index, list of bytes) batches covering [start, stop)."""
+    for first, batch in candidate_batches(keyspace, start, stop, batch_size):
+        yield first, passphrases(batch)
+
+
+def indexed_candidates(keyspace, start, stop, batch_size=4096):
+    """Yield (index, bytes) for every candidate in [start, stop)."""
+    for first, batch in passphrase_batches(keyspace, start, stop, batch_size):
+        yield from enumerate(batch, first)
+
+
+def _product_loop(password, generator):
+    # The original per-candidate loop, kept as the benchmark baseline
+    for p in generator:
+        if ''.join(p) == password:
+            return ''.join(p)
+    return False
+
+
+def benchmark(charset=string.digits + string.ascii_lowercase, length=5):
+    """Print candidates generated per second: product_loop vs NumPy batches."""
+    keyspace = Keyspace([(charset, length)])
+    n = keyspace.size
+
+    start = perf_counter()
+    _product_loop(None, product(charset, repeat=length))
+    loop_rate = n / (perf_counter() - start)
+
+    start = perf_counter()
+    for _ in candidate_batches(keyspace, 0, n, batch_size=1 << 16):
+        pass
+    batch_rate = n / (perf_counter() - start)
+
+    start = perf_counter()
+    for _, batch in passphrase_batches(keyspace, 0, n):
+        for _ in batch:
+            pass
+    list_rate = n / (perf_counter() - start)
+
+    print("%d candidates of %d chars" % (n, length))
+    print("product_loop ''.join:        %12.0f candidates/s" % loop_rate)
+    print("NumPy batches (arrays only): %12.0f candidates/s" % batch_rate)
+    print("NumPy batches as bytes:      %12.0f candidates/s" % list_rate)
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,514 @@
+"""
+Coordinator/worker protocol for multi-node passphrase recovery.
+
+The coordinator owns the exhaustive keyspace of `bruteforce` (see
+keyspace.py), cut into fixed-size shards. Workers connect over TCP
+("host:port") or a Unix socket ("unix:/path") and exchange one JSON object
+per line:
+
+    worker                                  coordinator
+    {"op": "hello", "worker": id, token} -> {"op": "config", key, address, tiers}
+                                            | {"op": "error"} and disconnect
+    {"op": "lease"}                     ->  {"op": "shard", shard, start, stop, lease}
+                                            | {"op": "wait"} | {"op": "done"}
+    {"op": "heartbeat", shard, next, rate} -> {"op": "ok"} | {"op": "cancel"}
+    {"op": "result", shard, found}      ->  {"op": "ok"}
+
+A lease lasts `lease_seconds` and is renewed by each heartbeat. Shards
+whose lease runs out are re-issued from the last reported `next`, the
+lowest index the dead worker had not yet checked.
+
+Every connection starts with a hello carrying the shared token; anything
+else gets an error and is dropped before the key is sent. `serve` listens
+on 127.0.0.1 unless told otherwise. A result is only accepted from the
+worker holding the shard's lease, and a reported passphrase is checked
+against the key before the job is marked found.
+
+Everything runs on one machine too: `local` starts a coordinator and N
+worker processes talking over a Unix socket.
+"""
+
+import argparse
+import hmac
+import json
+import os
+import secrets
+import socket
+import socketserver
+import tempfile
+import threading
+from multiprocessing import Pool, Process
+from time import monotonic, perf_counter, sleep
+
+from BruteBip38Test import RecoveryTarget, _check_range, _init_worker
+from keyspace import Keyspace, write_state
+
+TOKEN_ENV = 'BIP38_COORDINATOR_TOKEN'
+
+
+class Shard:
+    def __init__(self, shard_id, start, stop):
+        self.id = shard_id
+        self.start = start
+        self.stop = stop
+        self.next = start
+        self.worker = None
+        self.deadline = None
+
+    @property
+    def done(self):
+        return self.next >= self.stop
+
+
+class Coordinator:
+    """Shard bookkeeping; transport-independent and thread-safe.
+
+    Shards are handed out lazily: shard k covers [start + k * shard_size,
+    start + (k + 1) * shard_size), `cursor` is the first shard never issued
+    and `partials` holds the issued shards that are not finished yet
+    (leased, expired or resumed part-way). Every shard below `cursor` and
+    not in `partials` has been fully checked, so memory and state size grow
+    with the number of workers, not with the keyspace.
+    """
+
+    def __init__(self, encrypted_key, keyspace, address=None, shard_size=1000,
+                 lease_seconds=60.0, state_path=None, start=0, stop=None):
+        self.encrypted_key = encrypted_key
+        self.address = address
+        self.target = RecoveryTarget(encrypted_key, address)
+        self.keyspace = keyspace
+        self.shard_size = shard_size
+        self.lease_seconds = lease_seconds
+        self.state_path = state_path
+        self.start = start
+        self.stop = keyspace.size if stop is None else min(stop, keyspace.size)
+        self.found = None
+        self.rates = {}
+        self._lock = threading.Lock()
+        self.count = -(-max(self.stop - self.start, 0) // shard_size)
+        self.cursor = 0
+        self.partials = {}
+        self._load()
+
+    def _bounds(self, shard_id):
+        a = self.start + shard_id * self.shard_size
+        return a, min(a + self.shard_size, self.stop)
+
+    def _job(self):
+        return {'keyspace': self.keyspace.fingerprint(), 'start': self.start,
+                'stop': self.stop, 'shard_size': self.shard_size}
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        with open(self.state_path) as f:
+            state = json.load(f)
+        if any(state.get(k) != v for k, v in self._job().items()):
+            raise ValueError("State file %s belongs to a different job" % self.state_path)
+        self.cursor = state['cursor']
+        for shard_id, next_index in state['partials']:
+            shard = Shard(shard_id, *self._bounds(shard_id))
+            shard.next = next_index
+            self.partials[shard_id] = shard
+        self.found = state.get('found')
+
+    def save(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            state = self._job()
+            state.update({
+                'cursor': self.cursor,
+                'partials': [[s.id, s.next] for s in self.partials.values()],
+                'found': self.found,
+            })
+        write_state(self.state_path, state)
+
+    @property
+    def finished(self):
+        return self.found is not None or (self.cursor == self.count and not self.partials)
+
+    def config(self):
+        return {'op': 'config', 'encrypted_key': self.encrypted_key,
+                'address': self.address, 'tiers': self.keyspace.tiers}
+
+    def lease(self, worker, now=None):
+        now = monotonic() if now is None else now
+        with self._lock:
+            if self.finished:
+                return {'op': 'done'}
+            self._reap(now)
+            # Unfinished shards first, so a dead worker's range is not left for last
+            shard = next((s for s in self.partials.values() if s.worker is None), None)
+            if shard is None:
+                if self.cursor == self.count:
+                    return {'op': 'wait'}
+                shard = Shard(self.cursor, *self._bounds(self.cursor))
+                self.partials[shard.id] = shard
+                self.cursor += 1
+            shard.worker = worker
+            shard.deadline = now + self.lease_seconds
+            return {'op': 'shard', 'shard': shard.id, 'start': shard.next,
+                    'stop': shard.stop, 'lease': self.lease_seconds}
+
+    def heartbeat(self, worker, shard_id, next_index, rate, now=None):
+        now = monotonic() if now is None else now
+        with self._lock:
+            self.rates[worker] = (rate, now)
+            shard = self._shard(shard_id)
+            if self.found is not None or shard is None or shard.worker != worker:
+                # Lease expired and went to someone else, or the job is over
+                return {'op': 'cancel'}
+            shard.next = max(shard.next, min(next_index, shard.stop))
+            shard.deadline = now + self.lease_seconds
+            return {'op': 'ok'}
+
+    def complete(self, worker, shard_id, found):
+        with self._lock:
+            shard = self._shard(shard_id)
+            if shard is None or shard.worker != worker:
+                # Only the lease holder may close a shard
+                return {'op': 'cancel'}
+        # One scrypt derivation, so checked outside the lock
+        if found is not None and not self._confirm(shard, found):
+            with self._lock:
+                if shard.worker == worker:
+                    shard.worker = shard.deadline = None
+            print("\t..worker %s reported a passphrase for shard %d that does not unlock the key"
+                  % (worker, shard.id))
+            return {'op': 'error', 'error': 'reported passphrase does not unlock the key'}
+        with self._lock:
+            if self.partials.get(shard.id) is not shard or shard.worker != worker:
+                return {'op': 'cancel'}
+            if found is not None:
+                self.found = found
+            del self.partials[shard.id]
+        self.save()
+        return {'op': 'ok'}
+
+    def _shard(self, shard_id):
+        """The unfinished shard `shard_id`, None if it is done or was never issued."""
+        if type(shard_id) is not int or not 0 <= shard_id < self.count:
+            raise IndexError("No shard %r" % (shard_id,))
+        return self.partials.get(shard_id)
+
+    def _confirm(self, shard, found):
+        return (type(found) is int and shard.start <= found < shard.stop
+                and self.target.check(self.keyspace.unrank(found)) is not None)
+
+    def reap(self, now=None):
+        with self._lock:
+            return self._reap(monotonic() if now is None else now)
+
+    def _reap(self, now):
+        expired = [s for s in self.partials.values()
+                   if s.worker is not None and s.deadline < now]
+        for shard in expired:
+            print("\t..lease on shard %d expired (worker %s), re-issuing from %d"
+                  % (shard.id, shard.worker, shard.next))
+            shard.worker = None
+            shard.deadline = None
+        for worker, (_, seen) in list(self.rates.items()):
+            if seen < now - self.lease_seconds:
+                del self.rates[worker]
+        return expired
+
+    def status(self):
+        with self._lock:
+            issued = (self._bounds(self.cursor - 1)[1] if self.cursor else self.start) - self.start
+            return {
+                'checked': issued - sum(s.stop - s.next for s in self.partials.values()),
+                'total': self.stop - self.start,
+                'shards_done': self.cursor - len(self.partials),
+                'shards': self.count,
+                'workers': len(self.rates),
+                'rate': sum(rate for rate, _ in self.rates.values()),
+            }
+
+    def handle(self, worker, msg):
+        op = msg.get('op')
+        if op == 'hello':
+            return self.config()
+        if op == 'lease':
+            return self.lease(worker)
+        if op == 'heartbeat':
+            return self.heartbeat(worker, msg['shard'], msg['next'], msg.get('rate', 0.0))
+        if op == 'result':
+            return self.complete(worker, msg['shard'], msg.get('found'))
+        return {'op': 'error', 'error': 'unknown op %r' % op}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        coordinator = self.server.coordinator
+        worker = None
+        for line in self.rfile:
+            try:
+                msg = json.loads(line)
+                if msg.get('op') == 'hello':
+                    if not hmac.compare_digest(str(msg.get('token', '')).encode(), self.server.token.encode()):
+                        self._reply({'op': 'error', 'error': 'bad token'})
+                        return
+                    worker = msg.get('worker') or repr(self.client_address)
+                elif worker is None:
+                    self._reply({'op': 'error', 'error': 'hello first'})
+                    return
+                reply = coordinator.handle(worker, msg)
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+                reply = {'op': 'error', 'error': 'bad message: %s' % e}
+            self._reply(reply)
+
+    def _reply(self, reply):
+        self.wfile.write(json.dumps(reply).encode() + b'\n')
+        self.wfile.flush()
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+def _split_address(address):
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, port = address.rsplit(':', 1)
+    return socket.AF_INET, (host, int(port))
+
+
+def serve(coordinator, listen, token, report_every=10.0):
+    """Run the coordinator on `listen` until the job finishes; return the passphrase.
+
+    Workers must present `token` in their hello.
+    """
+    if not token:
+        raise ValueError("A shared token is required")
+    family, addr = _split_address(listen)
+    if family == socket.AF_UNIX:
+        if os.path.exists(addr):
+            os.remove(addr)
+        server = _UnixServer(addr, _Handler)
+    else:
+        server = _TCPServer(addr, _Handler)
+    server.coordinator = coordinator
+    server.token = token
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print("Coordinator listening on %s: %d shards" % (listen, coordinator.count))
+
+    last_report = monotonic()
+    try:
+        while not coordinator.finished:
+            sleep(0.2)
+            coordinator.reap()
+            if monotonic() - last_report >= report_every:
+                last_report = monotonic()
+                st = coordinator.status()
+                print("\t..%d/%d candidates, %d/%d shards, %d workers, %.2f candidates/s"
+                      % (st['checked'], st['total'], st['shards_done'], st['shards'],
+                         st['workers'], st['rate']))
+                coordinator.save()
+        # Let connected workers pick up the "done" reply
+        sleep(0.5)
+    finally:
+        coordinator.save()
+        server.shutdown()
+        server.server_close()
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.remove(addr)
+    if coordinator.found is not None:
+        return coordinator.keyspace.unrank(coordinator.found)
+    return None
+
+
+class WorkerClient:
+    """One connection to the coordinator; request() is safe across threads."""
+
+    def __init__(self, address, worker_id):
+        family, addr = _split_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(addr)
+        self.rfile = self.sock.makefile('rb')
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+
+    def request(self, msg):
+        with self._lock:
+            self.sock.sendall(json.dumps(msg).encode() + b'\n')
+            line = self.rfile.readline()
+        if not line:
+            raise ConnectionError("Coordinator closed the connection")
+        return json.loads(line)
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+
+def run_worker(address, token, processes=1, worker_id=None, heartbeat_every=5.0, batch_size=4):
+    """Check shards leased from the coordinator at `address` until the job is done."""
+    worker_id = worker_id or '%s:%d' % (socket.gethostname(), os.getpid())
+    client = WorkerClient(address, worker_id)
+    cfg = client.request({'op': 'hello', 'worker': worker_id, 'token': token})
+    if cfg['op'] != 'config':
+        client.close()
+        raise PermissionError("Coordinator refused the connection: %s" % cfg.get('error'))
+    initargs = (cfg['encrypted_key'], cfg['address'], [tuple(t) for t in cfg['tiers']])
+
+    def start_pool():
+        if processes > 1:
+            return Pool(processes, initializer=_init_worker, initargs=initargs)
+        _init_worker(*initargs)
+        return None
+
+    pool = start_pool()
+    try:
+        while True:
+            reply = client.request({'op': 'lease'})
+            if reply['op'] == 'done':
+                return
+            if reply['op'] == 'wait':
+                sleep(1.0)
+                continue
+            if not _run_shard(client, pool, reply, heartbeat_every, batch_size) and pool is not None:
+                # Batches of the cancelled shard are still queued in the pool
+                pool.terminate()
+                pool = start_pool()
+    except ConnectionError:
+        # Coordinator finished and went away
+        return
+    finally:
+        if pool is not None:
+            pool.terminate()
+        client.close()
+
+
+def _run_shard(client, pool, lease, heartbeat_every, batch_size):
+    """Check one leased shard; returns False if the coordinator cancelled it."""
+    shard_id, start, stop = lease['shard'], lease['start'], lease['stop']
+    progress = {'next': start, 'checked': 0, 'start': perf_counter()}
+    cancelled = threading.Event()
+    finished = threading.Event()
+
+    def beat():
+        while not finished.wait(heartbeat_every):
+            elapsed = perf_counter() - progress['start']
+            rate = progress['checked'] / elapsed if elapsed > 0 else 0.0
+            reply = client.request({'op': 'heartbeat', 'shard': shard_id,
+                                    'next': progress['next'], 'rate': rate})
+            if reply['op'] == 'cancel':
+                cancelled.set()
+                return
+
+    beater = threading.Thread(target=beat, daemon=True)
+    beater.start()
+    ranges = ((a, min(a + batch_size, stop)) for a in range(start, stop, batch_size))
+    results = pool.imap(_check_range, ranges) if pool else map(_check_range, ranges)
+    found = None
+    try:
+        for found, a, b in results:
+            if found is not None:
+                break
+            progress['next'] = b
+            progress['checked'] += b - a
+            if cancelled.is_set():
+                return False
+    finally:
+        finished.set()
+        beater.join()
+    client.request({'op': 'result', 'shard': shard_id, 'found': found})
+    return True
+
+
+def run_local(encrypted_key, workers=2, processes=1, address=None, max_nchar=8,
+              shard_size=1000, lease_seconds=60.0, state_path=None, keyspace=None,
+              start=0, stop=None, startup_timeout=10.0):
+    """Coordinator plus `workers` local worker processes over a Unix socket."""
+    keyspace = keyspace or Keyspace.from_phases(max_nchar)
+    coordinator = Coordinator(encrypted_key, keyspace, address, shard_size,
+                              lease_seconds, state_path, start, stop)
+    listen = 'unix:' + os.path.join(tempfile.gettempdir(), 'bip38-coordinator-%d.sock' % os.getpid())
+    token = secrets.token_urlsafe(16)
+    result = {}
+    _, path = _split_address(listen)
+    if os.path.exists(path):
+        os.remove(path)
+    server = threading.Thread(target=lambda: result.setdefault('p', serve(coordinator, listen, token)),
+                              daemon=True)
+    server.start()
+    deadline = monotonic() + startup_timeout
+    while not os.path.exists(path):
+        if not server.is_alive() or monotonic() > deadline:
+            raise RuntimeError("Coordinator failed to start on %s" % listen)
+        sleep(0.05)
+    procs = [Process(target=run_worker, args=(listen, token, processes, 'local-%d' % k))
+             for k in range(workers)]
+    for p in procs:
+        p.start()
+    server.join()
+    for p in procs:
+        p.join(timeout=5)
+        if p.is_alive():
+            p.terminate()
+    return result.get('p')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed BIP38 passphrase recovery.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    s = sub.add_parser('serve', help="Run the coordinator")
+    s.add_argument('encrypted_key')
+    s.add_argument('--listen', default='127.0.0.1:7938',
+                   help="host:port or unix:/path; use 0.0.0.0:7938 to accept remote workers")
+    s.add_argument('--token', default=os.environ.get(TOKEN_ENV),
+                   help="Shared secret workers must present (default: $%s, else a random one)" % TOKEN_ENV)
+    s.add_argument('--address', help="Known address, for keys without an addresshash")
+    s.add_argument('--max-nchar', type=int, default=8)
+    s.add_argument('--shard-size', type=int, default=1000)
+    s.add_argument('--lease', type=float, default=60.0, help="Lease length in seconds")
+    s.add_argument('--state', help="Coordinator state file, for restarts")
+
+    w = sub.add_parser('work', help="Run a worker")
+    w.add_argument('--connect', required=True, help="host:port or unix:/path")
+    w.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    w.add_argument('--token', default=os.environ.get(TOKEN_ENV),
+                   help="Shared secret printed by the coordinator (default: $%s)" % TOKEN_ENV)
+
+    l = sub.add_parser('local', help="Coordinator and workers on this machine")
+    l.add_argument('encrypted_key')
+    l.add_argument('--workers', type=int, default=2)
+    l.add_argument('--address')
+    l.add_argument('--max-nchar', type=int, default=8)
+    l.add_argument('--shard-size', type=int, default=1000)
+
+    args = parser.parse_args()
+    if args.command == 'work':
+        if not args.token:
+            parser.error("--token (or $%s) is required" % TOKEN_ENV)
+        run_worker(args.connect, args.token, args.processes)
+        return
+    if args.command == 'serve':
+        keyspace = Keyspace.from_phases(args.max_nchar)
+        coordinator = Coordinator(args.encrypted_key, keyspace, args.address, args.shard_size,
+                                  args.lease, args.state)
+        token = args.token
+        if not token:
+            token = secrets.token_urlsafe(16)
+            print("Worker token: %s" % token)
+        p = serve(coordinator, args.listen, token)
+    else:
+        p = run_local(args.encrypted_key, args.workers, address=args.address,
+                      max_nchar=args.max_nchar, shard_size=args.shard_size)
+    if p is not None:
+        print('\nPassword:', p)
+    else:
+        print('\nKeyspace exhausted without a match')
+
+
+if __name__ == '__main__':
+    main()
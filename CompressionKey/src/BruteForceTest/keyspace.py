@@ -0,0 +1,168 @@
+"""
+Index-addressed candidate keyspace with checkpoint/resume.
+
+The exhaustive phases of `bruteforce` (digits, digits + lowercase, full
+printable set) are laid end to end as tiers of (charset, length). Every
+candidate has an integer index, so a range [a, b) maps straight to its
+candidates and disjoint ranges can be handed to separate workers.
+"""
+
+import json
+import os
+import string
+
+
+def phase_tiers(max_nchar=8):
+    """The (charset, length) tiers of bruteforce steps 2, 3 and 4, in order.
+
+    Each step has `max_nchar` tiers, so step k starts at tier (k - 2) * max_nchar.
+    """
+    tiers = [(string.digits, l) for l in range(1, max_nchar + 1)]
+    tiers += [(string.digits + string.ascii_lowercase, l) for l in range(1, max_nchar + 1)]
+    all_char = string.digits + string.ascii_letters + string.punctuation
+    tiers += [(all_char, l) for l in range(1, max_nchar + 1)]
+    return tiers
+
+
+class Keyspace:
+    """Concatenation of product(charset, repeat=length) tiers, addressed by index.
+
+    Within a tier, index i is written in base len(charset) with the most
+    significant digit first, which is the order itertools.product uses.
+    """
+
+    def __init__(self, tiers):
+        self.tiers = [(charset, int(length)) for charset, length in tiers]
+        self.offsets = []
+        total = 0
+        for charset, length in self.tiers:
+            self.offsets.append(total)
+            total += len(charset) ** length
+        self.size = total
+
+    @classmethod
+    def from_phases(cls, max_nchar=8):
+        return cls(phase_tiers(max_nchar))
+
+    def fingerprint(self):
+        # Identifies the keyspace in checkpoints so a state file is never
+        # resumed against a different ordering
+        return [[charset, length] for charset, length in self.tiers]
+
+    def locate(self, index):
+        """Return (tier number, index within the tier)."""
+        if not 0 <= index < self.size:
+            raise IndexError("Candidate index %d out of range" % index)
+        lo, hi = 0, len(self.offsets) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.offsets[mid] <= index:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo, index - self.offsets[lo]
+
+    def unrank(self, index):
+        tier, i = self.locate(index)
+        charset, length = self.tiers[tier]
+        return ''.join(charset[d] for d in _digits(i, len(charset), length))
+
+    def candidates(self, start, stop):
+        """Yield the candidates with index in [start, stop)."""
+        stop = min(stop, self.size)
+        index = start
+        while index < stop:
+            tier, i = self.locate(index)
+            charset, length = self.tiers[tier]
+            base = len(charset)
+            tier_stop = min(stop, self.offsets[tier] + base ** length)
+            # Unrank once, then step the digits like an odometer
+            digits = _digits(i, base, length)
+            for _ in range(tier_stop - index):
+                yield ''.join(charset[d] for d in digits)
+                pos = length - 1
+                while pos >= 0:
+                    digits[pos] += 1
+                    if digits[pos] < base:
+                        break
+                    digits[pos] = 0
+                    pos -= 1
+            index = tier_stop
+
+    def shards(self, n, start=0, stop=None):
+        """Split [start, stop) into n contiguous, disjoint ranges."""
+        stop = self.size if stop is None else min(stop, self.size)
+        width = stop - start
+        bounds = [start + width * k // n for k in range(n + 1)]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _digits(i, base, length):
+    digits = [0] * length
+    for pos in range(length - 1, -1, -1):
+        i, digits[pos] = divmod(i, base)
+    return digits
+
+
+class Checkpoint:
+    """Progress of one [start, stop) job, kept in a small JSON state file.
+
+    `next` is the lowest index not yet checked: everything in [start, next)
+    has been checked, nothing at or after it has been counted as done.
+    """
+
+    def __init__(self, path, keyspace, start, stop):
+        self.path = path
+        self.keyspace = keyspace
+        self.start = start
+        self.stop = stop
+        self.next = start
+        self.found = None
+
+    @classmethod
+    def load(cls, path, keyspace, start, stop):
+        """Resume from `path` if it holds this job, otherwise start fresh."""
+        checkpoint = cls(path, keyspace, start, stop)
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if (state.get('keyspace') != keyspace.fingerprint()
+                    or state.get('start') != start or state.get('stop') != stop):
+                raise ValueError("State file %s belongs to a different job" % path)
+            if type(state.get('next')) is not int or not start <= state['next'] <= stop:
+                raise ValueError("State file %s resumes at %r, outside [%d, %d]"
+                                 % (path, state.get('next'), start, stop))
+            found = state.get('found')
+            if found is not None and (type(found) is not int or not start <= found < stop):
+                raise ValueError("State file %s records a match at %r, outside [%d, %d)"
+                                 % (path, found, start, stop))
+            checkpoint.next = state['next']
+            checkpoint.found = found
+        return checkpoint
+
+    @property
+    def done(self):
+        return self.found is not None or self.next >= self.stop
+
+    def save(self):
+        if not self.path:
+            return
+        state = {
+            'keyspace': self.keyspace.fingerprint(),
+            'start': self.start,
+            'stop': self.stop,
+            'next': self.next,
+            'found': self.found,
+        }
+        write_state(self.path, state)
+
+
+def write_state(path, state):
+    """Atomically replace the JSON file at `path` with `state`."""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    # Atomic on POSIX and Windows: readers see the old or the new state
+    os.replace(tmp, path)
@@ -0,0 +1,290 @@
+"""
+Rule-based candidate mutation with probability-ordered emission.
+
+Mutations use a subset of the hashcat rule language (case changes,
+leetspeak substitutions, appended digits and years, ...). Every rule has a
+prior, every dictionary word a Zipf weight from its rank, and candidates
+are emitted in descending word weight x rule prior. Two-word combinations
+and a character Markov model feed the same ordered stream, so the most
+likely guesses are always scrypt-checked first.
+"""
+
+import heapq
+import math
+from collections import defaultdict
+from time import perf_counter
+
+
+def _toggle(c):
+    return c.lower() if c.isupper() else c.upper()
+
+
+def parse_rule(rule):
+    """Compile a hashcat-style rule string into a list of bytes -> bytes ops.
+
+    Supported: : l u c C t r d [ ] $X ^X sXY TN
+    """
+    ops = []
+    i = 0
+    while i < len(rule):
+        op = rule[i]
+        if op in ' :':
+            i += 1
+            continue
+        if op == 'l':
+            ops.append(lambda w: w.lower())
+        elif op == 'u':
+            ops.append(lambda w: w.upper())
+        elif op == 'c':
+            ops.append(lambda w: w[:1].upper() + w[1:].lower())
+        elif op == 'C':
+            ops.append(lambda w: w[:1].lower() + w[1:].upper())
+        elif op == 't':
+            ops.append(lambda w: w.swapcase())
+        elif op == 'r':
+            ops.append(lambda w: w[::-1])
+        elif op == 'd':
+            ops.append(lambda w: w + w)
+        elif op == '[':
+            ops.append(lambda w: w[1:])
+        elif op == ']':
+            ops.append(lambda w: w[:-1])
+        elif op in '$^':
+            arg = rule[i + 1].encode()
+            ops.append((lambda a: lambda w: w + a)(arg) if op == '$' else (lambda a: lambda w: a + w)(arg))
+            i += 1
+        elif op == 's':
+            table = bytes.maketrans(rule[i + 1].encode(), rule[i + 2].encode())
+            ops.append((lambda t: lambda w: w.translate(t))(table))
+            i += 2
+        elif op == 'T':
+            n = int(rule[i + 1], 36)
+            ops.append((lambda n: lambda w: w[:n] + _toggle(w[n:n + 1]) + w[n + 1:])(n))
+            i += 1
+        else:
+            raise ValueError("Unsupported rule operation %r in %r" % (op, rule))
+        i += 1
+    return ops
+
+
+class Rule:
+    def __init__(self, text, prior):
+        self.text = text
+        self.prior = prior
+        self._ops = parse_rule(text)
+
+    def apply(self, word):
+        for op in self._ops:
+            word = op(word)
+        return word
+
+
+def default_rules():
+    """Common mutation rules with priors roughly following leaked-password studies.
+
+    The priors only set the order in which rules are tried; `fit_priors`
+    replaces them with hit rates measured on known passwords.
+    """
+    leet = 'sa@ se3 si1 so0 ss$'
+    rules = [
+        ('c', 0.08), ('l', 0.05), ('u', 0.02), ('t', 0.005), ('r', 0.003),
+        ('d', 0.003), (leet, 0.01), ('c ' + leet, 0.006),
+        ('$!', 0.01), ('c $!', 0.01), ('c $1 $!', 0.004),
+    ]
+    # Single appended digit, '1' by far the most common
+    for d in '0123456789':
+        weight = 0.05 if d == '1' else 0.006
+        rules += [('$' + d, weight), ('c $' + d, weight / 2)]
+    for d in range(100):
+        s = '%02d' % d
+        rules += [('$%s $%s' % tuple(s), 0.0008), ('c $%s $%s' % tuple(s), 0.0004)]
+    for s in ('123', '007', '321', '666', '777', '999'):
+        rules.append((' '.join('$' + c for c in s), 0.002))
+    # Years, recent ones more likely
+    for year in range(1950, 2031):
+        weight = 0.003 if year >= 1970 else 0.0005
+        y = ' '.join('$' + c for c in str(year))
+        rules += [(y, weight), ('c ' + y, weight / 2)]
+    rules = [Rule(text, prior) for text, prior in rules]
+    rules.sort(key=lambda r: -r.prior)
+    return rules
+
+
+def zipf_weights(n, s=1.0):
+    """Weight of the word at each rank of a frequency-sorted list."""
+    norm = sum(1.0 / (k + 1) ** s for k in range(n)) or 1.0
+    return [1.0 / (k + 1) ** s / norm for k in range(n)]
+
+
+def _descending_products(a, b):
+    """Yield (i, j) with a[i] * b[j] in descending order; a and b sorted descending."""
+    if not a or not b:
+        return
+    heap = [(-a[0] * b[0], 0, 0)]
+    seen = {(0, 0)}
+    while heap:
+        score, i, j = heapq.heappop(heap)
+        yield -score, i, j
+        for ni, nj in ((i + 1, j), (i, j + 1)):
+            if ni < len(a) and nj < len(b) and (ni, nj) not in seen:
+                seen.add((ni, nj))
+                heapq.heappush(heap, (-a[ni] * b[nj], ni, nj))
+
+
+def mutations(words, rules, weights=None):
+    """Yield (score, candidate, rule text) over words x rules, best first."""
+    weights = weights or zipf_weights(len(words))
+    priors = [r.prior for r in rules]
+    for score, i, j in _descending_products(weights, priors):
+        yield score, rules[j].apply(words[i]), rules[j].text
+
+
+def combinations(words, prior=0.02, weights=None, transform=None, name='combine'):
+    """Yield (score, word1 + word2, rule) for two dictionary words, best first."""
+    weights = weights or zipf_weights(len(words))
+    for score, i, j in _descending_products(weights, weights):
+        if i == j:
+            continue
+        w1, w2 = words[i], words[j]
+        if transform is not None:
+            w1, w2 = transform(w1), transform(w2)
+        yield score * prior, w1 + w2, name
+
+
+class MarkovModel:
+    """First-order character model with start/end states, trained on a wordlist."""
+
+    START = -1
+    END = 256
+
+    def __init__(self, smoothing=0.01):
+        self.smoothing = smoothing
+        self.counts = defaultdict(lambda: defaultdict(int))
+        self.alphabet = set()
+
+    def train(self, words):
+        for word in words:
+            prev = self.START
+            for c in word:
+                self.counts[prev][c] += 1
+                self.alphabet.add(c)
+                prev = c
+            self.counts[prev][self.END] += 1
+        self._build()
+        return self
+
+    def _build(self):
+        symbols = sorted(self.alphabet) + [self.END]
+        self.log_probs = {}
+        for prev in [self.START] + sorted(self.alphabet):
+            row = self.counts[prev]
+            total = sum(row.values()) + self.smoothing * len(symbols)
+            probs = [(math.log((row.get(c, 0) + self.smoothing) / total), c) for c in symbols]
+            probs.sort(reverse=True)
+            self.log_probs[prev] = probs
+        self._table = {prev: {c: lp for lp, c in row} for prev, row in self.log_probs.items()}
+
+    def log_prob(self, word):
+        prev, total = self.START, 0.0
+        for c in list(word) + [self.END]:
+            total += self._table.get(prev, {}).get(c, -math.inf)
+            prev = c
+        return total
+
+    def generate(self, min_len=1, max_len=8, limit=None, prior=0.05):
+        """Yield (score, candidate, 'markov') in exactly descending probability.
+
+        Best-first search over prefixes: a prefix's probability bounds every
+        completion of it, so complete words pop off the heap in order.
+        """
+        heap = [(0.0, False, b'')]
+        emitted = 0
+        while heap and (limit is None or emitted < limit):
+            neg_lp, complete, prefix = heapq.heappop(heap)
+            if complete:
+                emitted += 1
+                yield prior * math.exp(-neg_lp), prefix, 'markov'
+                continue
+            prev = prefix[-1] if prefix else self.START
+            for lp, c in self.log_probs.get(prev, ()):
+                if c == self.END:
+                    if len(prefix) >= min_len:
+                        heapq.heappush(heap, (neg_lp - lp, True, prefix))
+                elif len(prefix) < max_len:
+                    heapq.heappush(heap, (neg_lp - lp, False, prefix + bytes([c])))
+
+
+def ranked_candidates(words, rules=None, markov=None, seen=None, limit=None,
+                      combine_top=2000, markov_len=(4, 10)):
+    """Merge mutations, combinations and Markov output into one best-first stream.
+
+    Yields (candidate, rule text). Candidates already in the Bloom filter
+    `seen` (e.g. tried in the plain dictionary phase) are skipped.
+    """
+    rules = rules if rules is not None else default_rules()
+    weights = zipf_weights(len(words))
+    top = words[:combine_top]
+    top_weights = zipf_weights(len(top))
+    sources = [
+        mutations(words, rules, weights),
+        combinations(top, weights=top_weights),
+        combinations(top, prior=0.005, weights=top_weights,
+                     transform=bytes.capitalize, name='combine-c'),
+    ]
+    if markov is not None:
+        sources.append(markov.generate(*markov_len))
+    emitted = 0
+    for score, candidate, rule in heapq.merge(*sources, key=lambda t: -t[0]):
+        if seen is not None and not seen.add_if_new(candidate):
+            continue
+        yield candidate, rule
+        emitted += 1
+        if limit is not None and emitted >= limit:
+            return
+
+
+class RuleStats:
+    """Per-rule candidates, hits and throughput."""
+
+    def __init__(self):
+        self.tried = defaultdict(int)
+        self.hits = defaultdict(int)
+        self.seconds = defaultdict(float)
+
+    def add(self, rule, n, seconds, hits=0):
+        self.tried[rule] += n
+        self.seconds[rule] += seconds
+        self.hits[rule] += hits
+
+    def report(self, top=20):
+        print("\t%-24s %10s %6s %9s %14s" % ('rule', 'tried', 'hits', 'hit rate', 'candidates/s'))
+        ranked = sorted(self.tried, key=lambda r: (-self.hits[r], -self.tried[r]))
+        for rule in ranked[:top]:
+            tried, hits, secs = self.tried[rule], self.hits[rule], self.seconds[rule]
+            print("\t%-24s %10d %6d %8.4f%% %14.1f" % (
+                rule, tried, hits, 100.0 * hits / tried, tried / secs if secs else 0.0))
+
+
+def evaluate_rules(words, known_passwords, rules=None):
+    """Measure each rule's hit rate and generation speed against known plaintexts.
+
+    No KDF is involved: this is the offline loop used to tune priors on a
+    corpus of passwords we already know.
+    """
+    rules = rules if rules is not None else default_rules()
+    known = set(known_passwords)
+    stats = RuleStats()
+    for rule in rules:
+        start = perf_counter()
+        hits = sum(1 for w in words if rule.apply(w) in known)
+        stats.add(rule.text, len(words), perf_counter() - start, hits)
+    return stats
+
+
+def fit_priors(rules, stats, smoothing=1.0):
+    """Replace rule priors with smoothed hit rates from `evaluate_rules`."""
+    for rule in rules:
+        tried = stats.tried.get(rule.text, 0)
+        rule.prior = (stats.hits.get(rule.text, 0) + smoothing * rule.prior) / (tried + smoothing)
+    rules.sort(key=lambda r: -r.prior)
+    return rules
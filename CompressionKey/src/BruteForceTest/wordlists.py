@@ -0,0 +1,165 @@
+"""
+Streaming, memory-mapped wordlists for passphrase recovery.
+
+Dictionaries are mapped, not loaded: candidates are cut out of the mapping
+chunk by chunk, so multi-GB lists cost no more memory than one chunk. A
+line-offset index is built once and cached next to the list
+(`<path>.idx`), which lets a shard seek straight to line k.
+"""
+
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from bloom_filter import BloomFilter
+
+_INDEX_HEADER = struct.Struct('<QQ')  # file size, mtime_ns of the indexed list
+_SCAN_BLOCK = 64 * 1024 * 1024
+
+
+class Wordlist:
+    """One newline-separated wordlist, mapped read-only."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        # mmap refuses empty files
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        self._index = None
+
+    def close(self):
+        if self._map:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def index(self):
+        """uint64 array of line start offsets, plus a final entry at EOF."""
+        if self._index is None:
+            self._index = self._load_index()
+            if self._index is None:
+                self._index = self._build_index()
+                self._save_index(self._index)
+        return self._index
+
+    def __len__(self):
+        return len(self.index) - 1
+
+    def _index_path(self):
+        return self.path + '.idx'
+
+    def _stamp(self):
+        st = os.stat(self.path)
+        return st.st_size, st.st_mtime_ns
+
+    def _load_index(self):
+        idx_path = self._index_path()
+        if not os.path.exists(idx_path):
+            return None
+        with open(idx_path, 'rb') as f:
+            header = f.read(_INDEX_HEADER.size)
+        if len(header) != _INDEX_HEADER.size or _INDEX_HEADER.unpack(header) != self._stamp():
+            # Stale: the wordlist changed since the index was written
+            return None
+        return np.memmap(idx_path, dtype=np.uint64, mode='r', offset=_INDEX_HEADER.size)
+
+    def _build_index(self):
+        starts = [np.zeros(1, dtype=np.uint64)]
+        data = np.frombuffer(self._map, dtype=np.uint8) if self.size else np.zeros(0, np.uint8)
+        for block in range(0, self.size, _SCAN_BLOCK):
+            newlines = np.flatnonzero(data[block:block + _SCAN_BLOCK] == 10)
+            starts.append((newlines + block + 1).astype(np.uint64))
+        index = np.concatenate(starts)
+        if index[-1] != self.size:
+            # Last line has no trailing newline
+            index = np.append(index, np.uint64(self.size))
+        return index
+
+    def _save_index(self, index):
+        idx_path = self._index_path()
+        tmp = idx_path + '.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(_INDEX_HEADER.pack(*self._stamp()))
+                f.write(index.tobytes())
+            os.replace(tmp, idx_path)
+        except OSError:
+            # Read-only location: keep the index in memory only
+            pass
+
+    def line(self, k):
+        start, stop = int(self.index[k]), int(self.index[k + 1])
+        return self._map[start:stop].strip()
+
+    def chunks(self, start_line=0, stop_line=None, chunk_size=4096):
+        """Yield lists of up to `chunk_size` stripped, non-empty lines.
+
+        Starting anywhere but line 0 uses the index to seek; streaming from
+        the top without a stop line needs no index at all.
+        """
+        if stop_line is None and start_line == 0:
+            yield from self._scan_chunks(chunk_size)
+            return
+        index = self.index
+        stop_line = len(self) if stop_line is None else min(stop_line, len(self))
+        for first in range(start_line, stop_line, chunk_size):
+            last = min(first + chunk_size, stop_line)
+            block = self._map[int(index[first]):int(index[last])]
+            yield [w for w in (line.strip() for line in block.split(b'\n')) if w]
+
+    def _scan_chunks(self, chunk_size):
+        data = self._map
+        pos = 0
+        chunk = []
+        while pos < self.size:
+            end = data.find(b'\n', pos)
+            if end < 0:
+                end = self.size
+            word = data[pos:end].strip()
+            pos = end + 1
+            if word:
+                chunk.append(word)
+                if len(chunk) == chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+
+def count_lines(paths):
+    """Total lines in the existing wordlists, building their indexes as needed."""
+    total = 0
+    for path in paths:
+        if os.path.exists(path):
+            with Wordlist(path) as wl:
+                total += len(wl)
+    return total
+
+
+def unique_candidates(paths, lower=False, bloom=None, error_rate=1e-7, chunk_size=4096):
+    """Stream the words of several wordlists, skipping repeats across all of them.
+
+    Repeats are detected with a Bloom filter sized from the line indexes, so
+    a word is skipped wrongly only with probability about `error_rate`.
+    Pass the same `bloom` to later calls to deduplicate across phases.
+    """
+    paths = [p for p in paths if os.path.exists(p)]
+    if bloom is None:
+        bloom = BloomFilter(count_lines(paths), error_rate)
+    for path in paths:
+        with Wordlist(path) as wl:
+            for chunk in wl.chunks(chunk_size=chunk_size):
+                for word in chunk:
+                    if lower:
+                        word = word.lower()
+                    if bloom.add_if_new(word):
+                        yield word
@@ -0,0 +1,1408 @@
+"""
+Append-only, memory-mapped keystore for encrypted keys.
+
+Two files:
+
+    <path>        a 4 KiB header page, then fixed-size records in append order
+    <path>.index  open-addressing hash table: address -> record number
+
+A record is `key(21) | kind(1) | length(2) | prev(8) | blob(blob_size)`,
+where prev is 1 + the record this one superseded (0 if none). The key is
+the binary address: version byte + hash160 of a Base58Check address, or
+ETH_VERSION + the 20 bytes of a 0x address. Blobs are stored raw. A BIP38
+key is kept without its Base58 checksum, and a vault blob as the bytes
+behind its hex. Both get their text form back on read.
+
+Records are never rewritten, except that `rotate_key` re-seals them in
+place (see below). Storing an address again appends a new record and
+repoints the index, so the newest record wins. The index is derived
+data. It is marked dirty (and synced) before its first change after a
+flush, and rebuilt from the records on open if it is dirty, missing or
+behind.
+
+The key is already a hash, so index slots come straight from key bytes
+1..8 without hashing again. Each slot holds a 24-bit tag from the same
+word next to the record number. A probe touches a record only when the
+tag matches.
+
+Durability comes from a redo log, `<path>.wal`. `put` writes the record to
+the map, logs it, and returns once the log entry is on disk. Concurrent
+writers share fsyncs through group commit (see WriteAheadLog). A
+checkpoint (`flush`, bulk loads, or a log past `wal_limit`) syncs the map
+and the index, then empties the log. On open, the log is replayed on top
+of the last checkpoint. Records past the last intact entry were never
+acknowledged and are dropped.
+
+A store created with a passphrase is encrypted with envelope encryption.
+Every blob is sealed under a random data-encryption key (DEK) with
+AES-256-CTR + HMAC-SHA256, and the record's key and kind are
+authenticated data. The DEK is wrapped by
+a key derived from the passphrase (PBKDF2-HMAC-SHA256, 1M iterations by
+default). The wrapped DEK lives in the header page (see Envelope). So
+unlocking costs one KDF, and `change_passphrase` rewraps one header.
+`rotate_key` replaces the DEK itself by re-sealing every record in batches.
+It can be stopped and resumed. Each batch is first written whole to a redo
+log, `<path>.rotate`, and only then over the records. A crash that tears
+records in the map is repaired from that log on open. Both DEKs stay in
+the header until the last batch is durable.
+
+For audits the store keeps a Merkle Mountain Range over the records in
+`<path>.merkle` (see merkle.py). Leaf i is the hash of record i's bytes.
+Appends extend the tree, and rotation rehashes only the records it
+re-seals. `anchor` checkpoints and logs the root for publishing elsewhere
+(e.g. on chain). `prove` returns an O(log n) inclusion proof for an
+address, and `verify_proof` checks one against an anchored root in
+microseconds, without the store. A leaf commits to the sealed bytes, so
+re-sealing changes every leaf. Roots anchored before a rotation stop
+verifying new proofs. Anchor again once `rotate_key` returns True.
+"""
+
+import hashlib
+import hmac
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, perf_counter_ns
+
+import base58
+import numpy as np
+from Crypto.Cipher import AES
+from Crypto.Hash import SHA256
+from Crypto.Protocol.KDF import PBKDF2
+
+import merkle
+
+MAGIC = b'KST1'
+INDEX_MAGIC = b'KSI1'
+WAL_MAGIC = b'KSW1'
+ENVELOPE_MAGIC = b'KSE1'
+VERSION = 2
+HEADER_SIZE = 4096
+INDEX_HEADER_SIZE = 64
+KEY_SIZE = 21
+ETH_VERSION = 0xff
+KIND_RAW, KIND_BIP38, KIND_HEX = 0, 1, 2
+MIN_RECORDS = 1 << 14
+MIN_SLOTS = 1 << 16
+KDF_ITERATIONS = 1000000
+# Sealed blob: DEK generation (1) | nonce (12) | ciphertext | tag (16)
+SEAL_OVERHEAD = 29
+
+_HEADER = struct.Struct('<4sHHQ')          # magic, version, blob_size, count
+_INDEX_HEADER = struct.Struct('<4sBQQQQ')  # magic, dirty, slots, used, count, epoch
+_RECORD_HEAD = struct.Struct('<21sBHQ')    # key, kind, length, prev
+_PREV_OFFSET = 24
+# Seqlock-protected generation published to readers: seq, generation,
+# record count, index epoch
+_PUBLISHED = struct.Struct('<QQQQ')
+_PUBLISHED_OFFSET = 512
+_SLOT = struct.Struct('<Q')
+_WAL_HEADER = struct.Struct('<4sHQ')       # magic, record_size, base record count
+_WAL_ENTRY = struct.Struct('<IQ')          # crc32 of the rest, record number
+# magic, seq, iterations, salt, then (gen, nonce, wrapped DEK, tag) for the
+# current and the previous DEK, rotating flag, rotation next/stop
+_ENVELOPE = struct.Struct('<4sQI16sB12s32s16sB12s32s16sBQQ')
+_ENVELOPE_SLOTS = (1024, 2048)
+_COUNT_OFFSET = 8
+_REC_BITS = 40
+_REC_MASK = (1 << _REC_BITS) - 1
+
+
+def _checksum(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()[:4]
+
+
+def encode_address(address):
+    """Binary key for a Base58Check or 0x address (21-byte keys pass through)."""
+    if isinstance(address, (bytes, bytearray, memoryview)):
+        if len(address) != KEY_SIZE:
+            raise ValueError("Binary address keys are %d bytes" % KEY_SIZE)
+        return bytes(address)
+    if address[:2].lower() == '0x':
+        raw = bytes.fromhex(address[2:])
+        if len(raw) != 20:
+            raise ValueError("Invalid Ethereum address %r" % address)
+        return bytes([ETH_VERSION]) + raw
+    data = base58.b58decode(address)
+    if len(data) != KEY_SIZE + 4 or _checksum(data[:-4]) != data[-4:]:
+        raise ValueError("Invalid Base58Check address %r" % address)
+    return data[:-4]
+
+
+def decode_address(key):
+    key = bytes(key)
+    if key[0] == ETH_VERSION:
+        return '0x' + key[1:].hex()
+    return base58.b58encode(key + _checksum(key)).decode()
+
+
+def _bip38_payload(blob):
+    # Base58Check with the 0x0142 prefix: standard 6P... keys and the longer
+    # salted form written by main.Bip38.encrypt
+    try:
+        data = base58.b58decode(blob)
+    except ValueError:
+        return None
+    if len(data) > 6 and data[:2] == b'\x01\x42' and _checksum(data[:-4]) == data[-4:]:
+        return data[:-4]
+    return None
+
+
+def encode_blob(blob):
+    """(kind, raw bytes) for a BIP38 key, a hex vault blob or raw bytes."""
+    if isinstance(blob, (bytes, bytearray, memoryview)):
+        return KIND_RAW, bytes(blob)
+    payload = _bip38_payload(blob)
+    if payload is not None:
+        return KIND_BIP38, payload
+    if blob.startswith('6P'):
+        raise ValueError("Invalid BIP38 checksum")
+    try:
+        return KIND_HEX, bytes.fromhex(blob)
+    except ValueError:
+        raise ValueError("Blob is neither BIP38 nor hex") from None
+
+
+def decode_blob(kind, data):
+    data = bytes(data)
+    if kind == KIND_BIP38:
+        return base58.b58encode(data + _checksum(data)).decode()
+    if kind == KIND_HEX:
+        return data.hex()
+    return data
+
+
+def _slot_words(keys):
+    """Index hash words for a (n, 21) uint8 key array."""
+    return np.ascontiguousarray(keys[:, 1:9]).view('<u8').ravel()
+
+
+def _last_unique(keys):
+    """Positions of the last occurrence of every distinct row of `keys`."""
+    rows = np.ascontiguousarray(keys).view('V%d' % KEY_SIZE).ravel()
+    _, first_in_reversed = np.unique(rows[::-1], return_index=True)
+    return np.sort(len(rows) - 1 - first_in_reversed)
+
+
+def _probe(imm, slots, key, record_key):
+    """(slot, record number or None) for a binary key; record_key(rec) reads a record's key."""
+    h = int.from_bytes(key[1:9], 'little')
+    tag = h >> _REC_BITS
+    mask = slots - 1
+    slot = h & mask
+    while True:
+        entry = _SLOT.unpack_from(imm, INDEX_HEADER_SIZE + 8 * slot)[0]
+        if not entry:
+            return slot, None
+        if entry >> _REC_BITS == tag:
+            rec = (entry & _REC_MASK) - 1
+            if record_key(rec) == key:
+                return slot, rec
+        slot = (slot + 1) & mask
+
+
+def _index_insert(table, records, keys, recs):
+    """Vectorized linear-probing insert of distinct keys; returns new slots used.
+
+    Every round, pending keys look at their current slot. A key that is
+    already there gets its record repointed, after the new record's prev
+    is set to the old one. Empty slots go to their first claimant.
+    Everything else moves one slot on and tries again.
+    """
+    mask = np.uint64(len(table) - 1)
+    h = _slot_words(keys)
+    entries = ((h >> np.uint64(_REC_BITS)) << np.uint64(_REC_BITS)) | (recs.astype(np.uint64) + np.uint64(1))
+    slot = h & mask
+    pending = np.arange(len(keys))
+    used = 0
+    while pending.size:
+        s = slot[pending]
+        cur = table[s]
+        empty = cur == 0
+        done = np.zeros(len(pending), dtype=bool)
+
+        occupied = np.nonzero(~empty)[0]
+        tagged = occupied[(cur[occupied] >> np.uint64(_REC_BITS)) == (entries[pending[occupied]] >> np.uint64(_REC_BITS))]
+        if tagged.size:
+            rec = (cur[tagged] & np.uint64(_REC_MASK)).astype(np.int64) - 1
+            match = (records[rec, :KEY_SIZE] == keys[pending[tagged]]).all(axis=1)
+            same = tagged[match]
+            prev = (rec[match] + 1).astype('<u8').view(np.uint8).reshape(-1, 8)
+            records[recs[pending[same]], _PREV_OFFSET:_PREV_OFFSET + 8] = prev
+            table[s[same]] = entries[pending[same]]
+            done[same] = True
+
+        free = np.nonzero(empty)[0]
+        if free.size:
+            _, first = np.unique(s[free], return_index=True)
+            winners = free[first]
+            table[s[winners]] = entries[pending[winners]]
+            done[winners] = True
+            used += winners.size
+
+        # Losers of a claim retry the same (now taken) slot and move on next round
+        step = pending[~done & ~empty]
+        slot[step] = (slot[step] + np.uint64(1)) & mask
+        pending = pending[~done]
+    return used
+
+
+_datasync = getattr(os, 'fdatasync', os.fsync)
+
+
+class WriteAheadLog:
+    """Redo log of appended records with group commit.
+
+    Writers `append` an entry, then block in `wait` until it is on disk. A
+    flusher thread writes everything appended within `commit_window`
+    seconds of the first pending entry (or as soon as `max_batch` entries
+    are pending) with one write and one fdatasync. A window of 0 still
+    batches whatever arrives while the previous sync runs.
+    """
+
+    def __init__(self, path, record_size, base, commit_window=0.0, max_batch=4096, on_durable=None):
+        self.path = path
+        self.on_durable = on_durable
+        self.record_size = record_size
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+        self.commits = 0
+        self.size = 0
+        self._file = open(path, 'wb')
+        self._cond = threading.Condition()
+        self._pending = []
+        self._appended = self._durable = 0
+        self._last_rec = None
+        self._force = self._closed = False
+        self._error = None
+        self.reset(base)
+        self._thread = threading.Thread(target=self._flusher, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def replay(path, record_size):
+        """(base, [(record number, record bytes)]) up to the first torn entry."""
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < _WAL_HEADER.size:
+            return None, []
+        magic, size, base = _WAL_HEADER.unpack_from(data, 0)
+        if magic != WAL_MAGIC or size != record_size:
+            raise ValueError("%s is not a log for this keystore" % path)
+        entries = []
+        step = _WAL_ENTRY.size + record_size
+        offset = _WAL_HEADER.size
+        while offset + step <= len(data):
+            crc, rec = _WAL_ENTRY.unpack_from(data, offset)
+            if crc != zlib.crc32(data[offset + 4:offset + step]) or rec != base + len(entries):
+                break
+            entries.append((rec, data[offset + _WAL_ENTRY.size:offset + step]))
+            offset += step
+        return base, entries
+
+    @staticmethod
+    def _entry(rec, record):
+        body = struct.pack('<Q', rec) + record
+        return struct.pack('<I', zlib.crc32(body)) + body
+
+    @staticmethod
+    def write(path, record_size, base, records):
+        """Write a complete, synced log of consecutive `records` starting at record `base`."""
+        with open(path, 'wb') as f:
+            f.write(_WAL_HEADER.pack(WAL_MAGIC, record_size, base))
+            f.write(b''.join(WriteAheadLog._entry(base + i, records[i * record_size:(i + 1) * record_size])
+                             for i in range(len(records) // record_size)))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, rec, record):
+        """Queue one record; returns the sequence number to `wait` on."""
+        entry = self._entry(rec, record)
+        with self._cond:
+            self._pending.append(entry)
+            self._last_rec = rec
+            self._appended += 1
+            self.size += len(entry)
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify_all()
+            return self._appended
+
+    def wait(self, seq):
+        with self._cond:
+            while self._durable < seq:
+                if self._error is not None:
+                    raise self._error
+                self._cond.wait()
+
+    def sync(self):
+        """Write everything appended so far now, skipping the commit window."""
+        with self._cond:
+            seq = self._appended
+            self._force = True
+            self._cond.notify_all()
+        self.wait(seq)
+
+    def reset(self, base):
+        """Empty the log after a checkpoint covering records below `base`."""
+        with self._cond:
+            self._file.seek(0)
+            self._file.truncate()
+            self._file.write(_WAL_HEADER.pack(WAL_MAGIC, self.record_size, base))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.size = 0
+
+    def _flusher(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                deadline = perf_counter() + self.commit_window
+                while len(self._pending) < self.max_batch and not (self._force or self._closed):
+                    remaining = deadline - perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, []
+                seq, last_rec = self._appended, self._last_rec
+                self._force = False
+            try:
+                self._file.write(b''.join(batch))
+                self._file.flush()
+                _datasync(self._file.fileno())
+            except OSError as e:
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            if self.on_durable is not None:
+                self.on_durable(last_rec + 1)
+            with self._cond:
+                self._durable = seq
+                self.commits += 1
+                self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._file.close()
+
+
+def _kek(passphrase, salt, iterations):
+    return PBKDF2(passphrase, salt, dkLen=32, count=iterations, hmac_hash_module=SHA256)
+
+
+def _wrap(kek, gen, dek):
+    nonce = os.urandom(12)
+    cipher = AES.new(kek, AES.MODE_GCM, nonce=nonce)
+    cipher.update(ENVELOPE_MAGIC + bytes([gen]))
+    return (nonce,) + cipher.encrypt_and_digest(dek)
+
+
+def _unwrap(kek, gen, nonce, wrapped, tag):
+    cipher = AES.new(kek, AES.MODE_GCM, nonce=nonce)
+    cipher.update(ENVELOPE_MAGIC + bytes([gen]))
+    try:
+        return cipher.decrypt_and_verify(wrapped, tag)
+    except ValueError:
+        raise ValueError("Wrong keystore passphrase") from None
+
+
+class Envelope:
+    """Passphrase-wrapped data-encryption keys of an encrypted store.
+
+    Stored in two alternating header slots with a sequence number and a
+    CRC; the valid slot with the highest sequence wins, so a torn header
+    write falls back to the previous state. While a rotation is running
+    the previous DEK is kept too, and records say which one sealed them.
+    """
+
+    def __init__(self, iterations, salt, kek, deks, gen, old_gen=None, rotate_next=0, rotate_stop=0, seq=0):
+        self.iterations = iterations
+        self.salt = salt
+        self._kek = kek
+        self.deks = deks
+        self.gen = gen
+        self.old_gen = old_gen
+        self.rotate_next = rotate_next
+        self.rotate_stop = rotate_stop
+        self.seq = seq
+        self._ciphers = {}
+
+    @classmethod
+    def create(cls, passphrase, iterations=KDF_ITERATIONS):
+        salt = os.urandom(16)
+        return cls(iterations, salt, _kek(passphrase, salt, iterations), {1: os.urandom(32)}, 1)
+
+    @staticmethod
+    def _slots(mm):
+        for offset in _ENVELOPE_SLOTS:
+            raw = mm[offset:offset + _ENVELOPE.size + 4]
+            fields = _ENVELOPE.unpack_from(raw, 0)
+            if fields[0] == ENVELOPE_MAGIC and zlib.crc32(raw[:-4]) == struct.unpack_from('<I', raw, _ENVELOPE.size)[0]:
+                yield fields
+
+    @classmethod
+    def present(cls, mm):
+        return any(True for _ in cls._slots(mm))
+
+    @classmethod
+    def load(cls, mm, passphrase):
+        """Unlock the newest valid slot; one KDF."""
+        (_, seq, iterations, salt, gen, nonce, wrapped, tag, old_gen, old_nonce, old_wrapped,
+         old_tag, rotating, rotate_next, rotate_stop) = max(cls._slots(mm), key=lambda f: f[1])
+        kek = _kek(passphrase, salt, iterations)
+        deks = {gen: _unwrap(kek, gen, nonce, wrapped, tag)}
+        if rotating:
+            deks[old_gen] = _unwrap(kek, old_gen, old_nonce, old_wrapped, old_tag)
+        return cls(iterations, salt, kek, deks, gen, old_gen if rotating else None, rotate_next, rotate_stop, seq)
+
+    def store(self, mm):
+        """Write the next slot and sync the header page."""
+        self.seq += 1
+        current = _wrap(self._kek, self.gen, self.deks[self.gen])
+        if self.old_gen is not None:
+            old = _wrap(self._kek, self.old_gen, self.deks[self.old_gen])
+        else:
+            old = (bytes(12), bytes(32), bytes(16))
+        raw = _ENVELOPE.pack(ENVELOPE_MAGIC, self.seq, self.iterations, self.salt, self.gen, *current,
+                             self.old_gen or 0, *old, self.old_gen is not None, self.rotate_next, self.rotate_stop)
+        raw += struct.pack('<I', zlib.crc32(raw))
+        offset = _ENVELOPE_SLOTS[self.seq % 2]
+        mm[offset:offset + len(raw)] = raw
+        mm.flush(0, mmap.PAGESIZE)
+
+    def rewrap(self, passphrase, iterations=None):
+        self.iterations = iterations or self.iterations
+        self.salt = os.urandom(16)
+        self._kek = _kek(passphrase, self.salt, self.iterations)
+
+    def _cipher(self, gen):
+        # Per-DEK AES-256-CTR and HMAC-SHA256 keys; setting up an AES-GCM
+        # object per record costs ~80us in PyCryptodome, this ~4us
+        cipher = self._ciphers.get(gen)
+        if cipher is None:
+            dek = self.deks.get(gen)
+            if dek is None:
+                raise ValueError("Record sealed with an unknown key generation %d" % gen)
+            cipher = self._ciphers[gen] = (AES.new(hmac.digest(dek, b'enc', 'sha256'), AES.MODE_ECB),
+                                           hmac.digest(dek, b'mac', 'sha256'))
+        return cipher
+
+    @staticmethod
+    def _xor_stream(ecb, nonce, data):
+        blocks = b''.join(nonce + i.to_bytes(4, 'big') for i in range(1, (len(data) + 15) // 16 + 1))
+        stream = ecb.encrypt(blocks)[:len(data)]
+        return (int.from_bytes(data, 'big') ^ int.from_bytes(stream, 'big')).to_bytes(len(data), 'big')
+
+    def seal(self, aad, data):
+        """Encrypt-then-MAC `data`; `aad` must have a fixed length per store."""
+        ecb, mac_key = self._cipher(self.gen)
+        head = bytes([self.gen]) + os.urandom(12)
+        body = head + self._xor_stream(ecb, head[1:], data)
+        return body + hmac.digest(mac_key, body + aad, 'sha256')[:16]
+
+    def open(self, aad, sealed):
+        sealed = bytes(sealed)
+        ecb, mac_key = self._cipher(sealed[0])
+        body = sealed[:-16]
+        if not hmac.compare_digest(hmac.digest(mac_key, body + aad, 'sha256')[:16], sealed[-16:]):
+            raise ValueError("Record failed authentication")
+        return self._xor_stream(ecb, body[1:13], body[13:])
+
+
+class KeyStorage:
+    """Address -> encrypted blob store over one record file and one index file.
+
+    One writer per store. Its own `get` sees every record as soon as it is
+    written; other threads and processes read through `reader()` /
+    KeyStoreReader, which only see published (durable) generations.
+    """
+
+    def __init__(self, path, blob_size=96, wal=True, commit_window=0.0,
+                 max_batch=4096, wal_limit=64 << 20, passphrase=None, kdf_iterations=KDF_ITERATIONS,
+                 merkle_tree=True):
+        self.path = path
+        self.index_path = path + '.index'
+        self.wal_path = path + '.wal'
+        self.rotate_path = path + '.rotate'
+        self.wal_limit = wal_limit
+        self._lock = threading.RLock()
+        self._publish_lock = threading.Lock()
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, 'wb') as f:
+                f.write(_HEADER.pack(MAGIC, VERSION, blob_size, 0).ljust(HEADER_SIZE, b'\0'))
+                f.truncate(HEADER_SIZE + MIN_RECORDS * (_RECORD_HEAD.size + blob_size))
+        self._file = open(path, 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        magic, version, self.blob_size, self._count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a keystore file" % path)
+        self.record_size = _RECORD_HEAD.size + self.blob_size
+        self._capacity = (len(self._mm) - HEADER_SIZE) // self.record_size
+        self._envelope = None
+        if Envelope.present(self._mm):
+            if passphrase is None:
+                raise ValueError("%s is encrypted; a passphrase is required" % path)
+            self._envelope = Envelope.load(self._mm, passphrase)
+        elif passphrase is not None:
+            if self._count:
+                raise ValueError("%s already holds unencrypted records" % path)
+            self._envelope = Envelope.create(passphrase, kdf_iterations)
+            self._envelope.store(self._mm)
+        self._index_file = self._imm = None
+        _, self._generation, self._published, self._published_epoch = _PUBLISHED.unpack_from(self._mm, _PUBLISHED_OFFSET)
+        self._epoch = self._published_epoch
+        resealed = self._replay_rotation()
+        replayed = self._replay() if wal else False
+        self._open_index()
+        self._merkle = None
+        if merkle_tree:
+            self._merkle = merkle.MerkleLog(path + '.merkle')
+            self._sync_merkle()
+            if resealed:
+                self._merkle.update({rec: self._leaf(rec) for rec in resealed if rec < self._merkle.size})
+        self._wal = None
+        if wal:
+            if replayed:
+                self._checkpoint()
+            self._wal = WriteAheadLog(self.wal_path, self.record_size, self._count, commit_window,
+                                      max_batch, on_durable=self._publish)
+        self._publish(self._count, force=True)
+
+    def _replay(self):
+        """Reapply logged records on top of the last checkpoint; True if anything changed."""
+        if not os.path.exists(self.wal_path):
+            return False
+        base, entries = WriteAheadLog.replay(self.wal_path, self.record_size)
+        if base is None:
+            return False
+        header_count = self._count
+        for rec, record in entries:
+            self._count = rec
+            self._reserve(1)
+            offset = HEADER_SIZE + rec * self.record_size
+            self._mm[offset:offset + self.record_size] = record
+        self._set_count(base + len(entries))
+        return bool(entries) or header_count != self._count
+
+    def _replay_rotation(self):
+        """Redo the rewrite of a rotation batch cut short by a crash; returns its record numbers."""
+        if not os.path.exists(self.rotate_path):
+            return []
+        _, entries = WriteAheadLog.replay(self.rotate_path, self.record_size)
+        for rec, record in entries:
+            offset = HEADER_SIZE + rec * self.record_size
+            self._mm[offset:offset + self.record_size] = record
+        if entries:
+            self._mm.flush()
+        os.remove(self.rotate_path)
+        return [rec for rec, _ in entries]
+
+    def _sync_merkle(self):
+        """Bring the tree to the record count after a crash or a replay."""
+        tree = self._merkle
+        if tree.dirty:
+            tree.reset()
+        if tree.size > self._count:
+            tree.truncate(self._count)
+        for start in range(tree.size, self._count, 1 << 16):
+            stop = min(self._count, start + (1 << 16))
+            tree.append(self._leaf(rec) for rec in range(start, stop))
+
+    def _leaf(self, rec):
+        offset = HEADER_SIZE + rec * self.record_size
+        length = struct.unpack_from('<H', self._mm, offset + KEY_SIZE + 1)[0]
+        return merkle.leaf_hash(self._mm[offset:offset + _RECORD_HEAD.size + length])
+
+    # -- index ----------------------------------------------------------
+
+    def _open_index(self):
+        if os.path.exists(self.index_path):
+            self._map_index()
+            magic, dirty, slots, used, count, epoch = _INDEX_HEADER.unpack_from(self._imm, 0)
+            if magic == INDEX_MAGIC and not dirty and count == self._count and epoch >= self._published_epoch:
+                return
+        self._rebuild_index()
+
+    def _map_index(self):
+        if self._imm is not None:
+            self._imm.close()
+            self._index_file.close()
+        self._index_file = open(self.index_path, 'r+b')
+        self._imm = mmap.mmap(self._index_file.fileno(), 0)
+        _, self._dirty, self._slots, self._used, _, self._epoch = _INDEX_HEADER.unpack_from(self._imm, 0)
+
+    def _rebuild_index(self, min_used=0):
+        """Write a fresh index for all records, sized for at least `min_used` keys."""
+        records = self._records_view()
+        try:
+            keys = records[:self._count, :KEY_SIZE]
+            latest = _last_unique(keys) if self._count else np.zeros(0, dtype=np.int64)
+            needed = max(len(latest), min_used)
+            slots = max(MIN_SLOTS, 1 << (2 * needed - 1).bit_length())
+            table = np.zeros(slots, dtype='<u8')
+            used = _index_insert(table, records, keys[latest], latest)
+        finally:
+            del records
+        tmp = self.index_path + '.tmp'
+        epoch = max(self._epoch, self._published_epoch) + 1
+        with open(tmp, 'wb') as f:
+            f.write(_INDEX_HEADER.pack(INDEX_MAGIC, 0, slots, used, self._count, epoch).ljust(INDEX_HEADER_SIZE, b'\0'))
+            f.write(table.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        # Readers still on the old file keep a frozen, valid map of it and
+        # switch once they see the new epoch published
+        os.replace(tmp, self.index_path)
+        self._map_index()
+        self._publish()
+
+    def _mark_dirty(self):
+        # The flag must reach disk before any slot does, so a crash between
+        # flushes is always detected on open
+        if not self._dirty:
+            self._dirty = 1
+            self._imm[4] = 1
+            self._imm.flush(0, mmap.PAGESIZE)
+
+    def _find(self, key):
+        """(slot, record number or None) for a binary key."""
+        return _probe(self._imm, self._slots, key, self._record_key)
+
+    def _record_key(self, rec):
+        offset = HEADER_SIZE + rec * self.record_size
+        return self._mm[offset:offset + KEY_SIZE]
+
+    def _publish(self, count=None, force=False):
+        """Publish a new generation: `count` records (if more) and the index epoch.
+
+        Seqlock: the sequence is odd while the fields change, so readers
+        retry instead of taking a lock.
+        """
+        with self._publish_lock:
+            if not force:
+                count = self._published if count is None else max(count, self._published)
+                if count == self._published and self._epoch == self._published_epoch:
+                    return
+            seq = _SLOT.unpack_from(self._mm, _PUBLISHED_OFFSET)[0]
+            self._generation += 1
+            self._published, self._published_epoch = count, self._epoch
+            _SLOT.pack_into(self._mm, _PUBLISHED_OFFSET, seq + 1)
+            _PUBLISHED.pack_into(self._mm, _PUBLISHED_OFFSET, seq + 1, self._generation, count, self._epoch)
+            _SLOT.pack_into(self._mm, _PUBLISHED_OFFSET, seq + 2)
+
+    def _index_put(self, key, rec):
+        if 2 * (self._used + 1) > self._slots:
+            # Rebuilding reads every record, including the one just appended
+            self._rebuild_index(self._used + 1)
+            return
+        self._mark_dirty()
+        slot, old = self._find(key)
+        h = int.from_bytes(key[1:9], 'little')
+        _SLOT.pack_into(self._imm, INDEX_HEADER_SIZE + 8 * slot, (h >> _REC_BITS) << _REC_BITS | (rec + 1))
+        if old is None:
+            self._used += 1
+
+    # -- records --------------------------------------------------------
+
+    def _records_view(self):
+        # Callers must drop the view before the map is resized or closed
+        return np.frombuffer(self._mm, dtype=np.uint8, offset=HEADER_SIZE,
+                             count=self._capacity * self.record_size).reshape(self._capacity, self.record_size)
+
+    def _reserve(self, n):
+        if self._count + n <= self._capacity:
+            return
+        capacity = max(2 * self._capacity, self._count + n)
+        self._mm.resize(HEADER_SIZE + capacity * self.record_size)
+        self._capacity = capacity
+
+    def _set_count(self, count):
+        self._count = count
+        struct.pack_into('<Q', self._mm, _COUNT_OFFSET, count)
+
+    @property
+    def payload_size(self):
+        """Largest blob a record holds, after sealing overhead."""
+        return self.blob_size - (SEAL_OVERHEAD if self._envelope is not None else 0)
+
+    def _encode(self, key, blob):
+        kind, data = encode_blob(blob)
+        if len(data) > self.payload_size:
+            raise ValueError("Blob of %d bytes exceeds the record size (%d)" % (len(data), self.payload_size))
+        if self._envelope is not None:
+            data = self._envelope.seal(key + bytes([kind]), data)
+        return kind, data
+
+    def _decode(self, key, kind, data):
+        if self._envelope is not None:
+            data = self._envelope.open(key + bytes([kind]), data)
+        return decode_blob(kind, data)
+
+    def _read(self, rec):
+        offset = HEADER_SIZE + rec * self.record_size
+        key, kind, length, _ = _RECORD_HEAD.unpack_from(self._mm, offset)
+        start = offset + _RECORD_HEAD.size
+        return key, kind, self._mm[start:start + length]
+
+    def put(self, address, blob, wait=True):
+        """Store `blob` for `address`; returns the record number.
+
+        With the log enabled and `wait` set, returns only once the record
+        is durable. Readers in this process see it immediately either way.
+        """
+        key = encode_address(address)
+        kind, data = self._encode(key, blob)
+        with self._lock:
+            self._reserve(1)
+            rec = self._count
+            _, old = self._find(key)
+            record = _RECORD_HEAD.pack(key, kind, len(data), 0 if old is None else old + 1)
+            record += data.ljust(self.blob_size, b'\0')
+            offset = HEADER_SIZE + rec * self.record_size
+            self._mm[offset:offset + self.record_size] = record
+            self._set_count(rec + 1)
+            self._index_put(key, rec)
+            if self._merkle is not None:
+                self._merkle.append([merkle.leaf_hash(record[:_RECORD_HEAD.size + len(data)])])
+            if self._wal is None:
+                self._publish(rec + 1)
+                return rec
+            seq = self._wal.append(rec, record)
+            if self._wal.size > self.wal_limit:
+                self._checkpoint()
+        if wait:
+            self._wal.wait(seq)
+        return rec
+
+    def append_arrays(self, keys, kinds, lengths, blobs):
+        """Append pre-encoded records: keys (n, 21), blobs (n, <= payload_size) uint8.
+
+        Bulk appends skip the log and end with a checkpoint instead.
+        """
+        n = len(keys)
+        if not n:
+            return
+        if (np.asarray(lengths) > self.payload_size).any():
+            raise ValueError("Blobs exceed the record size (%d)" % self.payload_size)
+        if self._envelope is not None:
+            blobs, lengths = self._seal_arrays(keys, kinds, lengths, blobs)
+        elif blobs.shape[1] > self.blob_size:
+            blobs = blobs[:, :self.blob_size]
+        with self._lock:
+            self._append_arrays(keys, kinds, lengths, blobs)
+            if self._wal is not None:
+                self._checkpoint()
+            else:
+                self._publish(self._count)
+
+    def _seal_arrays(self, keys, kinds, lengths, blobs):
+        sealed = np.zeros((len(keys), self.blob_size), dtype=np.uint8)
+        for i in range(len(keys)):
+            data = self._envelope.seal(keys[i].tobytes() + bytes([kinds[i]]), blobs[i, :lengths[i]].tobytes())
+            sealed[i, :len(data)] = np.frombuffer(data, dtype=np.uint8)
+        return sealed, np.asarray(lengths, dtype=np.uint16) + SEAL_OVERHEAD
+
+    def _append_arrays(self, keys, kinds, lengths, blobs):
+        n = len(keys)
+        if 2 * (self._used + n) > self._slots:
+            # Grow the index over the existing records first, so the batch
+            # below gets linked to the records it supersedes
+            self._rebuild_index(self._used + n)
+        self._reserve(n)
+        first = self._count
+        records = self._records_view()
+        try:
+            rows = records[first:first + n]
+            rows[:, :KEY_SIZE] = keys
+            rows[:, KEY_SIZE] = kinds
+            rows[:, KEY_SIZE + 1:KEY_SIZE + 3] = np.asarray(lengths, dtype='<u2').reshape(-1, 1).view(np.uint8)
+            rows[:, _PREV_OFFSET:_PREV_OFFSET + 8] = 0
+            rows[:, _RECORD_HEAD.size:_RECORD_HEAD.size + blobs.shape[1]] = blobs
+            rows[:, _RECORD_HEAD.size + blobs.shape[1]:] = 0
+            self._mark_dirty()
+            table = np.frombuffer(self._imm, dtype='<u8', offset=INDEX_HEADER_SIZE)
+            latest = _last_unique(keys)
+            self._used += _index_insert(table, records, rows[latest, :KEY_SIZE], first + latest)
+            del table
+            if self._merkle is not None:
+                raw = rows.tobytes()
+                starts = range(0, n * self.record_size, self.record_size)
+                ends = (_RECORD_HEAD.size + np.asarray(lengths, dtype=np.int64)).tolist()
+                self._merkle.append(merkle.leaf_hash(raw[start:start + end]) for start, end in zip(starts, ends))
+            self._set_count(first + n)
+        finally:
+            del records
+
+    def bulk_load(self, items, chunk_size=1 << 16):
+        """Append (address, blob) pairs in chunks; returns the number stored."""
+        total = 0
+        keys = np.empty((chunk_size, KEY_SIZE), dtype=np.uint8)
+        blobs = np.zeros((chunk_size, self.blob_size), dtype=np.uint8)
+        kinds = np.empty(chunk_size, dtype=np.uint8)
+        lengths = np.empty(chunk_size, dtype=np.uint16)
+        n = 0
+        for address, blob in items:
+            kind, data = encode_blob(blob)
+            if len(data) > self.payload_size:
+                raise ValueError("Blob of %d bytes exceeds the record size (%d)" % (len(data), self.payload_size))
+            keys[n] = np.frombuffer(encode_address(address), dtype=np.uint8)
+            blobs[n, :len(data)] = np.frombuffer(data, dtype=np.uint8)
+            blobs[n, len(data):] = 0
+            kinds[n], lengths[n] = kind, len(data)
+            n += 1
+            if n == chunk_size:
+                self.append_arrays(keys, kinds, lengths, blobs)
+                total, n = total + n, 0
+        self.append_arrays(keys[:n], kinds[:n], lengths[:n], blobs[:n])
+        return total + n
+
+    def get(self, address, default=None):
+        _, rec = self._find(encode_address(address))
+        if rec is None:
+            return default
+        key, kind, data = self._read(rec)
+        return self._decode(key, kind, data)
+
+    def __contains__(self, address):
+        return self._find(encode_address(address))[1] is not None
+
+    def __len__(self):
+        return self._used
+
+    def items(self):
+        """Yield (address, blob) for the current record of every address."""
+        for rec in range(self._count):
+            key, kind, data = self._read(rec)
+            if self._find(key)[1] == rec:
+                yield decode_address(key), self._decode(key, kind, data)
+
+    @property
+    def record_count(self):
+        return self._count
+
+    @property
+    def encrypted(self):
+        return self._envelope is not None
+
+    @property
+    def rotating(self):
+        """True while a `rotate_key` run is unfinished."""
+        return self._envelope is not None and self._envelope.old_gen is not None
+
+    def change_passphrase(self, passphrase, kdf_iterations=None):
+        """Rewrap the data keys under a new passphrase: one KDF, one header write."""
+        if self._envelope is None:
+            raise ValueError("%s is not encrypted" % self.path)
+        with self._lock:
+            self._envelope.rewrap(passphrase, kdf_iterations)
+            self._envelope.store(self._mm)
+
+    def rotate_key(self, batch_size=1 << 14, workers=None, max_records=None):
+        """Re-seal every record under a fresh DEK; returns True once finished.
+
+        Records below the rotation's stop point are re-sealed in batches.
+        Each batch is synced before the progress in the header moves past
+        it, so an interrupted run (or one cut short by `max_records`)
+        resumes where it stopped on the next call, in this process or
+        after reopening. Records added meanwhile are sealed with the new
+        key already.
+
+        Every re-sealed record gets a new Merkle leaf. Proofs from then on
+        verify only against roots anchored after the rotation.
+        """
+        if self._envelope is None:
+            raise ValueError("%s is not encrypted" % self.path)
+        envelope = self._envelope
+        workers = workers or os.cpu_count() or 1
+        with self._lock:
+            if envelope.old_gen is None:
+                # The log may still hold records sealed with the old key
+                self._checkpoint()
+                envelope.old_gen = envelope.gen
+                envelope.gen = envelope.gen % 255 + 1
+                envelope.deks[envelope.gen] = os.urandom(32)
+                envelope.rotate_next, envelope.rotate_stop = 0, self._count
+                envelope.store(self._mm)
+        budget = max_records
+        with ThreadPoolExecutor(workers) as pool:
+            while envelope.rotate_next < envelope.rotate_stop:
+                if budget is not None and budget <= 0:
+                    return False
+                with self._lock:
+                    start = envelope.rotate_next
+                    stop = min(envelope.rotate_stop, start + (batch_size if budget is None else min(budget, batch_size)))
+                    bounds = [start + (stop - start) * k // workers for k in range(workers + 1)]
+                    parts = list(pool.map(self._reseal, zip(bounds[:-1], bounds[1:])))
+                    records = b''.join(records for records, _ in parts)
+                    # Log the batch before rewriting it in place: a crash that
+                    # tears records in the map is repaired from the log on open
+                    WriteAheadLog.write(self.rotate_path, self.record_size, start, records)
+                    offset = HEADER_SIZE + start * self.record_size
+                    self._mm[offset:offset + len(records)] = records
+                    self._mm.flush()
+                    if self._merkle is not None:
+                        self._merkle.update({rec: self._leaf(rec) for _, part in parts for rec in part})
+                    envelope.rotate_next = stop
+                    envelope.store(self._mm)
+                    os.remove(self.rotate_path)
+                if budget is not None:
+                    budget -= stop - start
+        with self._lock:
+            del envelope.deks[envelope.old_gen]
+            envelope._ciphers.pop(envelope.old_gen, None)
+            envelope.old_gen = None
+            envelope.rotate_next = envelope.rotate_stop = 0
+            envelope.store(self._mm)
+        return True
+
+    def _reseal(self, bounds):
+        """Bytes of records [start, stop) re-sealed under the new DEK, and which records changed."""
+        envelope = self._envelope
+        start, stop = bounds
+        out = bytearray(self._mm[HEADER_SIZE + start * self.record_size:HEADER_SIZE + stop * self.record_size])
+        resealed = []
+        for rec in range(start, stop):
+            key, kind, data = self._read(rec)
+            if data[0] == envelope.gen:
+                # Already done by a run that stopped before saving progress
+                continue
+            sealed = envelope.seal(key + bytes([kind]), envelope.open(key + bytes([kind]), data))
+            at = (rec - start) * self.record_size
+            struct.pack_into('<H', out, at + KEY_SIZE + 1, len(sealed))
+            out[at + _RECORD_HEAD.size:at + _RECORD_HEAD.size + len(sealed)] = sealed
+            resealed.append(rec)
+        return bytes(out), resealed
+
+    def flush(self):
+        """Checkpoint: everything stored so far is durable when this returns."""
+        with self._lock:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        # Log first (so nothing acknowledged is lost), then records, then
+        # the index, and only then drop the log
+        if self._wal is not None:
+            self._wal.sync()
+        self._mm.flush()
+        os.fsync(self._file.fileno())
+        if self._merkle is not None:
+            self._merkle.flush()
+        if self._dirty:
+            self._imm.flush()
+            self._dirty = 0
+            _INDEX_HEADER.pack_into(self._imm, 0, INDEX_MAGIC, 0, self._slots, self._used, self._count, self._epoch)
+            self._imm.flush(0, mmap.PAGESIZE)
+        if self._wal is not None:
+            self._wal.reset(self._count)
+        self._publish(self._count)
+
+    def close(self):
+        if self._mm is None:
+            return
+        self.flush()
+        if self._wal is not None:
+            self._wal.close()
+        if self._merkle is not None:
+            self._merkle.close()
+        self._imm.close()
+        self._index_file.close()
+        self._mm.close()
+        self._file.close()
+        self._mm = self._imm = None
+
+    def merkle_root(self):
+        """(record count, root) of the Merkle commitment over every record."""
+        if self._merkle is None:
+            raise ValueError("%s has no Merkle tree" % self.path)
+        with self._lock:
+            return self._merkle.size, self._merkle.root()
+
+    def anchor(self):
+        """Checkpoint and append the current root to `<path>.anchors`; returns the entry.
+
+        Publish the entry wherever auditors can see it. Any later proof
+        for a record below `size` verifies against this root, until the
+        next `rotate_key` re-seals the records.
+        """
+        with self._lock:
+            self._checkpoint()
+            size, root = self.merkle_root()
+            entry = {'time': int(time.time()), 'size': size, 'root': root.hex()}
+            with open(self.path + '.anchors', 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        return entry
+
+    def prove(self, address, size=None):
+        """Inclusion proof of the current record for `address` in the first `size` records.
+
+        `size` is that of an anchored root (all records by default). The
+        proof carries the record itself, still sealed if the store is
+        encrypted, so it can be checked with `verify_proof` alone.
+        """
+        if self._merkle is None:
+            raise ValueError("%s has no Merkle tree" % self.path)
+        key = encode_address(address)
+        with self._lock:
+            size = self._merkle.size if size is None else size
+            _, rec = self._find(key)
+            while rec is not None and rec >= size:
+                rec = self._prev(rec)
+            if rec is None:
+                raise KeyError(address)
+            offset = HEADER_SIZE + rec * self.record_size
+            length = struct.unpack_from('<H', self._mm, offset + KEY_SIZE + 1)[0]
+            siblings, peaks = self._merkle.proof(rec, size)
+            return {'address': address, 'index': rec, 'size': size,
+                    'record': self._mm[offset:offset + _RECORD_HEAD.size + length].hex(),
+                    'siblings': [h.hex() for h in siblings], 'peaks': [h.hex() for h in peaks]}
+
+    def _prev(self, rec):
+        prev = struct.unpack_from('<Q', self._mm, HEADER_SIZE + rec * self.record_size + _PREV_OFFSET)[0]
+        return prev - 1 if prev else None
+
+    def reader(self):
+        """A lock-free KeyStoreReader sharing this store's unlocked keys."""
+        return KeyStoreReader(self.path, envelope=self._envelope)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def verify_proof(proof, root):
+    """Check a `KeyStorage.prove` result against an anchored root (bytes or hex)."""
+    if isinstance(root, str):
+        root = bytes.fromhex(root)
+    record = bytes.fromhex(proof['record'])
+    if record[:KEY_SIZE] != encode_address(proof['address']):
+        return False
+    return merkle.verify(merkle.leaf_hash(record), proof['index'], proof['size'],
+                         [bytes.fromhex(h) for h in proof['siblings']],
+                         [bytes.fromhex(h) for h in proof['peaks']], root)
+
+
+class KeyStoreReader:
+    """Read-only, lock-free view of a keystore for any thread or process.
+
+    A lookup starts from the generation the writer last published (record
+    count and index epoch, read under the seqlock). The index may already
+    point at newer, unpublished records. Those are skipped through their
+    prev links, so a lookup answers exactly as of its generation. Use
+    `snapshot()` to run several lookups against one generation.
+    """
+
+    def __init__(self, path, passphrase=None, envelope=None):
+        self.path = path
+        self.index_path = path + '.index'
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.blob_size, _ = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a keystore file" % path)
+        self.record_size = _RECORD_HEAD.size + self.blob_size
+        self._passphrase = passphrase
+        self._envelope = envelope
+        if envelope is None and Envelope.present(self._mm):
+            if passphrase is None:
+                raise ValueError("%s is encrypted; a passphrase is required" % path)
+            self._envelope = Envelope.load(self._mm, passphrase)
+        self._index = None
+
+    def published(self):
+        """(generation, record count, index epoch) as last published by the writer."""
+        mm = self._mm
+        while True:
+            before = _SLOT.unpack_from(mm, _PUBLISHED_OFFSET)[0]
+            if before & 1:
+                continue
+            _, generation, count, epoch = _PUBLISHED.unpack_from(mm, _PUBLISHED_OFFSET)
+            if _SLOT.unpack_from(mm, _PUBLISHED_OFFSET)[0] == before:
+                return generation, count, epoch
+
+    def snapshot(self):
+        generation, count, epoch = self.published()
+        index = self._index
+        if index is None or index[2] < epoch:
+            # Old maps are never closed here: snapshots in other threads may
+            # still hold them, and they stay valid after the file is replaced
+            with open(self.index_path, 'rb') as f:
+                imm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            _, _, slots, _, _, index_epoch = _INDEX_HEADER.unpack_from(imm, 0)
+            index = self._index = (imm, slots, index_epoch)
+        return Snapshot(self, generation, count, index[0], index[1])
+
+    def get(self, address, default=None):
+        return self.snapshot().get(address, default)
+
+    def __contains__(self, address):
+        return self.snapshot().get(address) is not None
+
+    def _record(self, rec):
+        """Map covering record `rec`, remapping if the writer has grown the file."""
+        mm = self._mm
+        if HEADER_SIZE + (rec + 1) * self.record_size > len(mm):
+            mm = self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return mm
+
+    def _record_key(self, rec):
+        offset = HEADER_SIZE + rec * self.record_size
+        return self._record(rec)[offset:offset + KEY_SIZE]
+
+    def _prev(self, rec):
+        prev = _SLOT.unpack_from(self._record(rec), HEADER_SIZE + rec * self.record_size + _PREV_OFFSET)[0]
+        return prev - 1 if prev else None
+
+    def _decode(self, rec):
+        offset = HEADER_SIZE + rec * self.record_size
+        for attempt in range(4):
+            mm = self._record(rec)
+            key, kind, length, _ = _RECORD_HEAD.unpack_from(mm, offset)
+            data = mm[offset + _RECORD_HEAD.size:offset + _RECORD_HEAD.size + length]
+            if self._envelope is None:
+                return decode_blob(kind, data)
+            try:
+                return decode_blob(kind, self._envelope.open(key + bytes([kind]), data))
+            except ValueError:
+                # rotate_key may be re-sealing this very record, or it has
+                # moved to a key generation this reader has not unwrapped
+                if attempt == 2 and self._passphrase is not None:
+                    self._envelope = Envelope.load(mm, self._passphrase)
+                elif attempt == 3:
+                    raise
+
+    def close(self):
+        self._index = None
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Snapshot:
+    """Lookups against one published generation of a KeyStoreReader."""
+
+    def __init__(self, reader, generation, count, imm, slots):
+        self.reader = reader
+        self.generation = generation
+        self.count = count
+        self._imm = imm
+        self._slots = slots
+
+    def get(self, address, default=None):
+        key = encode_address(address)
+        reader = self.reader
+        _, rec = _probe(self._imm, self._slots, key, reader._record_key)
+        while rec is not None and rec >= self.count:
+            rec = reader._prev(rec)
+        if rec is None:
+            return default
+        return reader._decode(rec)
+
+
+def benchmark(path, n=10_000_000, lookups=100_000, chunk_size=1 << 18, blob_len=39):
+    """Bulk-load n random records, then time single lookups on the reopened store.
+
+    Records are generated directly as arrays (version 0x00 keys, 39-byte
+    BIP38 payloads) so the numbers measure the store, not Base58. The log
+    is off: see `benchmark_group_commit` for durable single inserts.
+    """
+    rng = np.random.default_rng(1)
+    _remove_store(path)
+
+    store = KeyStorage(path, wal=False)
+    start = perf_counter()
+    for first in range(0, n, chunk_size):
+        m = min(chunk_size, n - first)
+        keys = rng.integers(0, 256, (m, KEY_SIZE), dtype=np.uint8)
+        keys[:, 0] = 0
+        blobs = rng.integers(0, 256, (m, blob_len), dtype=np.uint8)
+        store.append_arrays(keys, np.full(m, KIND_BIP38, np.uint8), np.full(m, blob_len, np.uint16), blobs)
+    store.close()
+    elapsed = perf_counter() - start
+    print("bulk load: %d records in %.1fs (%.0f inserts/s), %.0f MiB + %.0f MiB index"
+          % (n, elapsed, n / elapsed, os.path.getsize(path) / 2 ** 20, os.path.getsize(path + '.index') / 2 ** 20))
+
+    start = perf_counter()
+    store = KeyStorage(path, wal=False)
+    print("reopen: %.3fs" % (perf_counter() - start))
+    records = store._records_view()
+    sample = [bytes(records[i, :KEY_SIZE]) for i in rng.integers(0, n, lookups)]
+    del records
+    addresses = [decode_address(k) for k in sample[:10000]]
+
+    def latencies(keys):
+        times = []
+        for key in keys:
+            t = perf_counter_ns()
+            store.get(key)
+            times.append(perf_counter_ns() - t)
+        times.sort()
+        return times[len(times) // 2] / 1000, times[len(times) * 99 // 100] / 1000
+
+    p50, p99 = latencies(sample)
+    print("lookup (binary key): p50 %.1fus  p99 %.1fus" % (p50, p99))
+    p50, p99 = latencies(addresses)
+    print("lookup (Base58 address): p50 %.1fus  p99 %.1fus" % (p50, p99))
+    misses = [b'\x00' + os.urandom(20) for _ in range(10000)]
+    p50, p99 = latencies(misses)
+    print("lookup (miss): p50 %.1fus  p99 %.1fus" % (p50, p99))
+
+    start = perf_counter()
+    for i in range(10000):
+        store.put(b'\x05' + os.urandom(20), os.urandom(blob_len))
+    elapsed = perf_counter() - start
+    print("single put (no log): %.0f inserts/s" % (10000 / elapsed))
+    store.close()
+
+
+def _remove_store(path):
+    for p in (path, path + '.index', path + '.wal', path + '.merkle', path + '.anchors'):
+        if os.path.exists(p):
+            os.remove(p)
+
+
+def benchmark_group_commit(path, threads=(1, 8, 64), windows=(0.0, 0.0005, 0.002, 0.01),
+                           seconds=2.0, blob_len=39):
+    """Durable put() throughput and commit latency per writer count and window."""
+    print("%7s %9s %12s %9s %9s %10s" % ('writers', 'window', 'inserts/s', 'p50 ms', 'p99 ms', 'per fsync'))
+    for n_threads in threads:
+        for window in windows:
+            _remove_store(path)
+            store = KeyStorage(path, commit_window=window)
+            latencies = []
+            stop = perf_counter() + seconds
+
+            def writer():
+                mine = []
+                while perf_counter() < stop:
+                    t = perf_counter()
+                    store.put(b'\x00' + os.urandom(20), os.urandom(blob_len))
+                    mine.append(perf_counter() - t)
+                latencies.extend(mine)
+
+            workers = [threading.Thread(target=writer) for _ in range(n_threads)]
+            start = perf_counter()
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+            elapsed = perf_counter() - start
+            latencies.sort()
+            commits = store._wal.commits
+            store.close()
+            print("%7d %8.1fms %12.0f %9.2f %9.2f %10.1f" % (
+                n_threads, window * 1000, len(latencies) / elapsed, latencies[len(latencies) // 2] * 1000,
+                latencies[len(latencies) * 99 // 100] * 1000, len(latencies) / max(commits, 1)))
+    _remove_store(path)
+
+
+def benchmark_merkle(path, n=1_000_000, chunk_size=1 << 16, proofs=10000, blob_len=39):
+    """Bulk-load cost of the Merkle tree, and a full-scan audit vs proof checks."""
+    rng = np.random.default_rng(3)
+    keys = rng.integers(0, 256, (n, KEY_SIZE), dtype=np.uint8)
+    keys[:, 0] = 0
+    blobs = rng.integers(0, 256, (n, blob_len), dtype=np.uint8)
+    for merkle_tree in (False, True):
+        _remove_store(path)
+        store = KeyStorage(path, wal=False, merkle_tree=merkle_tree)
+        start = perf_counter()
+        for first in range(0, n, chunk_size):
+            m = min(chunk_size, n - first)
+            store.append_arrays(keys[first:first + m], np.full(m, KIND_BIP38, np.uint8),
+                                np.full(m, blob_len, np.uint16), blobs[first:first + m])
+        store.flush()
+        elapsed = perf_counter() - start
+        print("bulk load, merkle=%-5s %.0f inserts/s" % (merkle_tree, n / elapsed))
+        if merkle_tree:
+            break
+        store.close()
+
+    entry = store.anchor()
+    start = perf_counter()
+    tree = merkle.MerkleLog(path + '.audit')
+    for first in range(0, n, chunk_size):
+        tree.append(store._leaf(rec) for rec in range(first, min(n, first + chunk_size)))
+    assert tree.root().hex() == entry['root']
+    tree.close()
+    os.remove(path + '.audit')
+    print("full audit (rehash %d records): %.2fs" % (n, perf_counter() - start))
+
+    sample = [store.prove(keys[i].tobytes()) for i in rng.integers(0, n, proofs)]
+    start = perf_counter()
+    assert all(verify_proof(proof, entry['root']) for proof in sample)
+    print("proof check: %.1fus each, %d hashes" % ((perf_counter() - start) / proofs * 1e6,
+                                                   len(sample[0]['siblings']) + len(sample[0]['peaks']) + 2))
+    store.close()
+    _remove_store(path)
+
+
+def _reader_worker(path, sample, seconds, results):
+    with KeyStoreReader(path) as reader:
+        done = 0
+        stop = perf_counter() + seconds
+        while perf_counter() < stop:
+            for key in sample:
+                reader.get(key)
+            done += len(sample)
+        results.put(done)
+
+
+def benchmark_readers(path, n=1_000_000, readers=(1, 2, 4, 8), seconds=3.0, blob_len=39):
+    """Lookups/s of reader processes while one writer keeps inserting."""
+    import multiprocessing
+
+    _remove_store(path)
+    rng = np.random.default_rng(2)
+    keys = rng.integers(0, 256, (n, KEY_SIZE), dtype=np.uint8)
+    keys[:, 0] = 0
+    store = KeyStorage(path)
+    store.append_arrays(keys, np.full(n, KIND_BIP38, np.uint8), np.full(n, blob_len, np.uint16),
+                        rng.integers(0, 256, (n, blob_len), dtype=np.uint8))
+    sample = [keys[i].tobytes() for i in rng.integers(0, n, 1000)]
+    print("%7s %14s %16s %14s" % ('readers', 'lookups/s', 'per reader', 'writer puts/s'))
+    for n_readers in readers:
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_reader_worker, args=(path, sample, seconds, results))
+                 for _ in range(n_readers)]
+        writes = 0
+        for proc in procs:
+            proc.start()
+        stop = perf_counter() + seconds
+        while perf_counter() < stop:
+            store.put(b'\x05' + os.urandom(20), os.urandom(blob_len))
+            writes += 1
+        total = sum(results.get() for _ in procs)
+        for proc in procs:
+            proc.join()
+        print("%7d %14.0f %16.0f %14.0f" % (n_readers, total / seconds, total / seconds / n_readers,
+                                           writes / seconds))
+    store.close()
+    _remove_store(path)
+
+
+if __name__ == '__main__':
+    import sys
+    bench_path = sys.argv[1] if len(sys.argv) > 1 else 'bench.keystore'
+    benchmark(bench_path)
+    benchmark_group_commit(bench_path)
+    benchmark_readers(bench_path)
+    benchmark_merkle(bench_path)
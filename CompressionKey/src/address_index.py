@@ -0,0 +1,239 @@
+"""
+Offline address-match index over a local ledger snapshot.
+
+Checking which derived addresses are funded used to take one RPC per
+address. `build_index` reads address dumps once and writes two files:
+
+    <path>        sorted 20-byte keys, stored as three little-endian columns
+                  (bytes 0-8, 8-16, 16-20 read big-endian), memory-mapped
+    <path>.bloom  Bloom filter over the same keys, for fast negatives
+
+A key is the 20 bytes an address commits to: hash160 for P2PKH and
+P2WPKH, the script hash for P2SH, and the account for EVM addresses. A
+P2PKH and a P2WPKH address of the same public key share a key and both
+match. That is what a recovery wants to know.
+
+Derivation batches are checked without building strings.
+address_utils.hash160_batch and keccak_addresses return (n, 20) arrays
+that `AddressIndex.contains` takes directly. The Bloom filter drops most
+misses, and the rest get a vectorized binary search on the first column.
+Only keys that share their first 8 bytes with another indexed key need a
+slower scan.
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+from time import perf_counter
+
+import base58
+import numpy as np
+
+from bloom_filter import BloomFilter
+
+_HEADER = struct.Struct('<4sQ')
+_MAGIC = b'ADX1'
+
+
+class _KeyBloom(BloomFilter):
+    """Bloom filter over keys that are already uniform hashes; positions come from the key bytes."""
+
+    def _positions(self, item):
+        h1 = int.from_bytes(item[4:12], 'little')
+        h2 = int.from_bytes(item[12:20], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def _positions_batch(self, items):
+        keys = np.asarray(items, dtype=np.uint8).reshape(-1, 20)
+        num_bits = np.uint64(self.num_bits)
+        h1 = keys[:, 4:12].copy().view('<u8') % num_bits
+        h2 = (keys[:, 12:20].copy().view('<u8') | np.uint64(1)) % num_bits
+        return (h1 + np.arange(self.num_hashes, dtype=np.uint64) * h2) % num_bits
+
+
+def address_key(address):
+    """The 20-byte key of an EVM, Base58Check or bech32 (v0, 20-byte program) address, or None."""
+    address = address.strip()
+    try:
+        if address[:2].lower() == '0x':
+            key = bytes.fromhex(address[2:])
+        elif address[:3].lower() in ('bc1', 'tb1'):
+            from bip_utils import SegwitBech32Decoder
+
+            _, key = SegwitBech32Decoder.Decode(address[:2].lower(), address)
+        else:
+            key = base58.b58decode_check(address)[1:]
+    except Exception:
+        return None
+    return key if len(key) == 20 else None
+
+
+def address_keys(addresses):
+    """(n, 20) keys of address strings, plus a mask of addresses that parsed."""
+    keys = [address_key(address) for address in addresses]
+    valid = np.array([key is not None for key in keys], dtype=bool)
+    out = np.zeros((len(keys), 20), dtype=np.uint8)
+    if valid.any():
+        out[valid] = np.frombuffer(b''.join(key for key in keys if key is not None), dtype=np.uint8).reshape(-1, 20)
+    return out, valid
+
+
+def _columns(keys):
+    keys = np.asarray(keys, dtype=np.uint8).reshape(-1, 20)
+    return (keys[:, :8].copy().view('>u8').ravel().astype('<u8'),
+            keys[:, 8:16].copy().view('>u8').ravel().astype('<u8'),
+            keys[:, 16:].copy().view('>u4').ravel().astype('<u4'))
+
+
+def _read_addresses(path, chunk=1 << 16):
+    """Yield lists of address strings from a file of one address per line (first CSV field)."""
+    with open(path) as f:
+        batch = []
+        for line in f:
+            field = line.split(',', 1)[0].strip()
+            if field:
+                batch.append(field)
+                if len(batch) >= chunk:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+
+def _file_keys(path):
+    chunks = [keys[valid] for keys, valid in map(address_keys, _read_addresses(path))]
+    return np.concatenate(chunks) if chunks else np.zeros((0, 20), dtype=np.uint8)
+
+
+def build_index(path, sources, error_rate=1e-3):
+    """Build the index from address dump files (or (n, 20) key arrays); returns the number of keys."""
+    chunks = [_file_keys(source) if isinstance(source, (str, os.PathLike))
+              else np.asarray(source, dtype=np.uint8).reshape(-1, 20) for source in sources]
+    keys = np.concatenate(chunks) if chunks else np.zeros((0, 20), dtype=np.uint8)
+    hi, mid, lo = _columns(keys)
+    order = np.lexsort((lo, mid, hi))
+    hi, mid, lo, keys = hi[order], mid[order], lo[order], keys[order]
+    unique = np.ones(len(hi), dtype=bool)
+    unique[1:] = (hi[1:] != hi[:-1]) | (mid[1:] != mid[:-1]) | (lo[1:] != lo[:-1])
+    hi, mid, lo, keys = hi[unique], mid[unique], lo[unique], keys[unique]
+
+    bloom = _KeyBloom(len(keys), error_rate)
+    bloom.add_batch(keys)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, len(keys)))
+        for column in (hi, mid, lo):
+            f.write(column.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    bloom.save(path + '.bloom.tmp')
+    os.replace(path + '.bloom.tmp', path + '.bloom')
+    os.replace(tmp, path)
+    return len(keys)
+
+
+class AddressIndex:
+    def __init__(self, path, use_bloom=True):
+        with open(path, 'rb') as f:
+            magic, self.count = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError("%s is not an address index" % path)
+            self._mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offset = _HEADER.size
+        self._hi = np.frombuffer(self._mapped, dtype='<u8', count=self.count, offset=offset)
+        self._mid = np.frombuffer(self._mapped, dtype='<u8', count=self.count, offset=offset + 8 * self.count)
+        self._lo = np.frombuffer(self._mapped, dtype='<u4', count=self.count, offset=offset + 16 * self.count)
+        self.bloom = _KeyBloom.load(path + '.bloom') if use_bloom else None
+
+    def __len__(self):
+        return self.count
+
+    def contains(self, keys):
+        """Boolean array: which rows of an (n, 20) key array are in the index."""
+        keys = np.asarray(keys, dtype=np.uint8).reshape(-1, 20)
+        found = np.zeros(len(keys), dtype=bool)
+        rows = np.arange(len(keys))
+        if self.bloom is not None and len(keys):
+            rows = rows[self.bloom.contains_batch(keys)]
+        if not len(rows) or not self.count:
+            return found
+        hi, mid, lo = _columns(keys[rows])
+        left = np.searchsorted(self._hi, hi, 'left')
+        right = np.searchsorted(self._hi, hi, 'right')
+        single = right - left == 1
+        at = left[single]
+        found[rows[single]] = (self._mid[at] == mid[single]) & (self._lo[at] == lo[single])
+        for j in np.flatnonzero(right - left > 1):
+            # Keys sharing their first 8 bytes with another indexed key
+            span = slice(left[j], right[j])
+            found[rows[j]] = ((self._mid[span] == mid[j]) & (self._lo[span] == lo[j])).any()
+        return found
+
+    def match(self, addresses):
+        """The addresses (strings) that are in the index."""
+        keys, valid = address_keys(addresses)
+        found = self.contains(keys) & valid
+        return [address for address, hit in zip(addresses, found) if hit]
+
+    def close(self):
+        self._hi = self._mid = self._lo = None
+        self.bloom = None
+        self._mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def benchmark(n=1_000_000, queries=1_000_000):
+    """Lookups/s of derived-key batches against an n-key index, hits at 1%."""
+    import tempfile
+
+    keys = np.frombuffer(os.urandom(20 * n), dtype=np.uint8).reshape(n, 20)
+    batch = np.frombuffer(os.urandom(20 * queries), dtype=np.uint8).reshape(queries, 20).copy()
+    batch[::100] = keys[:queries // 100 * 100:100][:len(batch[::100])]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ledger.idx')
+        start = perf_counter()
+        build_index(path, [keys])
+        print("build        %9.0f keys/s" % (n / (perf_counter() - start)))
+        for use_bloom in (True, False):
+            with AddressIndex(path, use_bloom) as index:
+                start = perf_counter()
+                hits = int(index.contains(batch).sum())
+                rate = queries / (perf_counter() - start)
+            print("bloom=%-5s  %9.0f lookups/s (%d hits)" % (use_bloom, rate, hits))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query an offline address-match index.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="Index address dumps (one address per line, first CSV field)")
+    build.add_argument('index')
+    build.add_argument('sources', nargs='+')
+    build.add_argument('--error-rate', type=float, default=1e-3)
+    check = sub.add_parser('check', help="Print the addresses of a file that are in the index")
+    check.add_argument('index')
+    check.add_argument('addresses')
+    args = parser.parse_args()
+    start = perf_counter()
+    if args.command == 'build':
+        count = build_index(args.index, args.sources, args.error_rate)
+        print("%d keys indexed in %.1fs" % (count, perf_counter() - start), file=sys.stderr)
+        return
+    total = 0
+    with AddressIndex(args.index) as index:
+        for chunk in _read_addresses(args.addresses):
+            total += len(chunk)
+            for address in index.match(chunk):
+                print(address)
+    elapsed = perf_counter() - start
+    print("%d addresses checked in %.1fs (%.0f/s)" % (total, elapsed, total / max(elapsed, 1e-9)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
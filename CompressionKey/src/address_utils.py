@@ -0,0 +1,272 @@
+"""
+Single-pass multi-chain addresses for batches of keys.
+
+For each key the EC point is computed once (ec_utils.public_keys), the
+SHA-256/RIPEMD-160 hash160 of its compressed encoding once, and keccak-256
+of its uncompressed encoding once, and only if a requested format needs
+them. Every requested format is then encoded for the whole batch:
+
+    p2pkh               Base58Check(0x00 | hash160(compressed))      1...
+    p2pkh_uncompressed  Base58Check(0x00 | hash160(uncompressed))    1...
+    p2sh_p2wpkh         Base58Check(0x05 | hash160(0x0014 | h160))   3...
+    p2wpkh              bech32("bc", 0, hash160(compressed))         bc1q...
+    evm                 "0x" | keccak256(X | Y)[12:]                 0x...
+
+Base58, bech32 and keccak-256 run as NumPy operations across the batch.
+Base58 does long division by 58^5 on uint32 limbs. The bech32 checksum
+does a table-driven polymod with one lane per address. keccak-f[1600]
+runs on a (25, n) state, one column per message. Only the final
+bytes-to-str step is per address.
+"""
+
+import hashlib
+import os
+from time import perf_counter
+
+import numpy as np
+from Crypto.Hash import keccak
+
+from ec_utils import public_keys
+
+FORMATS = ('p2pkh', 'p2pkh_uncompressed', 'p2sh_p2wpkh', 'p2wpkh', 'evm')
+
+P2PKH_VERSION = 0x00
+P2SH_VERSION = 0x05
+BECH32_HRP = 'bc'
+
+B58_ALPHABET = np.frombuffer(b'123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz', dtype=np.uint8)
+BECH32_CHARSET = np.frombuffer(b'qpzry9x8gf2tvdw0s3jn54khce6mua7l', dtype=np.uint8)
+_B58_CHUNK = 58 ** 5
+
+# Below this many messages the per-call cost of PyCryptodome is lower
+_KECCAK_BATCH_MIN = 1024
+_KECCAK_RC = np.array([
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008], dtype=np.uint64)
+# Lane x + 5y is rotated by _KECCAK_ROT[x][y] and moved to lane y + 5((2x + 3y) % 5)
+_KECCAK_ROT = ((0, 36, 3, 41, 18), (1, 44, 10, 45, 2), (62, 6, 43, 15, 61), (28, 55, 25, 21, 56), (27, 20, 39, 8, 14))
+_KECCAK_PI = [(x + 5 * y, y + 5 * ((2 * x + 3 * y) % 5), _KECCAK_ROT[x][y]) for x in range(5) for y in range(5)]
+
+_GEN = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+# _POLY_STEP[b] is the XOR of the generators selected by the 5 bits of b
+_POLY_STEP = np.array([np.bitwise_xor.reduce([g for i, g in enumerate(_GEN) if b >> i & 1] or [0])
+                       for b in range(32)], dtype=np.uint32)
+
+
+def _ripemd160(data):
+    return hashlib.new('ripemd160', data).digest()
+
+
+try:
+    hashlib.new('ripemd160')
+except ValueError:
+    # OpenSSL 3 builds without the legacy provider
+    from Crypto.Hash import RIPEMD160
+
+    def _ripemd160(data):
+        return RIPEMD160.new(data).digest()
+
+
+def hash160(data):
+    return _ripemd160(hashlib.sha256(data).digest())
+
+
+def hash160_batch(rows):
+    """hash160 of every row of a uint8 array, as an (n, 20) array."""
+    return np.frombuffer(b''.join(hash160(row.tobytes()) for row in rows), dtype=np.uint8).reshape(-1, 20)
+
+
+def _keccak_f(state):
+    """keccak-f[1600] in place on a (25, n) uint64 state."""
+    n = state.shape[1]
+    c = np.empty((5, n), dtype=np.uint64)
+    d = np.empty((5, n), dtype=np.uint64)
+    b = np.empty((25, n), dtype=np.uint64)
+    tmp = np.empty(n, dtype=np.uint64)
+    one, sixty_three = np.uint64(1), np.uint64(63)
+    for rc in _KECCAK_RC:
+        # theta
+        np.bitwise_xor(state[0:5], state[5:10], out=c)
+        for y in (10, 15, 20):
+            c ^= state[y:y + 5]
+        for x in range(5):
+            right = c[(x + 1) % 5]
+            np.left_shift(right, one, out=tmp)
+            np.right_shift(right, sixty_three, out=d[x])
+            d[x] |= tmp
+            d[x] ^= c[(x - 1) % 5]
+        state.reshape(5, 5, n)[...] ^= d
+        # rho and pi
+        for src, dst, rot in _KECCAK_PI:
+            if rot:
+                np.left_shift(state[src], np.uint64(rot), out=b[dst])
+                np.right_shift(state[src], np.uint64(64 - rot), out=tmp)
+                b[dst] |= tmp
+            else:
+                b[dst] = state[src]
+        # chi and iota
+        rows, lanes = b.reshape(5, 5, n), state.reshape(5, 5, n)
+        for x in range(5):
+            np.invert(rows[:, (x + 1) % 5], out=lanes[:, x])
+            lanes[:, x] &= rows[:, (x + 2) % 5]
+            lanes[:, x] ^= rows[:, x]
+        state[0] ^= rc
+
+
+def keccak256_batch(messages):
+    """keccak-256 of every row of an (n, L) uint8 array (L < 136), as an (n, 32) array."""
+    n, length = messages.shape
+    if n < _KECCAK_BATCH_MIN:
+        out = b''.join(keccak.new(digest_bits=256, data=row.tobytes()).digest() for row in messages)
+        return np.frombuffer(out, dtype=np.uint8).reshape(n, 32)
+    # One padded 136-byte block per message, in a 200-byte state
+    block = np.zeros((n, 200), dtype=np.uint8)
+    block[:, :length] = messages
+    block[:, length] ^= 0x01
+    block[:, 135] ^= 0x80
+    state = np.ascontiguousarray(block.view('<u8').T)
+    _keccak_f(state)
+    return np.ascontiguousarray(state[:4].T).view(np.uint8).reshape(n, 32)
+
+
+def keccak_addresses(uncompressed):
+    """Last 20 bytes of keccak-256(X | Y) of (n, 65) public keys, as an (n, 20) array."""
+    return keccak256_batch(np.asarray(uncompressed)[:, 1:])[:, 12:]
+
+
+def base58_batch(payloads):
+    """Base58 of every row of an (n, L) uint8 array, with '1' per leading zero byte."""
+    n, length = payloads.shape
+    pad = -length % 4
+    padded = np.zeros((n, length + pad), dtype=np.uint8)
+    padded[:, pad:] = payloads
+    limbs = padded.view('>u4').astype(np.uint64)
+    ndigits = -(-length * 8 * 1000 // 5857)  # log2(58) > 5.857
+    rounds = -(-ndigits // 5)
+    digits = np.empty((n, rounds * 5), dtype=np.uint8)
+    chunk = np.uint64(_B58_CHUNK)
+    for r in range(rounds):
+        rem = np.zeros(n, dtype=np.uint64)
+        for j in range(limbs.shape[1]):
+            cur = (rem << np.uint64(32)) | limbs[:, j]
+            limbs[:, j] = cur // chunk
+            rem = cur % chunk
+        for k in range(5):
+            digits[:, -(r * 5 + k) - 1] = rem % np.uint64(58)
+            rem //= np.uint64(58)
+    chars = B58_ALPHABET[digits]
+    # Leading zero digits are dropped and leading zero bytes become '1's
+    first = np.where(digits.any(axis=1), (digits != 0).argmax(axis=1), digits.shape[1])
+    zeros = np.where(payloads.any(axis=1), (payloads != 0).argmax(axis=1), length)
+    raw = chars.tobytes()
+    width = chars.shape[1]
+    return ['1' * z + raw[i * width + f:(i + 1) * width].decode() for i, (f, z) in enumerate(zip(first, zeros))]
+
+
+def base58check_batch(version, payloads):
+    """Base58Check of version | payload for every row of an (n, L) uint8 array."""
+    n = len(payloads)
+    data = np.empty((n, payloads.shape[1] + 5), dtype=np.uint8)
+    data[:, 0] = version
+    data[:, 1:-4] = payloads
+    data[:, -4:] = np.frombuffer(b''.join(hashlib.sha256(hashlib.sha256(row[:-4].tobytes()).digest()).digest()[:4]
+                                          for row in data), dtype=np.uint8).reshape(n, 4)
+    return base58_batch(data)
+
+
+def _hrp_polymod(hrp):
+    chk = 1
+    for v in [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]:
+        b = chk >> 25
+        chk = (chk & 0x1ffffff) << 5 ^ v ^ int(_POLY_STEP[b])
+    return chk
+
+
+def segwit_batch(programs, hrp=BECH32_HRP, version=0):
+    """Segwit addresses (bech32 for v0, bech32m above) of an (n, L) array of witness programs."""
+    n = len(programs)
+    bits = np.unpackbits(programs, axis=1)
+    bits = np.pad(bits, ((0, 0), (0, -bits.shape[1] % 5)))
+    groups = bits.reshape(n, -1, 5) @ np.array([16, 8, 4, 2, 1], dtype=np.uint8)
+    data = np.concatenate([np.full((n, 1), version, dtype=np.uint8), groups.astype(np.uint8)], axis=1)
+
+    chk = np.full(n, _hrp_polymod(hrp), dtype=np.uint32)
+    for v in list(data.T) + [np.zeros(n, dtype=np.uint8)] * 6:
+        b = chk >> np.uint32(25)
+        chk = ((chk & np.uint32(0x1ffffff)) << np.uint32(5)) ^ v ^ _POLY_STEP[b]
+    chk ^= np.uint32(1 if version == 0 else 0x2bc830a3)
+    checksum = np.stack([(chk >> np.uint32(5 * (5 - i))) & np.uint32(31) for i in range(6)], axis=1)
+
+    chars = BECH32_CHARSET[np.concatenate([data, checksum.astype(np.uint8)], axis=1)]
+    raw = chars.tobytes()
+    width = chars.shape[1]
+    prefix = hrp + '1'
+    return [prefix + raw[i * width:(i + 1) * width].decode() for i in range(n)]
+
+
+def addresses(compressed=None, uncompressed=None, formats=FORMATS):
+    """Address columns {format: [str]} from (n, 33) and/or (n, 65) public keys."""
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError("Unknown address formats: %s" % ', '.join(sorted(unknown)))
+    columns = {}
+    if {'p2pkh', 'p2sh_p2wpkh', 'p2wpkh'} & set(formats):
+        h160 = hash160_batch(compressed)
+        if 'p2pkh' in formats:
+            columns['p2pkh'] = base58check_batch(P2PKH_VERSION, h160)
+        if 'p2wpkh' in formats:
+            columns['p2wpkh'] = segwit_batch(h160)
+        if 'p2sh_p2wpkh' in formats:
+            scripts = np.concatenate([np.tile(np.array([0x00, 0x14], dtype=np.uint8), (len(h160), 1)), h160], axis=1)
+            columns['p2sh_p2wpkh'] = base58check_batch(P2SH_VERSION, hash160_batch(scripts))
+    if 'p2pkh_uncompressed' in formats:
+        columns['p2pkh_uncompressed'] = base58check_batch(P2PKH_VERSION, hash160_batch(uncompressed))
+    if 'evm' in formats:
+        columns['evm'] = ['0x' + row.tobytes().hex() for row in keccak_addresses(uncompressed)]
+    return {name: columns[name] for name in formats}
+
+
+def derive_addresses(private_keys, formats=FORMATS):
+    """One pass over 32-byte private keys: {'public_key': (n, 33) array, format: [str], ...}."""
+    if {'p2pkh_uncompressed', 'evm'} & set(formats):
+        compressed, uncompressed = public_keys(private_keys, uncompressed=True)
+    else:
+        compressed, uncompressed = public_keys(private_keys), None
+    columns = {'public_key': compressed}
+    columns.update(addresses(compressed, uncompressed, formats))
+    return columns
+
+
+def benchmark(n=20000, chain_sets=(('p2pkh',), ('p2wpkh',), ('evm',), ('p2pkh', 'p2wpkh', 'evm'), FORMATS)):
+    """Addresses/s per chain set: one pass here vs a separate bip_utils encoder per chain."""
+    from bip_utils import EthAddrEncoder, P2PKHAddrEncoder, P2SHAddrEncoder, P2WPKHAddrEncoder, Secp256k1PublicKey
+
+    private_keys = [os.urandom(32) for _ in range(n)]
+    encoders = {
+        'p2pkh': lambda key: P2PKHAddrEncoder.EncodeKey(key, net_ver=b'\x00'),
+        'p2pkh_uncompressed': lambda key: P2PKHAddrEncoder.EncodeKey(key, net_ver=b'\x00', pub_key_mode=1),
+        'p2sh_p2wpkh': lambda key: P2SHAddrEncoder.EncodeKey(key, net_ver=b'\x05'),
+        'p2wpkh': lambda key: P2WPKHAddrEncoder.EncodeKey(key, hrp='bc', wit_ver=0),
+        'evm': lambda key: EthAddrEncoder.EncodeKey(key, skip_chksum_enc=True),
+    }
+    for formats in chain_sets:
+        start = perf_counter()
+        derive_addresses(private_keys, formats)
+        ours = n / (perf_counter() - start)
+        sample = private_keys[:n // 10]
+        start = perf_counter()
+        for secret in sample:
+            for name in formats:
+                # Each tool recomputes the point and its hashes
+                encoders[name](Secp256k1PublicKey.FromBytes(public_keys([secret])[0].tobytes()))
+        theirs = len(sample) / (perf_counter() - start)
+        print("%-55s %9.0f keys/s (%.0f addresses/s); per-chain tools %7.0f keys/s"
+              % (','.join(formats), ours, ours * len(formats), theirs))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,199 @@
+"""
+asyncio counterparts of the BIP38 and vault functions.
+
+`Bip38.decrypt` runs a 16 MiB scrypt, and the vault formats run a million
+PBKDF2 iterations. Awaited directly, either call would stall every
+connection on the event loop for up to a second. Here each call runs on
+a shared `CryptoExecutor`: a process pool by default, or a thread pool.
+hashlib's PBKDF2 releases the GIL, which is enough for the vault
+functions alone.
+
+A semaphore bounds the number of calls submitted to the pool, and a slot
+is held until the pool has really finished the call. Excess calls wait
+on the event loop, where they cost nothing. Cancelling such a call, or
+hitting its timeout, withdraws it before it reaches the pool. A call
+already running in a worker cannot be interrupted. It finishes there,
+its result is discarded, and only then is its slot released. `timeout`
+covers the wait for a slot as well as the work.
+
+`decrypt_seed_phrase` handles both word and hex seed phrase blobs
+through vault_migrate.decrypt_legacy, and `encrypt_key` /
+`encrypt_seed_phrase` write the key-utils and seedBip hex formats through
+vault_migrate.seal_legacy. This way the server never imports the tkinter
+front ends that define the original functions. seedtophrase's word
+output is not offered: it keeps only 24 words, so it cannot be decrypted.
+"""
+
+import asyncio
+import os
+import statistics
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+
+import vault_migrate
+from main import Bip38
+
+
+class CryptoExecutor:
+    def __init__(self, kind='process', max_workers=None, limit=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        pool = {'process': ProcessPoolExecutor, 'thread': ThreadPoolExecutor}[kind]
+        self._executor = pool(self.max_workers)
+        # More in flight than workers would only queue inside the pool, out of reach of cancellation
+        self.limit = limit or self.max_workers
+        self._semaphore = self._loop = None
+        self.submitted = self.completed = 0
+
+    def _slots(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._semaphore = loop, asyncio.Semaphore(self.limit)
+        return loop, self._semaphore
+
+    async def run(self, fn, *args, timeout=None):
+        """Await fn(*args) on the pool; raises asyncio.TimeoutError after `timeout` seconds."""
+        return await asyncio.wait_for(self._run(fn, args), timeout)
+
+    async def _run(self, fn, args):
+        loop, semaphore = self._slots()
+        await semaphore.acquire()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            semaphore.release()
+            raise
+        self.submitted += 1
+        future.add_done_callback(lambda _: self._release(loop, semaphore))
+        return await asyncio.wrap_future(future)
+
+    def _release(self, loop, semaphore):
+        # Runs in a pool thread; the loop may have closed since the call was made
+        self.completed += 1
+        try:
+            loop.call_soon_threadsafe(semaphore.release)
+        except RuntimeError:
+            # Closed, maybe after the call was made; nothing is waiting for the slot
+            pass
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_executor = None
+
+
+def get_executor():
+    """The shared executor, created on first use."""
+    global _executor
+    if _executor is None:
+        _executor = CryptoExecutor()
+    return _executor
+
+
+def set_executor(executor):
+    """Replace the shared executor; returns the previous one (not shut down)."""
+    global _executor
+    previous, _executor = _executor, executor
+    return previous
+
+
+async def _call(fn, args, timeout, executor):
+    return await (executor or get_executor()).run(fn, *args, timeout=timeout)
+
+
+async def bip38_encrypt(private_key, passphrase, compressed=False, timeout=None, executor=None):
+    return await _call(Bip38.encrypt, (private_key, passphrase, compressed), timeout, executor)
+
+
+async def bip38_decrypt(encrypted_key, passphrase, timeout=None, executor=None):
+    """(private key, compressed), or (None, None) on failure, like Bip38.decrypt."""
+    return await _call(Bip38.decrypt, (encrypted_key, passphrase), timeout, executor)
+
+
+async def decrypt_legacy(blob, password, iterations=vault_migrate.LEGACY_ITERATIONS, timeout=None, executor=None):
+    return await _call(vault_migrate.decrypt_legacy, (blob, password, iterations), timeout, executor)
+
+
+async def seal(kind, plain, password, iterations=vault_migrate.ITERATIONS, timeout=None, executor=None):
+    return await _call(vault_migrate.seal, (kind, plain, password, iterations), timeout, executor)
+
+
+async def open_blob(blob, password, timeout=None, executor=None):
+    return await _call(vault_migrate.open_blob, (blob, password), timeout, executor)
+
+
+async def encrypt_key(private_key_hex, password, iterations=vault_migrate.LEGACY_ITERATIONS, timeout=None,
+                      executor=None):
+    """key-utils blob (hex) of a 64-character hex private key."""
+    if len(private_key_hex) != 64:
+        raise ValueError("Private key must be a 64-character hex string.")
+    return await _call(vault_migrate.seal_legacy, ('keyutils', bytes.fromhex(private_key_hex), password, iterations),
+                       timeout, executor)
+
+
+async def encrypt_seed_phrase(seed_phrase, password, iterations=vault_migrate.LEGACY_ITERATIONS, timeout=None,
+                              executor=None):
+    """seedBip blob (hex) of a seed phrase; `decrypt_seed_phrase` reverses it."""
+    return await _call(vault_migrate.seal_legacy, ('seedbip', seed_phrase.encode('utf-8'), password, iterations),
+                       timeout, executor)
+
+
+def _decrypt_seed_phrase(blob, password, iterations):
+    fmt, kind, plain = vault_migrate.decrypt_legacy(blob, password, iterations)
+    if kind != vault_migrate.KIND_TEXT:
+        raise ValueError("Not a seed phrase blob (%s)" % fmt)
+    return plain.decode('utf-8')
+
+
+async def decrypt_seed_phrase(blob, password, iterations=vault_migrate.LEGACY_ITERATIONS, timeout=None,
+                              executor=None):
+    """Seed phrase text of a seedBip (hex) or seedtophrase (word) blob."""
+    return await _call(_decrypt_seed_phrase, (blob, password, iterations), timeout, executor)
+
+
+async def _lateness(connections, period, stop):
+    # Simulated idle connections: how late each wakeup is, in seconds
+    late = []
+
+    async def connection():
+        while not stop.is_set():
+            start = perf_counter()
+            await asyncio.sleep(period)
+            late.append(perf_counter() - start - period)
+    tasks = [asyncio.create_task(connection()) for _ in range(connections)]
+    await stop.wait()
+    await asyncio.gather(*tasks)
+    return late
+
+
+def benchmark(connections=10_000, calls=8, period=1.0):
+    """Event loop lateness across `connections` tasks while `calls` vault KDFs run."""
+    blob = vault_migrate.seal(vault_migrate.KIND_TEXT, b'benchmark', 'pw')
+
+    async def scenario(mode):
+        stop = asyncio.Event()
+        watcher = asyncio.create_task(_lateness(connections, period, stop))
+        await asyncio.sleep(period)
+        start = perf_counter()
+        if mode == 'idle':
+            await asyncio.sleep(3 * period)
+        elif mode == 'inline':
+            for _ in range(calls):
+                vault_migrate.open_blob(blob, 'pw')
+        else:
+            executor = CryptoExecutor(mode)
+            await asyncio.gather(*(open_blob(blob, 'pw', executor=executor) for _ in range(calls)))
+            executor.shutdown()
+        elapsed = perf_counter() - start
+        stop.set()
+        late = sorted(await watcher)
+        p99 = late[int(len(late) * 0.99)]
+        print("%-8s %d calls in %.1fs; wakeup lateness p50 %.0f ms, p99 %.0f ms, max %.0f ms"
+              % (mode, 0 if mode == 'idle' else calls, elapsed, statistics.median(late) * 1e3, p99 * 1e3, late[-1] * 1e3))
+
+    for mode in ('idle', 'inline', 'thread', 'process'):
+        asyncio.run(scenario(mode))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,236 @@
+"""
+Batch PBKDF2-HMAC for bulk vault unlocking.
+
+seedBip.py, key-utils.py and Seedtoseed.py derive every blob key with
+`Crypto.Protocol.KDF.PBKDF2(password, salt, dkLen=32, count=1000000)`,
+i.e. PBKDF2-HMAC-SHA1 with str passwords encoded as Latin-1.
+`pbkdf2_batch` computes many (password, salt) pairs with the same cost and
+returns byte-identical keys using one of:
+
+    serial     hashlib.pbkdf2_hmac in this thread
+    threads    hashlib.pbkdf2_hmac on a thread pool (OpenSSL releases the GIL)
+    processes  hashlib.pbkdf2_hmac on a process pool
+    numpy      lane-parallel HMAC-SHA1/SHA-256, all blobs in lockstep
+
+With backend='auto' each backend is timed on a short sample of the actual
+batch and the fastest one is used; the choice is cached per batch shape.
+"""
+
+import hashlib
+import hmac
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+
+import numpy as np
+from Crypto.Cipher import AES
+
+BACKENDS = ('serial', 'threads', 'processes', 'numpy')
+
+_choices = {}
+
+
+def _to_bytes(s):
+    # Same conversion as Crypto.Util.py3compat.tobytes, used by PyCryptodome's PBKDF2
+    if isinstance(s, str):
+        return s.encode('latin-1')
+    return bytes(s)
+
+
+def _one(args):
+    password, salt, count, dklen, hash_name = args
+    return hashlib.pbkdf2_hmac(hash_name, password, salt, count, dklen)
+
+
+def _rotl(x, n):
+    return (x << np.uint32(n)) | (x >> np.uint32(32 - n))
+
+
+def _sha1_compress(state, w):
+    """SHA-1 compression of (5, L) state with a (16, L) block; returns new state."""
+    w = list(w) + [None] * 64
+    for t in range(16, 80):
+        w[t] = _rotl(w[t - 3] ^ w[t - 8] ^ w[t - 14] ^ w[t - 16], 1)
+    a, b, c, d, e = state
+    for t in range(80):
+        if t < 20:
+            f, k = (b & c) | (~b & d), 0x5A827999
+        elif t < 40:
+            f, k = b ^ c ^ d, 0x6ED9EBA1
+        elif t < 60:
+            f, k = (b & c) | (b & d) | (c & d), 0x8F1BBCDC
+        else:
+            f, k = b ^ c ^ d, 0xCA62C1D6
+        a, b, c, d, e = _rotl(a, 5) + f + e + np.uint32(k) + w[t], a, _rotl(b, 30), c, d
+    return np.stack([state[0] + a, state[1] + b, state[2] + c, state[3] + d, state[4] + e])
+
+
+_K256 = np.array([
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+], dtype=np.uint32)
+
+
+def _rotr(x, n):
+    return (x >> np.uint32(n)) | (x << np.uint32(32 - n))
+
+
+def _sha256_compress(state, w):
+    """SHA-256 compression of (8, L) state with a (16, L) block; returns new state."""
+    w = list(w) + [None] * 48
+    for t in range(16, 64):
+        s0 = _rotr(w[t - 15], 7) ^ _rotr(w[t - 15], 18) ^ (w[t - 15] >> np.uint32(3))
+        s1 = _rotr(w[t - 2], 17) ^ _rotr(w[t - 2], 19) ^ (w[t - 2] >> np.uint32(10))
+        w[t] = w[t - 16] + s0 + w[t - 7] + s1
+    a, b, c, d, e, f, g, h = state
+    for t in range(64):
+        t1 = h + (_rotr(e, 6) ^ _rotr(e, 11) ^ _rotr(e, 25)) + ((e & f) ^ (~e & g)) + _K256[t] + w[t]
+        t2 = (_rotr(a, 2) ^ _rotr(a, 13) ^ _rotr(a, 22)) + ((a & b) ^ (a & c) ^ (b & c))
+        a, b, c, d, e, f, g, h = t1 + t2, a, b, c, d + t1, e, f, g
+    return state + np.stack([a, b, c, d, e, f, g, h])
+
+
+_HASHES = {
+    # name: (compress, initial state, digest words)
+    'sha1': (_sha1_compress, [0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476, 0xC3D2E1F0], 5),
+    'sha256': (_sha256_compress, [0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a,
+                                  0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19], 8),
+}
+
+
+def _pbkdf2_numpy(items, count, dklen, hash_name):
+    """PBKDF2-HMAC with every (item, output block) pair as one uint32 lane."""
+    compress, iv, hwords = _HASHES[hash_name]
+    hlen = hwords * 4
+    nblocks = -(-dklen // hlen)
+
+    keys, u1 = [], []
+    for password, salt in items:
+        key = password if len(password) <= 64 else hashlib.new(hash_name, password).digest()
+        for i in range(1, nblocks + 1):
+            keys.append(key.ljust(64, b'\0'))
+            u1.append(hmac.new(password, salt + i.to_bytes(4, 'big'), hash_name).digest())
+    lanes = len(keys)
+
+    def words(blobs):
+        return np.frombuffer(b''.join(blobs), dtype='>u4').astype(np.uint32).reshape(lanes, -1).T.copy()
+
+    init = np.array(iv, dtype=np.uint32)[:, None].repeat(lanes, axis=1)
+    key_words = words(keys)
+    inner = compress(init, key_words ^ np.uint32(0x36363636))
+    outer = compress(init, key_words ^ np.uint32(0x5c5c5c5c))
+
+    # One-block message after the 64-byte key block: digest, 0x80, zeros, bit length
+    block = np.zeros((16, lanes), dtype=np.uint32)
+    block[hwords] = 0x80000000
+    block[15] = (64 + hlen) * 8
+
+    u = words(u1)
+    t = u.copy()
+    for _ in range(count - 1):
+        block[:hwords] = u
+        block[:hwords] = compress(inner, block)
+        u = compress(outer, block)
+        t ^= u
+
+    out = t.T.astype('>u4').tobytes()
+    per_item = nblocks * hlen
+    return [out[k * per_item:k * per_item + dklen] for k in range(len(items))]
+
+
+def _run(backend, items, count, dklen, hash_name, workers):
+    if backend == 'numpy':
+        return _pbkdf2_numpy(items, count, dklen, hash_name)
+    jobs = [(pw, salt, count, dklen, hash_name) for pw, salt in items]
+    if backend == 'serial':
+        return [_one(job) for job in jobs]
+    executor = ThreadPoolExecutor if backend == 'threads' else ProcessPoolExecutor
+    with executor(workers) as pool:
+        return list(pool.map(_one, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+
+def choose_backend(n, count, dklen=32, hash_name='sha1', workers=None, sample_count=2000):
+    """Time each backend on a short sample shaped like the batch; return the fastest.
+
+    hashlib backends run a few items per worker at `sample_count`
+    iterations. NumPy throughput depends on the number of lanes, so it runs
+    as many lanes as the real batch (up to 4096) for a few iterations.
+    Fixed costs (pool start-up) are measured separately and added to the
+    extrapolated per-iteration cost of the full batch.
+    """
+    workers = workers or os.cpu_count() or 1
+    key = (min(n, 4096), dklen, hash_name, workers)
+    if key in _choices:
+        return _choices[key]
+    estimates = {}
+    for backend in BACKENDS:
+        if backend in ('threads', 'processes') and workers == 1:
+            continue
+        if backend == 'numpy':
+            m, iterations = min(n, 4096), 20
+        else:
+            m, iterations = min(n, 8 * workers), sample_count
+        sample = [(b'password%d' % i, os.urandom(16)) for i in range(m)]
+        start = perf_counter()
+        _run(backend, sample[:1], 1, dklen, hash_name, workers)
+        fixed = perf_counter() - start
+        start = perf_counter()
+        _run(backend, sample, iterations, dklen, hash_name, workers)
+        per_iter = max(perf_counter() - start - fixed, 1e-9) / (m * iterations)
+        estimates[backend] = fixed + per_iter * n * count
+    _choices[key] = min(estimates, key=estimates.get)
+    return _choices[key]
+
+
+def pbkdf2_batch(items, dklen=32, count=1000000, hash_name='sha1', backend='auto', workers=None):
+    """Derive keys for a list of (password, salt) pairs sharing one cost.
+
+    Output is identical to `Crypto.Protocol.KDF.PBKDF2(password, salt, dklen,
+    count)` (HMAC-SHA1 by default), including Latin-1 encoding of str inputs.
+    """
+    items = [(_to_bytes(pw), _to_bytes(salt)) for pw, salt in items]
+    if not items:
+        return []
+    workers = workers or os.cpu_count() or 1
+    if backend == 'auto':
+        backend = choose_backend(len(items), count, dklen, hash_name, workers)
+    if backend not in BACKENDS:
+        raise ValueError("Unknown PBKDF2 backend %r" % backend)
+    return _run(backend, items, count, dklen, hash_name, workers)
+
+
+def decrypt_hex_blobs(blobs, count=1000000, backend='auto'):
+    """Unlock salt(16) | iv(16) | ciphertext hex blobs for (blob_hex, password) pairs.
+
+    This is the layout written by key-utils.encrypt_key and
+    seedBip.encrypt_seed_phrase. Returns the raw AES-CBC plaintexts; each
+    producer's own padding rules still apply to the result.
+    """
+    raw = [(bytes.fromhex(blob), password) for blob, password in blobs]
+    keys = pbkdf2_batch([(password, data[:16]) for data, password in raw],
+                        count=count, backend=backend)
+    return [AES.new(key, AES.MODE_CBC, data[16:32]).decrypt(data[32:])
+            for key, (data, _) in zip(keys, raw)]
+
+
+def benchmark(n=256, count=20000, hash_name='sha1'):
+    """Print blobs/s for every backend at the given batch size and cost."""
+    items = [(b'password%d' % i, os.urandom(16)) for i in range(n)]
+    workers = os.cpu_count() or 1
+    for backend in BACKENDS:
+        start = perf_counter()
+        pbkdf2_batch(items, count=count, hash_name=hash_name, backend=backend)
+        rate = n / (perf_counter() - start)
+        print("%-10s %8.1f blobs/s at %d iterations (%.2fM iterations/s)"
+              % (backend, rate, count, rate * count / 1e6))
+    print("auto picks: %s" % choose_backend(n, count, 32, hash_name, workers))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,171 @@
+"""
+Multi-lane scrypt (RFC 7914) in NumPy.
+
+Evaluates K passphrases against one salt in lockstep. Every passphrase
+contributes p independent ROMix lanes, and all K * p lanes advance through
+Salsa20/8 and BlockMix together as uint32 arrays with the lane axis last.
+The ROMix scratchpad is a single preallocated (K * p, N, 32 * r) array.
+
+Salsa20/8 runs in the "diagonal" word order used by SIMD implementations,
+where each half-round touches four contiguous rows instead of scattered
+words. Blocks are permuted into that order once on the way in and back
+once on the way out.
+
+Where it pays (see `benchmark`): lockstep lanes remove the per-call
+overhead, but NumPy still pays a few ns per word operation where the C
+`scrypt` package pays well under one. With thousands of lanes at tiny N
+it reaches about half the package's throughput; at the BIP38 parameters
+(N=16384, r=8, p=8) the package is one to two orders of magnitude faster,
+so recovery keeps calling it once per candidate in each worker process.
+"""
+
+import hashlib
+from time import perf_counter
+
+import numpy as np
+
+# Word i of a diagonal-order block is word _DIAG[i] of the canonical block
+_DIAG = np.array([0, 5, 10, 15, 12, 1, 6, 11, 8, 13, 2, 7, 4, 9, 14, 3])
+_UNDIAG = np.argsort(_DIAG)
+
+
+def _rotl(x, n, tmp):
+    np.left_shift(x, n, out=tmp)
+    x >>= 32 - n
+    x |= tmp
+    return x
+
+
+def _quarter(target, a, b, n, s, tmp):
+    # target ^= rotl(a + b, n)
+    np.add(a, b, out=s)
+    target ^= _rotl(s, n, tmp)
+
+
+def _salsa20_8(block):
+    """In-place Salsa20/8 of a (4, 4, L) diagonal-order block (with feedforward)."""
+    x0, x1, x2, x3 = (row.copy() for row in block)
+    s = np.empty_like(x0)
+    tmp = np.empty_like(x0)
+    for _ in range(4):
+        # Column round
+        _quarter(x3, x0, x1, 7, s, tmp)
+        _quarter(x2, x3, x0, 9, s, tmp)
+        _quarter(x1, x2, x3, 13, s, tmp)
+        _quarter(x0, x1, x2, 18, s, tmp)
+        # Row round on rotated rows
+        x1 = np.roll(x1, -1, axis=0)
+        x2 = np.roll(x2, 2, axis=0)
+        x3 = np.roll(x3, 1, axis=0)
+        _quarter(x1, x0, x3, 7, s, tmp)
+        _quarter(x2, x1, x0, 9, s, tmp)
+        _quarter(x3, x2, x1, 13, s, tmp)
+        _quarter(x0, x3, x2, 18, s, tmp)
+        x1 = np.roll(x1, 1, axis=0)
+        x2 = np.roll(x2, 2, axis=0)
+        x3 = np.roll(x3, -1, axis=0)
+    block[0] += x0
+    block[1] += x1
+    block[2] += x2
+    block[3] += x3
+
+
+def _blockmix(B, out):
+    """BlockMix_salsa20/8 of B, shape (2r, 4, 4, L), into `out`."""
+    two_r = B.shape[0]
+    X = B[-1].copy()
+    for i in range(two_r):
+        X ^= B[i]
+        _salsa20_8(X)
+        # Even blocks go to the first half, odd blocks to the second
+        out[i // 2 + (i % 2) * (two_r // 2)] = X
+    return out
+
+
+def _romix(B, N, V):
+    """ROMix over all lanes; B is (2r, 4, 4, L), V is (L, N, 32r)."""
+    lanes = B.shape[-1]
+    lane_idx = np.arange(lanes)
+    X = B
+    Y = np.empty_like(X)
+    for i in range(N):
+        V[:, i, :] = X.reshape(-1, lanes).T
+        _blockmix(X, Y)
+        X, Y = Y, X
+    for _ in range(N):
+        # Integerify: word 0 of the last block (first in diagonal order too)
+        j = X[-1, 0, 0] & np.uint32(N - 1)
+        X ^= V[lane_idx, j].T.reshape(X.shape)
+        _blockmix(X, Y)
+        X, Y = Y, X
+    return X
+
+
+def scrypt_lanes(passphrases, salt, N, r, p, dklen, V=None):
+    """scrypt of every passphrase with one salt, all lanes in lockstep."""
+    if N < 2 or N & (N - 1):
+        raise ValueError("N must be a power of two greater than 1")
+    passphrases = [pw.encode() if isinstance(pw, str) else bytes(pw) for pw in passphrases]
+    K = len(passphrases)
+    lanes = K * p
+    words = 32 * r
+
+    # B: p blocks of 128r bytes per passphrase -> lane k*p + q
+    B = np.empty((lanes, words), dtype=np.uint32)
+    for k, pw in enumerate(passphrases):
+        raw = hashlib.pbkdf2_hmac('sha256', pw, salt, 1, p * 128 * r)
+        B[k * p:(k + 1) * p] = np.frombuffer(raw, dtype='<u4').reshape(p, words)
+
+    # (lanes, 2r, 16) -> diagonal order -> (2r, 4, 4, lanes)
+    X = B.reshape(lanes, 2 * r, 16)[:, :, _DIAG].transpose(1, 2, 0).reshape(2 * r, 4, 4, lanes)
+    X = np.ascontiguousarray(X)
+    if V is None or V.shape[0] < lanes or V.shape[1:] != (N, words):
+        V = np.empty((lanes, N, words), dtype=np.uint32)
+    X = _romix(X, N, V[:lanes])
+
+    out = X.reshape(2 * r, 16, lanes).transpose(2, 0, 1)[:, :, _UNDIAG]
+    out = np.ascontiguousarray(out, dtype='<u4').reshape(K, p * 128 * r // 4)
+    return [hashlib.pbkdf2_hmac('sha256', pw, out[k].tobytes(), 1, dklen)
+            for k, pw in enumerate(passphrases)]
+
+
+def scrypt_batch(passphrases, salt, N=16384, r=8, p=8, dklen=64, batch=8):
+    """scrypt over any number of passphrases, `batch` of them per lockstep run.
+
+    The scratchpad is allocated once and reused: batch * p * N * 128 * r bytes
+    (128 MiB per 8 passphrases at the BIP38 parameters).
+    """
+    V = np.empty((batch * p, N, 32 * r), dtype=np.uint32)
+    results = []
+    for i in range(0, len(passphrases), batch):
+        results += scrypt_lanes(passphrases[i:i + batch], salt, N, r, p, dklen, V)
+    return results
+
+
+def benchmark(configs=((16, 1, 1), (256, 1, 1), (1024, 8, 1)), lane_counts=(1, 16, 256, 2048)):
+    """Print passphrases/s for the scrypt package vs NumPy lanes."""
+    import scrypt
+
+    salt = b'\x01\x02\x03\x04'
+    for N, r, p in configs:
+        per_lane = p * N * 128 * r
+        count = max(1, min(max(lane_counts), (1 << 30) // per_lane))
+        passphrases = [b'candidate%d' % i for i in range(count)]
+
+        start = perf_counter()
+        for pw in passphrases:
+            scrypt.hash(pw, salt, N, r, p, 64)
+        c_rate = count / (perf_counter() - start)
+        print("N=%-6d r=%d p=%d  scrypt package: %10.1f/s" % (N, r, p, c_rate))
+
+        for K in lane_counts:
+            if K > count:
+                continue
+            start = perf_counter()
+            scrypt_batch(passphrases[:K], salt, N, r, p, 64, batch=K)
+            rate = K / (perf_counter() - start)
+            print("%24s NumPy %4d lanes: %10.1f/s (%.2fx)" % ('', K * p, rate, rate / c_rate))
+
+
+if __name__ == '__main__':
+    benchmark()
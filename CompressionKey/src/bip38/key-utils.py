@@ -78,59 +78,60 @@ def copy_decrypted_key():
     root.clipboard_append(decrypted_key_output.get())
     messagebox.showinfo("Copy", "Decrypted private key copied to clipboard.")
 
-# Set up the main UI
-root = tk.Tk()
-root.title("Ethereum Private Key Encrypt/Decrypt Tool")
-root.geometry("600x550")
+if __name__ == "__main__":
+    # Set up the main UI
+    root = tk.Tk()
+    root.title("Ethereum Private Key Encrypt/Decrypt Tool")
+    root.geometry("600x550")
 
-# Encrypt Section
-tk.Label(root, text="Encrypt Ethereum Private Key", font=("Arial", 14)).pack(pady=10)
+    # Encrypt Section
+    tk.Label(root, text="Encrypt Ethereum Private Key", font=("Arial", 14)).pack(pady=10)
 
-tk.Label(root, text="Private Key (Hex, 64 characters):").pack()
-private_key_entry = tk.Entry(root, width=70)
-private_key_entry.pack()
+    tk.Label(root, text="Private Key (Hex, 64 characters):").pack()
+    private_key_entry = tk.Entry(root, width=70)
+    private_key_entry.pack()
 
-tk.Label(root, text="Password:").pack()
-encrypt_password_entry = tk.Entry(root, show="*", width=70)
-encrypt_password_entry.pack()
+    tk.Label(root, text="Password:").pack()
+    encrypt_password_entry = tk.Entry(root, show="*", width=70)
+    encrypt_password_entry.pack()
 
-encrypt_button = tk.Button(root, text="Encrypt", command=encrypt_button_click)
-encrypt_button.pack(pady=10)
+    encrypt_button = tk.Button(root, text="Encrypt", command=encrypt_button_click)
+    encrypt_button.pack(pady=10)
 
-tk.Label(root, text="Encrypted Key:").pack()
-encrypted_key_output = tk.StringVar()
-encrypted_key_label = tk.Entry(root, textvariable=encrypted_key_output, width=70, state="readonly")
-encrypted_key_label.pack()
+    tk.Label(root, text="Encrypted Key:").pack()
+    encrypted_key_output = tk.StringVar()
+    encrypted_key_label = tk.Entry(root, textvariable=encrypted_key_output, width=70, state="readonly")
+    encrypted_key_label.pack()
 
-# Copy button for encrypted key
-copy_encrypted_button = tk.Button(root, text="Copy Encrypted Key", command=copy_encrypted_key)
-copy_encrypted_button.pack(pady=5)
+    # Copy button for encrypted key
+    copy_encrypted_button = tk.Button(root, text="Copy Encrypted Key", command=copy_encrypted_key)
+    copy_encrypted_button.pack(pady=5)
 
-# Decrypt Section
-tk.Label(root, text="Decrypt Encrypted Key", font=("Arial", 14)).pack(pady=20)
+    # Decrypt Section
+    tk.Label(root, text="Decrypt Encrypted Key", font=("Arial", 14)).pack(pady=20)
 
-tk.Label(root, text="Encrypted Key (Hex):").pack()
-bip38_key_entry = tk.Entry(root, width=70)
-bip38_key_entry.pack()
+    tk.Label(root, text="Encrypted Key (Hex):").pack()
+    bip38_key_entry = tk.Entry(root, width=70)
+    bip38_key_entry.pack()
 
-tk.Label(root, text="Password:").pack()
-decrypt_password_entry = tk.Entry(root, show="*", width=70)
-decrypt_password_entry.pack()
+    tk.Label(root, text="Password:").pack()
+    decrypt_password_entry = tk.Entry(root, show="*", width=70)
+    decrypt_password_entry.pack()
 
-decrypt_button = tk.Button(root, text="Decrypt", command=decrypt_button_click)
-decrypt_button.pack(pady=10)
+    decrypt_button = tk.Button(root, text="Decrypt", command=decrypt_button_click)
+    decrypt_button.pack(pady=10)
 
-tk.Label(root, text="Decrypted Private Key:").pack()
-decrypted_key_output = tk.StringVar()
-decrypted_key_label = tk.Entry(root, textvariable=decrypted_key_output, width=70, state="readonly")
-decrypted_key_label.pack()
+    tk.Label(root, text="Decrypted Private Key:").pack()
+    decrypted_key_output = tk.StringVar()
+    decrypted_key_label = tk.Entry(root, textvariable=decrypted_key_output, width=70, state="readonly")
+    decrypted_key_label.pack()
 
-# Copy button for decrypted private key
-copy_decrypted_button = tk.Button(root, text="Copy Decrypted Key", command=copy_decrypted_key)
-copy_decrypted_button.pack(pady=5)
+    # Copy button for decrypted private key
+    copy_decrypted_button = tk.Button(root, text="Copy Decrypted Key", command=copy_decrypted_key)
+    copy_decrypted_button.pack(pady=5)
 
-# Start the main loop
-root.mainloop()
+    # Start the main loop
+    root.mainloop()
 
 
 
@@ -96,54 +96,55 @@ def copy_decrypted_seed():
     root.clipboard_append(decrypted_seed)
     messagebox.showinfo("Copied", "Decrypted seed copied to clipboard!")
 
-# Set up the main UI
-root = tk.Tk()
-root.title("Seed Phrase Encrypt/Decrypt Tool")
-root.geometry("600x600")
+if __name__ == "__main__":
+    # Set up the main UI
+    root = tk.Tk()
+    root.title("Seed Phrase Encrypt/Decrypt Tool")
+    root.geometry("600x600")
 
-# Encrypt Section
-tk.Label(root, text="Encrypt Seed Phrase", font=("Arial", 14)).pack(pady=10)
+    # Encrypt Section
+    tk.Label(root, text="Encrypt Seed Phrase", font=("Arial", 14)).pack(pady=10)
 
-tk.Label(root, text="Seed Phrase:").pack()
-seed_phrase_entry = tk.Text(root, height=5, width=70)
-seed_phrase_entry.pack()
+    tk.Label(root, text="Seed Phrase:").pack()
+    seed_phrase_entry = tk.Text(root, height=5, width=70)
+    seed_phrase_entry.pack()
 
-tk.Label(root, text="Password:").pack()
-encrypt_password_entry = tk.Entry(root, show="*", width=70)
-encrypt_password_entry.pack()
+    tk.Label(root, text="Password:").pack()
+    encrypt_password_entry = tk.Entry(root, show="*", width=70)
+    encrypt_password_entry.pack()
 
-encrypt_button = tk.Button(root, text="Encrypt", command=encrypt_button_click)
-encrypt_button.pack(pady=10)
+    encrypt_button = tk.Button(root, text="Encrypt", command=encrypt_button_click)
+    encrypt_button.pack(pady=10)
 
-tk.Label(root, text="Encrypted Seed:").pack()
-encrypted_seed_output = tk.StringVar()
-encrypted_seed_label = tk.Entry(root, textvariable=encrypted_seed_output, width=70, state="readonly")
-encrypted_seed_label.pack()
+    tk.Label(root, text="Encrypted Seed:").pack()
+    encrypted_seed_output = tk.StringVar()
+    encrypted_seed_label = tk.Entry(root, textvariable=encrypted_seed_output, width=70, state="readonly")
+    encrypted_seed_label.pack()
 
-copy_encrypted_button = tk.Button(root, text="Copy Encrypted Seed", command=copy_encrypted_seed)
-copy_encrypted_button.pack(pady=5)
+    copy_encrypted_button = tk.Button(root, text="Copy Encrypted Seed", command=copy_encrypted_seed)
+    copy_encrypted_button.pack(pady=5)
 
-# Decrypt Section
-tk.Label(root, text="Decrypt Encrypted Seed", font=("Arial", 14)).pack(pady=20)
+    # Decrypt Section
+    tk.Label(root, text="Decrypt Encrypted Seed", font=("Arial", 14)).pack(pady=20)
 
-tk.Label(root, text="Encrypted Seed:").pack()
-encrypted_seed_entry = tk.Entry(root, width=70)
-encrypted_seed_entry.pack()
+    tk.Label(root, text="Encrypted Seed:").pack()
+    encrypted_seed_entry = tk.Entry(root, width=70)
+    encrypted_seed_entry.pack()
 
-tk.Label(root, text="Password:").pack()
-decrypt_password_entry = tk.Entry(root, show="*", width=70)
-decrypt_password_entry.pack()
+    tk.Label(root, text="Password:").pack()
+    decrypt_password_entry = tk.Entry(root, show="*", width=70)
+    decrypt_password_entry.pack()
 
-decrypt_button = tk.Button(root, text="Decrypt", command=decrypt_button_click)
-decrypt_button.pack(pady=10)
+    decrypt_button = tk.Button(root, text="Decrypt", command=decrypt_button_click)
+    decrypt_button.pack(pady=10)
 
-tk.Label(root, text="Decrypted Seed Phrase:").pack()
-decrypted_seed_output = tk.StringVar()
-decrypted_seed_label = tk.Entry(root, textvariable=decrypted_seed_output, width=70, state="readonly")
-decrypted_seed_label.pack()
+    tk.Label(root, text="Decrypted Seed Phrase:").pack()
+    decrypted_seed_output = tk.StringVar()
+    decrypted_seed_label = tk.Entry(root, textvariable=decrypted_seed_output, width=70, state="readonly")
+    decrypted_seed_label.pack()
 
-copy_decrypted_button = tk.Button(root, text="Copy Decrypted Seed", command=copy_decrypted_seed)
-copy_decrypted_button.pack(pady=5)
+    copy_decrypted_button = tk.Button(root, text="Copy Decrypted Seed", command=copy_decrypted_seed)
+    copy_decrypted_button.pack(pady=5)
 
-# Start the main loop
-root.mainloop()
+    # Start the main loop
+    root.mainloop()
@@ -0,0 +1,100 @@
+"""
+Bloom filter over byte strings, backed by a flat bit array.
+
+Used to deduplicate streamed candidates and as a fast negative check in
+front of exact lookups. False positives happen at about `error_rate`;
+false negatives never do.
+"""
+
+import hashlib
+import math
+import mmap
+import struct
+
+import numpy as np
+
+_HEADER = struct.Struct('<4sQQ')
+_MAGIC = b'BLM1'
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=1e-6, num_bits=None, num_hashes=None):
+        capacity = max(int(capacity), 1)
+        if num_bits is None:
+            num_bits = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        # Round up to whole 64-bit words
+        self.num_bits = max(64, (num_bits + 63) // 64 * 64)
+        if num_hashes is None:
+            num_hashes = round(self.num_bits / capacity * math.log(2))
+        self.num_hashes = max(1, int(num_hashes))
+        self.bits = bytearray(self.num_bits // 8)
+
+    def _positions(self, item):
+        # Double hashing: position_i = h1 + i * h2 (Kirsch-Mitzenmacher)
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def add_if_new(self, item):
+        """Add `item` and return True, or return False if it was (probably) present."""
+        positions = self._positions(item)
+        bits = self.bits
+        if all(bits[pos >> 3] & (1 << (pos & 7)) for pos in positions):
+            return False
+        for pos in positions:
+            bits[pos >> 3] |= 1 << (pos & 7)
+        return True
+
+    def _positions_batch(self, items):
+        # Same positions as _positions, reduced mod num_bits first so uint64 cannot wrap
+        digests = np.frombuffer(b''.join(hashlib.blake2b(item, digest_size=16).digest() for item in items),
+                                dtype='<u8').reshape(-1, 2)
+        num_bits = np.uint64(self.num_bits)
+        h1 = digests[:, :1] % num_bits
+        h2 = (digests[:, 1:] | np.uint64(1)) % num_bits
+        return (h1 + np.arange(self.num_hashes, dtype=np.uint64) * h2) % num_bits
+
+    def add_batch(self, items):
+        """Add every item of a sequence of byte strings."""
+        positions = self._positions_batch(items).ravel()
+        bits = np.frombuffer(self.bits, dtype=np.uint8)
+        np.bitwise_or.at(bits, positions >> np.uint64(3), (1 << (positions & np.uint64(7))).astype(np.uint8))
+
+    def contains_batch(self, items):
+        """Boolean array: which items are (probably) present."""
+        positions = self._positions_batch(items)
+        bits = np.frombuffer(self.bits, dtype=np.uint8)
+        return ((bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1).all(axis=1)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, self.num_bits, self.num_hashes))
+            f.write(self.bits)
+
+    @classmethod
+    def load(cls, path, use_mmap=True):
+        """Open a saved filter; with `use_mmap` the bit array is mapped read-only."""
+        with open(path, 'rb') as f:
+            magic, num_bits, num_hashes = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError("%s is not a Bloom filter file" % path)
+        bloom = cls.__new__(cls)
+        bloom.num_bits = num_bits
+        bloom.num_hashes = num_hashes
+        with open(path, 'rb') as f:
+            if use_mmap:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                bloom.bits = memoryview(mapped)[_HEADER.size:_HEADER.size + num_bits // 8]
+            else:
+                f.seek(_HEADER.size)
+                bloom.bits = bytearray(f.read(num_bits // 8))
+        return bloom
@@ -0,0 +1,230 @@
+"""
+Batch BIP32/BIP44 derivation (secp256k1) with cached intermediate nodes.
+
+wallet_utils.py derives one address per call through bip_utils:
+
+    Bip44.FromPrivateKey(key, coin).Purpose().Coin().Account(0).Change(False).AddressIndex(0)
+
+That rebuilds all five levels every time. `Deriver` keeps every node it
+derives in a dict keyed by path, so the hardened purpose/coin/account
+levels and the change node are derived once per wallet. `public_keys`,
+`addresses` and `private_keys` then fan out any set of address indices
+from the cached change node, contiguous or sparse (e.g. player IDs mapped
+to indices).
+
+Each child costs one HMAC-SHA512 over the parent's public key and the
+index, plus P + IL*G in libsecp256k1 (ec_utils.add_generator_multiples).
+That runs through coincurve, the backend bip_utils itself uses. No
+intermediate key objects are built. Results are (n, 33) arrays of
+compressed public keys, (n, 32) arrays of private keys, and lists of
+P2PKH addresses encoded in batch by address_utils.
+"""
+
+import hmac
+import os
+from collections import namedtuple
+from time import perf_counter
+
+import base58
+import coincurve
+import numpy as np
+
+from address_utils import P2PKH_VERSION, base58check_batch, hash160, hash160_batch
+from ec_utils import CURVE_ORDER, add_generator_multiples
+
+HARDENED = 0x80000000
+PURPOSE_BIP44 = 44
+COIN_BITCOIN = 0
+
+# BIP32 serialization versions: xpub/tpub and xprv/tprv
+XPUB_VERSION = bytes.fromhex('0488b21e')
+TPUB_VERSION = bytes.fromhex('043587cf')
+PUBLIC_VERSIONS = (XPUB_VERSION, TPUB_VERSION)
+PRIVATE_VERSIONS = (bytes.fromhex('0488ade4'), bytes.fromhex('04358394'))
+
+
+def p2pkh(public_keys):
+    """P2PKH addresses of an (n, 33) array of compressed public keys."""
+    return base58check_batch(P2PKH_VERSION, hash160_batch(public_keys))
+
+
+class Node(namedtuple('Node', 'private_key public_key chain_code depth parent_fingerprint index')):
+    """One BIP32 node; `private_key` is None for public-only nodes."""
+
+    @property
+    def fingerprint(self):
+        return hash160(self.public_key)[:4]
+
+    def neuter(self):
+        return self._replace(private_key=None)
+
+    def to_xpub(self, version=XPUB_VERSION):
+        """Base58Check BIP32 serialization of the public node."""
+        return base58.b58encode_check(
+            version + bytes([self.depth]) + self.parent_fingerprint + self.index.to_bytes(4, 'big')
+            + self.chain_code + self.public_key).decode()
+
+
+def parse_xpub(xpub):
+    """Public node from an extended public key; extended private keys are refused."""
+    data = base58.b58decode_check(xpub)
+    if len(data) != 78:
+        raise ValueError("Extended keys are 78 bytes, got %d" % len(data))
+    version = data[:4]
+    if version in PRIVATE_VERSIONS:
+        raise ValueError("Refusing an extended private key; pass the xpub")
+    if version not in PUBLIC_VERSIONS:
+        raise ValueError("Unknown extended key version %s" % version.hex())
+    public_key = data[45:]
+    # Validates the point (raises ValueError if it is not on the curve)
+    coincurve.PublicKey(public_key)
+    return Node(None, public_key, data[13:45], data[4], data[5:9], int.from_bytes(data[9:13], 'big'))
+
+
+def _public_key(private_key):
+    return coincurve.PublicKey.from_secret(private_key).format()
+
+
+def master_from_seed(seed):
+    I = hmac.digest(b'Bitcoin seed', seed, 'sha512')
+    return Node(I[:32], _public_key(I[:32]), I[32:], 0, b'\0' * 4, 0)
+
+
+def master_from_private_key(private_key):
+    """A bare private key as a master node with a zero chain code, as bip_utils does."""
+    return Node(private_key, _public_key(private_key), b'\0' * 32, 0, b'\0' * 4, 0)
+
+
+def derive_child(node, index):
+    """CKDpriv for private nodes, CKDpub (non-hardened only) for public ones."""
+    if index & HARDENED:
+        if node.private_key is None:
+            raise ValueError("Hardened derivation needs a private key")
+        data = b'\0' + node.private_key + index.to_bytes(4, 'big')
+    else:
+        data = node.public_key + index.to_bytes(4, 'big')
+    I = hmac.digest(node.chain_code, data, 'sha512')
+    il = int.from_bytes(I[:32], 'big')
+    if il >= CURVE_ORDER:
+        raise ValueError("Invalid child %d; use the next index" % index)
+    if node.private_key is None:
+        private_key = None
+        public_key = coincurve.PublicKey(node.public_key).add(I[:32]).format()
+    else:
+        k = (il + int.from_bytes(node.private_key, 'big')) % CURVE_ORDER
+        if k == 0:
+            raise ValueError("Invalid child %d; use the next index" % index)
+        private_key = k.to_bytes(32, 'big')
+        public_key = _public_key(private_key)
+    return Node(private_key, public_key, I[32:], node.depth + 1, node.fingerprint, index)
+
+
+def _tweaks(node, indices):
+    """HMAC-SHA512 of every non-hardened child: yields (index, IL bytes)."""
+    # The key and the parent public key are the same for every child: hash them once
+    midstate = hmac.new(node.chain_code, node.public_key, 'sha512')
+    for index in indices:
+        index = int(index)
+        if index & HARDENED or index < 0:
+            raise ValueError("Batch derivation takes non-hardened indices, got %d" % index)
+        mac = midstate.copy()
+        mac.update(index.to_bytes(4, 'big'))
+        I = mac.digest()
+        if int.from_bytes(I[:32], 'big') >= CURVE_ORDER:
+            raise ValueError("Invalid child %d; use the next index" % index)
+        yield index, I[:32]
+
+
+def public_children(node, indices):
+    """Compressed public keys of the non-hardened children `indices`, as an (n, 33) array."""
+    out = b''.join(key for _, key in add_generator_multiples(node.public_key, _tweaks(node, indices)))
+    return np.frombuffer(out, dtype=np.uint8).reshape(-1, 33)
+
+
+def private_children(node, indices):
+    """Private keys of the non-hardened children `indices`, as an (n, 32) array."""
+    if node.private_key is None:
+        raise ValueError("Node has no private key")
+    k = int.from_bytes(node.private_key, 'big')
+    out = bytearray()
+    for index, tweak in _tweaks(node, indices):
+        child = (int.from_bytes(tweak, 'big') + k) % CURVE_ORDER
+        if child == 0:
+            raise ValueError("Invalid child %d; use the next index" % index)
+        out += child.to_bytes(32, 'big')
+    return np.frombuffer(bytes(out), dtype=np.uint8).reshape(-1, 32)
+
+
+class Deriver:
+    """BIP44 wallet m/purpose'/coin'/account'/change/index with a node cache."""
+
+    def __init__(self, root, coin=COIN_BITCOIN, purpose=PURPOSE_BIP44):
+        self.root = root
+        self.coin = coin
+        self.purpose = purpose
+        self._nodes = {(): root}
+
+    @classmethod
+    def from_seed(cls, seed, coin=COIN_BITCOIN, purpose=PURPOSE_BIP44):
+        return cls(master_from_seed(seed), coin, purpose)
+
+    @classmethod
+    def from_private_key(cls, private_key, coin=COIN_BITCOIN, purpose=PURPOSE_BIP44):
+        return cls(master_from_private_key(private_key), coin, purpose)
+
+    def node(self, path):
+        """Node at `path` (a tuple of indices), derived from its longest cached prefix."""
+        path = tuple(path)
+        depth = len(path)
+        while path[:depth] not in self._nodes:
+            depth -= 1
+        node = self._nodes[path[:depth]]
+        for i in range(depth, len(path)):
+            node = derive_child(node, path[i])
+            self._nodes[path[:i + 1]] = node
+        return node
+
+    def change_node(self, account=0, change=0):
+        return self.node((self.purpose | HARDENED, self.coin | HARDENED, account | HARDENED, change))
+
+    def public_keys(self, indices, account=0, change=0):
+        return public_children(self.change_node(account, change), indices)
+
+    def private_keys(self, indices, account=0, change=0):
+        return private_children(self.change_node(account, change), indices)
+
+    def addresses(self, indices, account=0, change=0):
+        """(public keys (n, 33), P2PKH addresses) for the given address indices."""
+        public_keys = self.public_keys(indices, account, change)
+        return public_keys, p2pkh(public_keys)
+
+
+def benchmark(n=20000, chain_samples=300):
+    """Addresses/s: bip_utils full chain and cached change node vs `Deriver`."""
+    from bip_utils import Bip44, Bip44Changes, Bip44Coins
+
+    key = os.urandom(32)
+    start = perf_counter()
+    for i in range(chain_samples):
+        (Bip44.FromPrivateKey(key, Bip44Coins.BITCOIN).Purpose().Coin().Account(0)
+         .Change(Bip44Changes.CHAIN_EXT).AddressIndex(i).PublicKey().ToAddress())
+    print("bip_utils, full chain per address: %9.0f addresses/s" % (chain_samples / (perf_counter() - start)))
+
+    change = Bip44.FromPrivateKey(key, Bip44Coins.BITCOIN).Purpose().Coin().Account(0).Change(Bip44Changes.CHAIN_EXT)
+    start = perf_counter()
+    for i in range(chain_samples * 4):
+        change.AddressIndex(i).PublicKey().ToAddress()
+    print("bip_utils, cached change node:     %9.0f addresses/s" % (chain_samples * 4 / (perf_counter() - start)))
+
+    deriver = Deriver.from_private_key(key)
+    start = perf_counter()
+    deriver.addresses(range(n))
+    print("Deriver, contiguous indices:       %9.0f addresses/s" % (n / (perf_counter() - start)))
+    sparse = np.random.default_rng(0).choice(HARDENED, n, replace=False)
+    start = perf_counter()
+    deriver.public_keys(sparse)
+    print("Deriver, sparse indices (pubkeys): %9.0f keys/s" % (n / (perf_counter() - start)))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,206 @@
+"""
+secp256k1 point operations on batches, through libsecp256k1.
+
+coincurve wraps each call in key objects that parse and re-serialize
+their points. Here its cffi handle is called directly with buffers reused
+across the batch. For example, one `secp256k1_ec_pubkey_create` yields
+both the compressed and the uncompressed encoding of a key. If
+coincurve's internals are not importable, everything falls back to its
+public API.
+
+Compression needs no curve arithmetic: the prefix is 2 + the parity of Y,
+set for the whole batch at once. Decompression takes the square root of
+X^3 + 7. libsecp256k1 does it when parsing a compressed key. The pure
+Python fallback raises to the cached exponent (p + 1) / 4, which works
+because p = 3 mod 4. It then flips the roots whose parity does not match
+the prefix. Both directions check that the point lies on the curve, and
+bad rows are reported in a mask instead of failing the batch.
+
+To walk P, P + G, P + 2G, ..., `add_to_each` adds a table of multiples
+of G to one point in affine coordinates. The whole table shares a single
+field inversion (Montgomery's trick), so each point costs a few modular
+multiplications instead of a scalar multiplication.
+"""
+
+import coincurve
+import numpy as np
+
+try:
+    from coincurve._libsecp256k1 import ffi as _ffi, lib as _lib
+    from coincurve.context import GLOBAL_CONTEXT as _CONTEXT
+except ImportError:
+    _lib = None
+
+CURVE_ORDER = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+FIELD_PRIME = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEFFFFFC2F
+# Square root exponent for p = 3 mod 4: y = (x^3 + 7)^((p + 1) / 4)
+_SQRT_EXPONENT = (FIELD_PRIME + 1) // 4
+
+
+def public_keys(secrets, compressed=True, uncompressed=False):
+    """Public keys of 32-byte secrets: (n, 33) and/or (n, 65) uint8 arrays.
+
+    Returns one array, or (compressed, uncompressed) when both are asked
+    for; either way each point is computed once.
+    """
+    secrets = [bytes(s) for s in secrets]
+    short, full = bytearray(), bytearray()
+    if _lib is None:
+        for secret in secrets:
+            key = coincurve.PublicKey.from_secret(secret)
+            short += key.format() if compressed else b''
+            full += key.format(False) if uncompressed else b''
+    else:
+        ctx = _CONTEXT.ctx
+        point = _ffi.new('secp256k1_pubkey *')
+        buf = _ffi.new('unsigned char[65]')
+        size = _ffi.new('size_t *')
+        for secret in secrets:
+            if not _lib.secp256k1_ec_pubkey_create(ctx, point, secret):
+                raise ValueError("Invalid private key")
+            if compressed:
+                size[0] = 33
+                _lib.secp256k1_ec_pubkey_serialize(ctx, buf, size, point, _lib.SECP256K1_EC_COMPRESSED)
+                short += _ffi.buffer(buf, 33)
+            if uncompressed:
+                size[0] = 65
+                _lib.secp256k1_ec_pubkey_serialize(ctx, buf, size, point, _lib.SECP256K1_EC_UNCOMPRESSED)
+                full += _ffi.buffer(buf, 65)
+    out = []
+    if compressed:
+        out.append(np.frombuffer(bytes(short), dtype=np.uint8).reshape(-1, 33))
+    if uncompressed:
+        out.append(np.frombuffer(bytes(full), dtype=np.uint8).reshape(-1, 65))
+    return out[0] if len(out) == 1 else tuple(out)
+
+
+def add_generator_multiples(public_key, tweaks):
+    """Yield (index, P + t*G compressed) for (index, t) in `tweaks`; P is a compressed key.
+
+    t*G takes libsecp256k1's fixed-base multiply and is then combined with
+    P. That is cheaper than tweak_add, which runs the generic multiply.
+    """
+    parent = coincurve.PublicKey(public_key)
+    if _lib is None:
+        for index, tweak in tweaks:
+            yield index, parent.add(tweak).format()
+        return
+    ctx = _CONTEXT.ctx
+    tweak_point = _ffi.new('secp256k1_pubkey *')
+    child = _ffi.new('secp256k1_pubkey *')
+    pair = _ffi.new('secp256k1_pubkey *[2]', [parent.public_key, tweak_point])
+    buf = _ffi.new('unsigned char[33]')
+    size = _ffi.new('size_t *')
+    for index, tweak in tweaks:
+        if not (_lib.secp256k1_ec_pubkey_create(ctx, tweak_point, tweak)
+                and _lib.secp256k1_ec_pubkey_combine(ctx, child, pair, 2)):
+            raise ValueError("Invalid child %d; use the next index" % index)
+        size[0] = 33
+        _lib.secp256k1_ec_pubkey_serialize(ctx, buf, size, child, _lib.SECP256K1_EC_COMPRESSED)
+        yield index, _ffi.buffer(buf, 33)[:]
+
+
+def compress(uncompressed):
+    """(n, 65) uncompressed keys to (n, 33), plus a mask of rows that are valid points."""
+    uncompressed = np.asarray(uncompressed, dtype=np.uint8).reshape(-1, 65)
+    out = np.empty((len(uncompressed), 33), dtype=np.uint8)
+    out[:, 0] = 2 | (uncompressed[:, 64] & 1)
+    out[:, 1:] = uncompressed[:, 1:33]
+    valid = uncompressed[:, 0] == 4
+    raw = uncompressed.tobytes()
+    p = FIELD_PRIME
+    for i in np.flatnonzero(valid):
+        x = int.from_bytes(raw[i * 65 + 1:i * 65 + 33], 'big')
+        y = int.from_bytes(raw[i * 65 + 33:i * 65 + 65], 'big')
+        valid[i] = x < p and y < p and (y * y - x * x * x - 7) % p == 0
+    out[~valid] = 0
+    return out, valid
+
+
+def decompress(compressed):
+    """(n, 33) compressed keys to (n, 65), plus a mask of rows that are valid points."""
+    compressed = np.asarray(compressed, dtype=np.uint8).reshape(-1, 33)
+    if _lib is None:
+        return _decompress_pow(compressed)
+    n = len(compressed)
+    out = np.zeros((n, 65), dtype=np.uint8)
+    valid = np.zeros(n, dtype=bool)
+    ctx = _CONTEXT.ctx
+    point = _ffi.new('secp256k1_pubkey *')
+    buf = _ffi.from_buffer(out)
+    size = _ffi.new('size_t *')
+    raw = compressed.tobytes()
+    for i in range(n):
+        # pubkey_parse checks the prefix and that X^3 + 7 has a root
+        if _lib.secp256k1_ec_pubkey_parse(ctx, point, raw[i * 33:i * 33 + 33], 33):
+            size[0] = 65
+            _lib.secp256k1_ec_pubkey_serialize(ctx, buf + i * 65, size, point, _lib.SECP256K1_EC_UNCOMPRESSED)
+            valid[i] = True
+    return out, valid
+
+
+def _decompress_pow(compressed):
+    n = len(compressed)
+    p = FIELD_PRIME
+    valid = (compressed[:, 0] == 2) | (compressed[:, 0] == 3)
+    ys = bytearray(32 * n)
+    raw = compressed.tobytes()
+    for i in np.flatnonzero(valid):
+        x = int.from_bytes(raw[i * 33 + 1:i * 33 + 33], 'big')
+        rhs = (x * x * x + 7) % p
+        y = pow(rhs, _SQRT_EXPONENT, p)
+        if x >= p or y * y % p != rhs:
+            valid[i] = False
+        else:
+            ys[i * 32:i * 32 + 32] = y.to_bytes(32, 'big')
+    out = np.zeros((n, 65), dtype=np.uint8)
+    out[:, 0] = 4
+    out[:, 1:33] = compressed[:, 1:]
+    out[:, 33:] = np.frombuffer(bytes(ys), dtype=np.uint8).reshape(n, 32)
+    # The root has either parity; take p - y where it differs from the prefix
+    for i in np.flatnonzero(valid & ((out[:, 64] & 1) != (compressed[:, 0] & 1))):
+        y = p - int.from_bytes(ys[i * 32:i * 32 + 32], 'big')
+        out[i, 33:] = np.frombuffer(y.to_bytes(32, 'big'), dtype=np.uint8)
+    out[~valid] = 0
+    return out, valid
+
+
+def affine(public_key):
+    """(x, y) integers of a 33- or 65-byte public key."""
+    if len(public_key) == 33:
+        public_key = coincurve.PublicKey(bytes(public_key)).format(False)
+    return int.from_bytes(public_key[1:33], 'big'), int.from_bytes(public_key[33:65], 'big')
+
+
+def generator_multiples(count):
+    """[(x, y) of i*G for i in 1..count]."""
+    return [affine(coincurve.PublicKey.from_secret(i.to_bytes(32, 'big')).format(False))
+            for i in range(1, count + 1)]
+
+
+def batch_inverse(values, p=FIELD_PRIME):
+    """Modular inverses of all values with one pow(); raises ValueError if any is 0 mod p."""
+    prefix = [0] * len(values)
+    acc = 1
+    for i, v in enumerate(values):
+        prefix[i] = acc
+        acc = acc * v % p
+    inv = pow(acc, -1, p)
+    out = [0] * len(values)
+    for i in range(len(values) - 1, -1, -1):
+        out[i] = prefix[i] * inv % p
+        inv = inv * values[i] % p
+    return out
+
+
+def add_to_each(point, table, p=FIELD_PRIME):
+    """Affine point + every point of `table` as ([x], [y]); no table point may equal +-point."""
+    x, y = point
+    inverses = batch_inverse([tx - x for tx, _ in table], p)
+    xs, ys = [], []
+    for (tx, ty), inv in zip(table, inverses):
+        slope = (ty - y) * inv % p
+        x3 = (slope * slope - x - tx) % p
+        xs.append(x3)
+        ys.append((slope * (x - x3) - y) % p)
+    return xs, ys
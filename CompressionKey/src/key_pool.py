@@ -0,0 +1,174 @@
+"""
+Pool of pre-generated, encrypted player keys.
+
+Onboarding a player used to generate a key, derive its address and run
+`Bip38.encrypt` on the request path. That scrypt call alone takes about
+0.4 s. `KeyPool` keeps a reservoir of finished records (address, public
+key, BIP38-encrypted private key), so `pop` is a deque pop under a lock.
+
+A refill thread drives a process pool, so scrypt never competes with
+request threads for the GIL. Refills use watermarks: when the depth falls
+to `low` the thread submits batches until depth plus in-flight records
+reach `high`, then goes idle. Each batch derives its addresses in one
+address_utils pass. `metrics` reports depth, totals, waits and the refill
+rate; `metrics_text` renders them in the Prometheus text format.
+
+The reservoir lives in memory only. Records still in it at shutdown were
+never issued and are discarded.
+"""
+
+import os
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from address_utils import derive_addresses
+from main import Bip38
+
+PoolRecord = namedtuple('PoolRecord', 'address public_key encrypted_key')
+
+
+def _prepare_batch(job):
+    """`count` fresh keys as PoolRecords; the private keys leave this process encrypted only."""
+    count, password, address_format = job
+    keys = [os.urandom(32) for _ in range(count)]
+    columns = derive_addresses(keys, (address_format,))
+    return [PoolRecord(address, public_key.tobytes(), Bip38.encrypt(key, password, compressed=True))
+            for key, address, public_key in zip(keys, columns[address_format], columns['public_key'])]
+
+
+class KeyPool:
+    def __init__(self, password, low=100, high=1000, batch_size=8, workers=None, address_format='evm'):
+        if not 0 <= low < high:
+            raise ValueError("Need 0 <= low < high")
+        self.low, self.high = low, high
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self._job = (batch_size, password, address_format)
+        self._records = deque()
+        self._cond = threading.Condition()
+        self._refilling = True
+        self._closed = False
+        self._in_flight = 0
+        self._error = None
+        self.prepared = self.issued = self.waits = 0
+        self._busy = 0.0
+        self._thread = threading.Thread(target=self._refiller, daemon=True)
+        self._thread.start()
+
+    def pop(self, timeout=None):
+        """Take one record; waits up to `timeout` seconds if the pool is empty."""
+        with self._cond:
+            if not self._records:
+                self.waits += 1
+                self._refilling = True
+                self._cond.notify_all()
+                if not self._cond.wait_for(lambda: self._records or self._error or self._closed, timeout):
+                    raise TimeoutError("Key pool empty")
+                if self._error is not None:
+                    raise self._error
+                if not self._records:
+                    raise RuntimeError("Key pool closed")
+            record = self._records.popleft()
+            self.issued += 1
+            if len(self._records) <= self.low and not self._refilling:
+                self._refilling = True
+                self._cond.notify_all()
+            return record
+
+    def __len__(self):
+        return len(self._records)
+
+    def fill(self, timeout=None):
+        """Block until the pool is at its high watermark; returns whether it got there."""
+        with self._cond:
+            self._refilling = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: len(self._records) >= self.high or self._error or self._closed,
+                                       timeout) and self._error is None and not self._closed
+
+    def metrics(self):
+        with self._cond:
+            return {
+                'depth': len(self._records),
+                'low': self.low,
+                'high': self.high,
+                'in_flight': self._in_flight,
+                'prepared': self.prepared,
+                'issued': self.issued,
+                'waits': self.waits,
+                'refilling': self._refilling,
+                # Records per second of time with batches in flight
+                'refill_rate': self.prepared / self._busy if self._busy else 0.0,
+            }
+
+    def metrics_text(self, prefix='key_pool'):
+        """`metrics` in the Prometheus text exposition format."""
+        return ''.join("%s_%s %s\n" % (prefix, name, float(value)) for name, value in self.metrics().items())
+
+    def _wanted(self):
+        # Records still to submit before the high watermark is reached
+        return self._refilling and len(self._records) + self._in_flight < self.high
+
+    def _refiller(self):
+        try:
+            with ProcessPoolExecutor(self.workers) as pool:
+                pending = deque()
+                while True:
+                    with self._cond:
+                        self._cond.wait_for(lambda: self._closed or pending or self._wanted())
+                        if self._closed:
+                            for future in pending:
+                                future.cancel()
+                            return
+                        while self._wanted() and len(pending) < 2 * self.workers:
+                            pending.append(pool.submit(_prepare_batch, self._job))
+                            self._in_flight += self.batch_size
+                    start = perf_counter()
+                    records = pending.popleft().result()
+                    with self._cond:
+                        self._busy += perf_counter() - start
+                        self._in_flight -= self.batch_size
+                        self._records.extend(records)
+                        self.prepared += len(records)
+                        if len(self._records) >= self.high:
+                            self._refilling = False
+                        self._cond.notify_all()
+        except Exception as e:
+            with self._cond:
+                self._error = e
+                self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def benchmark(records=32, workers=None):
+    """Onboarding latency: inline preparation vs a pop from a filled pool."""
+    start = perf_counter()
+    _prepare_batch((1, 'benchmark', 'evm'))
+    inline = perf_counter() - start
+    with KeyPool('benchmark', low=records // 4, high=records, workers=workers) as pool:
+        start = perf_counter()
+        pool.fill()
+        print("fill %d records: %.1fs (%.1f records/s)" % (records, perf_counter() - start,
+                                                          pool.metrics()['refill_rate']))
+        start = perf_counter()
+        for _ in range(records // 2):
+            pool.pop()
+        popped = (perf_counter() - start) / (records // 2)
+    print("inline onboarding %.0f ms; pool pop %.1f us" % (inline * 1e3, popped * 1e6))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -2,17 +2,25 @@ import binascii
 import hashlib
 from ecdsa import SigningKey, SECP256k1
 from Crypto.Cipher import AES
+from Crypto.Hash import RIPEMD160, keccak
 from Crypto.Util.Padding import pad, unpad
 import os
+import unicodedata
 import base58
 import scrypt
 
+# Address formats shown for each public key encoding
+ADDRESS_FORMATS = {
+    "Compressed": ('p2pkh', 'p2sh_p2wpkh', 'p2wpkh', 'evm'),
+    "Uncompressed": ('p2pkh_uncompressed', 'evm'),
+}
+
 class Bip38:
     @staticmethod
     def encrypt(private_key, passphrase, compressed=False):
         # Basic BIP38 encryption implementation
         salt = os.urandom(8)
-        key = scrypt.hash(passphrase.encode(), salt, 16384, 8, 8, 64)
+        key = Bip38.derive_key(passphrase, salt)
         
         half1 = key[:32]
         half2 = key[32:]
@@ -32,49 +40,102 @@ class Bip38:
         
         return base58.b58encode(result + checksum).decode()
 
+    @staticmethod
+    def parse(encrypted_key):
+        # Decode the BIP38 key and split it into flag, salt and ciphertext
+        data = base58.b58decode(encrypted_key)
+        
+        # Verify checksum
+        if hashlib.sha256(hashlib.sha256(data[:-4]).digest()).digest()[:4] != data[-4:]:
+            raise ValueError("Invalid checksum")
+        
+        if data[0] != 0x01 or data[1] != 0x42:
+            raise ValueError("Invalid BIP38 key format")
+        
+        flag = data[2]
+        if len(data) == 43:
+            # Standard 6P... key: the salt is the 4-byte addresshash
+            return flag, data[3:7], data[7:39]
+        return flag, data[3:11], data[11:-4]
+
+    @staticmethod
+    def derive_key(passphrase, salt):
+        # BIP38 hashes the UTF-8 of the NFC form, so a passphrase typed with
+        # combining accents derives the same key as its precomposed form
+        if not isinstance(passphrase, str):
+            passphrase = bytes(passphrase)
+            if not passphrase.isascii():
+                try:
+                    passphrase = passphrase.decode('utf-8')
+                except UnicodeDecodeError:
+                    pass
+        if isinstance(passphrase, str):
+            passphrase = unicodedata.normalize('NFC', passphrase).encode('utf-8')
+        return scrypt.hash(passphrase, salt, 16384, 8, 8, 64)
+
+    @staticmethod
+    def decrypt_with_key(flag, salt, encrypted, key, strict=False):
+        half1 = key[:32]
+        half2 = key[32:]
+        is_compressed = bool(flag & 0x20)
+        
+        aes = AES.new(half2, AES.MODE_ECB)
+        decrypted = aes.decrypt(encrypted)
+        
+        if len(salt) == 4:
+            # Standard BIP38: AES output is XORed with the first derived half
+            decrypted = bytes(a ^ b for a, b in zip(decrypted, half1))
+            return decrypted, is_compressed
+        
+        try:
+            decrypted = unpad(decrypted, AES.block_size)
+        except ValueError:
+            if strict:
+                raise
+            # If unpadding fails, try without unpadding
+            pass
+
+        if strict:
+            # `encrypt` pads exactly 32 key bytes, plus 0x01 for compressed keys;
+            # a valid-looking padding alone passes about 1 in 240 wrong passphrases
+            expected = 33 if is_compressed else 32
+            if len(decrypted) != expected or (is_compressed and decrypted[-1] != 0x01):
+                raise ValueError("Unexpected plaintext length, wrong passphrase")
+
+        # Check if compressed flag is present
+        if is_compressed and decrypted[-1] == 0x01:
+            decrypted = decrypted[:-1]
+        
+        # Ensure we have a 32-byte private key
+        if len(decrypted) > 32:
+            decrypted = decrypted[:32]
+        elif len(decrypted) < 32:
+            decrypted = decrypted.rjust(32, b'\x00')
+        
+        return decrypted, is_compressed
+
+    @staticmethod
+    def address_hash(private_key, compressed=False):
+        # First 4 bytes of SHA256(SHA256(P2PKH address)), as stored in standard keys
+        public_key = private_key_to_public_key(private_key, compressed)
+        h160 = RIPEMD160.new(hashlib.sha256(public_key).digest()).digest()
+        payload = b'\x00' + h160
+        checksum = hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4]
+        address = base58.b58encode(payload + checksum)
+        return hashlib.sha256(hashlib.sha256(address).digest()).digest()[:4]
+
     @staticmethod
     def decrypt(encrypted_key, passphrase):
         try:
-            # Decode the BIP38 key
-            data = base58.b58decode(encrypted_key)
-            
-            # Verify checksum
-            if hashlib.sha256(hashlib.sha256(data[:-4]).digest()).digest()[:4] != data[-4:]:
-                raise ValueError("Invalid checksum")
-            
-            # Extract components
-            if data[0] != 0x01 or data[1] != 0x42:
-                raise ValueError("Invalid BIP38 key format")
-            
-            flag = data[2]
-            salt = data[3:11]
-            encrypted = data[11:-4]
+            flag, salt, encrypted = Bip38.parse(encrypted_key)
             
             # Derive key using scrypt
-            key = scrypt.hash(passphrase.encode(), salt, 16384, 8, 8, 64)
-            half1 = key[:32]
-            half2 = key[32:]
-            
-            # Decrypt
-            aes = AES.new(half2, AES.MODE_ECB)
-            decrypted = aes.decrypt(encrypted)
+            key = Bip38.derive_key(passphrase, salt)
             
-            try:
-                decrypted = unpad(decrypted, AES.block_size)
-            except ValueError:
-                # If unpadding fails, try without unpadding
-                pass
+            decrypted, is_compressed = Bip38.decrypt_with_key(flag, salt, encrypted, key)
             
-            # Check if compressed flag is present
-            is_compressed = bool(flag & 0x20)
-            if is_compressed and decrypted[-1] == 0x01:
-                decrypted = decrypted[:-1]
-            
-            # Ensure we have a 32-byte private key
-            if len(decrypted) > 32:
-                decrypted = decrypted[:32]
-            elif len(decrypted) < 32:
-                decrypted = decrypted.rjust(32, b'\x00')
+            if len(salt) == 4 and Bip38.address_hash(decrypted, is_compressed) != salt:
+                raise ValueError("Addresshash mismatch, wrong passphrase")
             
             return decrypted, is_compressed
             
@@ -98,15 +159,29 @@ def private_key_to_public_key(private_key, compressed=False):
     sk = SigningKey.from_string(private_key, curve=SECP256k1)
     vk = sk.verifying_key
     if compressed:
-        return b'\x02' + vk.to_string()[:32] if vk.to_string()[32] % 2 == 0 else b'\x03' + vk.to_string()[:32]
+        return b'\x02' + vk.to_string()[:32] if vk.to_string()[63] % 2 == 0 else b'\x03' + vk.to_string()[:32]
     return b'\x04' + vk.to_string()
 
 def public_key_to_address(public_key):
-    keccak = hashlib.new('keccak256')
-    keccak.update(public_key[1:] if public_key[0] == 0x04 else public_key)
-    return '0x' + keccak.hexdigest()[-40:]
+    # EVM addresses hash X | Y: 33-byte keys are decompressed, 65-byte keys
+    # lose their 0x04 prefix and 64-byte keys are X | Y already
+    if len(public_key) == 33:
+        # Needs numpy and coincurve, which the tkinter and CLI tools do not
+        from ec_utils import decompress
+
+        points, valid = decompress(bytearray(public_key))
+        if not valid[0]:
+            raise ValueError("Invalid public key")
+        public_key = points[0].tobytes()
+    if len(public_key) == 65 and public_key[0] == 0x04:
+        public_key = public_key[1:]
+    elif len(public_key) != 64:
+        raise ValueError("Public key must be 33, 64 or 65 (0x04...) bytes, got %d" % len(public_key))
+    return '0x' + keccak.new(digest_bits=256, data=bytes(public_key)).hexdigest()[-40:]
 
 def main():
+    from address_utils import derive_addresses
+
     print("Ethereum BIP38 Key Compression Tool")
     print("-" * 50)
     
@@ -122,7 +197,9 @@ def main():
     
     if decrypted_private_key is not None:
         try:
-            # Generate keys and addresses for both formats
+            # Generate keys and addresses for both formats; the point and its
+            # hashes are computed once for every chain
+            addresses = derive_addresses([decrypted_private_key])
             results = {}
             for compressed in [False, True]:
                 format_type = "Compressed" if compressed else "Uncompressed"
@@ -131,14 +208,16 @@ def main():
                     "wif": private_key_to_wif(decrypted_private_key, compressed),
                     "bip38": bip38_handler.encrypt(decrypted_private_key, password, compressed)
                 }
-                results[format_type]["address"] = public_key_to_address(results[format_type]["public_key"])
+                results[format_type]["addresses"] = {name: addresses[name][0]
+                                                     for name in ADDRESS_FORMATS[format_type]}
             
             # Output results
             print("\nResults:")
             print("-" * 50)
             for format_type, data in results.items():
                 print(f"\n{format_type} Format:")
-                print(f"Address: {data['address']}")
+                for name, address in data['addresses'].items():
+                    print(f"Address ({name}): {address}")
                 print(f"Public Key (Hex): {binascii.hexlify(data['public_key']).decode()}")
                 print(f"Private Key (WIF): {data['wif']}")
                 print(f"Private Key (BIP38): {data['bip38']}")
@@ -0,0 +1,235 @@
+"""
+Append-only Merkle commitment (a Merkle Mountain Range) on an mmap file.
+
+Leaves are appended in order. Nodes are stored in post-order, so appending
+a leaf writes it plus the parents it completes, and never moves an
+existing node. The tree is a list of perfect "mountains", one per set bit
+of the leaf count. The root commits to the leaf count and every
+mountain's peak:
+
+    leaf   = sha256(0x00 | data)
+    node   = sha256(0x01 | left | right)
+    root   = sha256(0x02 | size (8 bytes, big endian) | peak | peak | ...)
+
+An inclusion proof is the sibling path up to the leaf's mountain plus all
+peaks: O(log n) hashes. The verifier derives each sibling's side from the
+leaf index and size alone, so a proof cannot be replayed for another leaf.
+
+File: a 64-byte header (magic, dirty flag, leaf count at the last flush),
+then 32 bytes per node. Nodes below the flushed count never change on
+append, so after a crash the tree is truncated back to the flushed count
+and re-extended. In-place leaf updates mark the file dirty first, and a
+dirty file has to be rebuilt.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+
+MAGIC = b'MMR1'
+HEADER_SIZE = 64
+HASH_SIZE = 32
+
+_HEADER = struct.Struct('<4sBQ')   # magic, dirty, leaves
+
+
+def leaf_hash(data):
+    return hashlib.sha256(b'\x00' + bytes(data)).digest()
+
+
+def node_hash(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def bag_peaks(size, peaks):
+    return hashlib.sha256(b'\x02' + size.to_bytes(8, 'big') + b''.join(peaks)).digest()
+
+
+def node_count(leaves):
+    return 2 * leaves - bin(leaves).count('1')
+
+
+def leaf_position(index):
+    return 2 * index - bin(index).count('1')
+
+
+def mountains(size):
+    """(first leaf, height, peak position) of every mountain, left to right."""
+    out = []
+    first = pos = 0
+    for height in range(size.bit_length() - 1, -1, -1):
+        if size >> height & 1:
+            pos += (2 << height) - 1
+            out.append((first, height, pos - 1))
+            first += 1 << height
+    return out
+
+
+def _mountain(index, size):
+    """(mountain number, height, index within the mountain) of a leaf."""
+    for k, (first, height, _) in enumerate(mountains(size)):
+        if index < first + (1 << height):
+            return k, height, index - first
+    raise IndexError("Leaf %d out of range for %d leaves" % (index, size))
+
+
+def _parent(pos, height, local):
+    """(sibling, parent) positions of a node at `height` in its mountain."""
+    step = (2 << height) - 1
+    if local >> height & 1:
+        return pos - step, pos + 1
+    return pos + step, pos + step + 1
+
+
+def verify(leaf, index, size, siblings, peaks, root):
+    """Check that `leaf` (a leaf hash) is leaf `index` of the tree with this root."""
+    if len(peaks) != bin(size).count('1'):
+        return False
+    try:
+        k, height, local = _mountain(index, size)
+    except IndexError:
+        return False
+    if len(siblings) != height:
+        return False
+    h = leaf
+    for level, sibling in enumerate(siblings):
+        h = node_hash(sibling, h) if local >> level & 1 else node_hash(h, sibling)
+    return h == peaks[k] and bag_peaks(size, peaks) == root
+
+
+class MerkleLog:
+    """Merkle Mountain Range over appended leaf hashes, kept in `path`."""
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path) or os.path.getsize(path) < HEADER_SIZE:
+            with open(path, 'wb') as f:
+                f.write(_HEADER.pack(MAGIC, 0, 0).ljust(HEADER_SIZE, b'\0'))
+                f.truncate(HEADER_SIZE + 1024 * HASH_SIZE)
+        self._file = open(path, 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        magic, dirty, self.size = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not a Merkle log" % path)
+        # Appends after the last flush may be torn; the flushed prefix is not
+        self.dirty = bool(dirty)
+        self._nodes = node_count(self.size)
+
+    def _node(self, pos):
+        offset = HEADER_SIZE + pos * HASH_SIZE
+        return self._mm[offset:offset + HASH_SIZE]
+
+    def _set(self, pos, h):
+        offset = HEADER_SIZE + pos * HASH_SIZE
+        self._mm[offset:offset + HASH_SIZE] = h
+
+    def _reserve(self, nodes):
+        needed = HEADER_SIZE + nodes * HASH_SIZE
+        if needed > len(self._mm):
+            self._mm.resize(max(needed, 2 * len(self._mm)))
+
+    def truncate(self, size):
+        """Drop leaves from `size` on; earlier nodes are unaffected."""
+        if size > self.size:
+            raise ValueError("Cannot truncate %d leaves to %d" % (self.size, size))
+        self.size = size
+        self._nodes = node_count(size)
+
+    def reset(self):
+        self.truncate(0)
+        self.dirty = False
+
+    def append(self, leaves):
+        """Append leaf hashes, writing each leaf and the parents it completes."""
+        # Work on the peaks in memory and write the new nodes in one go
+        stack = self.peaks()
+        out = bytearray()
+        index = self.size
+        for h in leaves:
+            out += h
+            # Leaf `index` completes one parent per trailing one bit
+            i = index
+            while i & 1:
+                h = node_hash(stack.pop(), h)
+                out += h
+                i >>= 1
+            stack.append(h)
+            index += 1
+        self._reserve(self._nodes + len(out) // HASH_SIZE)
+        offset = HEADER_SIZE + self._nodes * HASH_SIZE
+        self._mm[offset:offset + len(out)] = out
+        self.size = index
+        self._nodes += len(out) // HASH_SIZE
+
+    def update(self, leaves):
+        """Replace leaf hashes ({index: hash}); shared ancestors are rehashed once."""
+        if not leaves:
+            return
+        self._mark_dirty()
+        level = {}
+        for index, h in leaves.items():
+            _, height, local = _mountain(index, self.size)
+            pos = leaf_position(index)
+            self._set(pos, h)
+            if height:
+                level[pos] = (height, local)
+        depth = 0
+        while level:
+            parents = {}
+            for pos, (height, local) in level.items():
+                _, parent = _parent(pos, depth, local)
+                if depth + 1 < height:
+                    parents[parent] = (height, local)
+                else:
+                    parents.setdefault(parent, None)
+            for parent in parents:
+                # Children of a node at depth + 1: right is parent - 1, left is parent - 2^(depth+1)
+                self._set(parent, node_hash(self._node(parent - (2 << depth)), self._node(parent - 1)))
+            level = {pos: v for pos, v in parents.items() if v is not None}
+            depth += 1
+
+    def peaks(self, size=None):
+        return [self._node(pos) for _, _, pos in mountains(self.size if size is None else size)]
+
+    def root(self, size=None):
+        """Root of the first `size` leaves (all by default); appends never change it."""
+        size = self.size if size is None else size
+        return bag_peaks(size, self.peaks(size))
+
+    def proof(self, index, size=None):
+        """(siblings, peaks) proving leaf `index` against `root(size)`."""
+        size = self.size if size is None else size
+        if size > self.size:
+            raise IndexError("Tree has only %d leaves" % self.size)
+        _, height, local = _mountain(index, size)
+        pos = leaf_position(index)
+        siblings = []
+        for level in range(height):
+            sibling, pos = _parent(pos, level, local)
+            siblings.append(self._node(sibling))
+        return siblings, self.peaks(size)
+
+    def leaf(self, index):
+        return self._node(leaf_position(index))
+
+    def _mark_dirty(self):
+        if not self.dirty:
+            self.dirty = True
+            self._mm[4] = 1
+            self._mm.flush(0, mmap.PAGESIZE)
+
+    def flush(self):
+        """Sync the nodes, then record the leaf count (and a clean flag)."""
+        self._mm.flush()
+        _HEADER.pack_into(self._mm, 0, MAGIC, 0, self.size)
+        self._mm.flush(0, mmap.PAGESIZE)
+        self.dirty = False
+
+    def close(self):
+        if self._mm is None:
+            return
+        self.flush()
+        self._mm.close()
+        self._file.close()
+        self._mm = None
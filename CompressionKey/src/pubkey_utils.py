@@ -0,0 +1,110 @@
+"""
+Bulk public key compression and decompression.
+
+Indexers receive public keys as hex, one per line, with 33-byte
+compressed and 65-byte uncompressed keys mixed together. `convert_file`
+streams such a file in batches and writes every key in one encoding. It
+compresses through the Y parity and decompresses through the curve's
+square root (ec_utils.compress / ec_utils.decompress). Every key is
+checked to lie on the curve, including those already in the target
+encoding. Lines that are not valid keys go to an optional rejects file as
+"line<TAB>text" and are left out of the output. Memory stays at one batch
+for any file size.
+"""
+
+import argparse
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from ec_utils import compress, decompress
+
+ENCODINGS = {'compressed': 33, 'uncompressed': 65}
+
+
+def convert(keys, to='compressed'):
+    """Re-encode a list of public keys (bytes, mixed sizes); invalid keys become None."""
+    size = ENCODINGS[to]
+    out = [None] * len(keys)
+    for length, fn in ((33, decompress), (65, compress)):
+        rows = [i for i, key in enumerate(keys) if len(key) == length]
+        if not rows:
+            continue
+        converted, valid = fn(np.frombuffer(b''.join(keys[i] for i in rows), dtype=np.uint8))
+        for i, row, ok in zip(rows, converted, valid):
+            if ok:
+                # Keys already in the target encoding were only validated
+                out[i] = keys[i] if length == size else row.tobytes()
+    return out
+
+
+def _parse(text):
+    try:
+        return bytes.fromhex(text)
+    except ValueError:
+        return b''
+
+
+def convert_file(src, dst, to='compressed', rejects=None, batch_size=65536):
+    """Convert hex keys line by line from `src` into `dst`; returns (converted, rejected)."""
+    converted = rejected = 0
+    with open(src) as fin, open(dst, 'w') as fout, open(rejects or os.devnull, 'w') as frej:
+        line_no = 0
+        while True:
+            batch = []
+            for text in fin:
+                line_no += 1
+                text = text.strip()
+                if text:
+                    batch.append((line_no, text))
+                    if len(batch) >= batch_size:
+                        break
+            if not batch:
+                break
+            results = convert([_parse(text) for _, text in batch], to)
+            fout.writelines(key.hex() + '\n' for key in results if key is not None)
+            bad = [(n, text) for (n, text), key in zip(batch, results) if key is None]
+            frej.writelines("%d\t%s\n" % item for item in bad)
+            converted += len(batch) - len(bad)
+            rejected += len(bad)
+    return converted, rejected
+
+
+def benchmark(n=200_000):
+    """Keys/s converting a mixed file each way."""
+    import tempfile
+
+    from ec_utils import public_keys
+
+    compressed, uncompressed = public_keys([os.urandom(32) for _ in range(n // 10)], uncompressed=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, 'keys.txt')
+        with open(src, 'w') as f:
+            for i in range(n):
+                j = i % len(compressed)
+                f.write((compressed[j] if i % 2 else uncompressed[j]).tobytes().hex() + '\n')
+        for to in ENCODINGS:
+            start = perf_counter()
+            convert_file(src, os.path.join(tmp, to + '.txt'), to)
+            print("to %-12s %9.0f keys/s" % (to, n / (perf_counter() - start)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compress or decompress hex public keys, one per line.")
+    parser.add_argument('src')
+    parser.add_argument('dst')
+    parser.add_argument('--to', choices=sorted(ENCODINGS), default='compressed')
+    parser.add_argument('--rejects', help="Write invalid lines here as 'line<TAB>text'")
+    parser.add_argument('--batch-size', type=int, default=65536)
+    args = parser.parse_args()
+    start = perf_counter()
+    converted, rejected = convert_file(args.src, args.dst, args.to, args.rejects, args.batch_size)
+    elapsed = perf_counter() - start
+    print("%d converted, %d rejected in %.1fs (%.0f keys/s)"
+          % (converted, rejected, elapsed, (converted + rejected) / max(elapsed, 1e-9)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,472 @@
+"""
+ECDSA signing, verification and public key recovery of 32-byte digests.
+
+A relayer signs many digests with a handful of keys. `Signer` keeps a
+context per key in an LRU cache: the secret in a cffi buffer, checked
+once, plus the key's public key and EVM address. Keys come from
+`add_key` or, on a miss, from a `loader(key_id)` callback, for example
+a KeyStorage lookup. After eviction a key is reloaded on its next use.
+
+Signing calls libsecp256k1 directly. Nonces are RFC 6979 deterministic
+(the library default), and s is normalized to the lower half. R = k*G
+uses the library's precomputed fixed-base comb table, built at compile
+time. Signatures are 65 bytes r | s | v with the recovery id v in {0, 1};
+add 27 for Ethereum's legacy v. `sign_many` signs a batch with one
+context lookup and reused output buffers. cffi releases the GIL during
+the call, so threads sharing one Signer sign in parallel.
+
+`Verifier` checks batches of player signatures. libsecp256k1 computes
+u1*G + u2*Q in one simultaneous (Strauss-Shamir) multiplication, with
+precomputed tables for G. Parsing Q means decompressing it, so parsed
+keys of frequent signers stay in an LRU cache. `recover_many` is
+ecrecover for a batch, and `recover_addresses` hashes the recovered keys
+with one batched keccak. It then compares them to expected EVM addresses,
+as produced by main.public_key_to_address.
+
+With a `NoncePool`, signing skips the k*G multiplication. The pool
+precomputes random nonces during idle time as (k^-1, r, recovery bits)
+and hands each one out exactly once. A signature is then
+s = k^-1 (z + r*d) mod n, two multiplications. These nonces come from
+the OS CSPRNG rather than RFC 6979, since a deterministic nonce depends
+on the message. Each k is independent: nonces related by known offsets
+would reveal the key. A forked child never sees its parent's nonces,
+because the pool empties itself in the child. When the pool runs dry,
+signing falls back to libsecp256k1.
+"""
+
+import os
+import secrets
+import threading
+import weakref
+from collections import OrderedDict, deque, namedtuple
+from time import perf_counter
+
+import coincurve
+import numpy as np
+
+from address_utils import derive_addresses, keccak_addresses
+from ec_utils import CURVE_ORDER, public_keys
+
+try:
+    from coincurve._libsecp256k1 import ffi as _ffi, lib as _lib
+    from coincurve.context import GLOBAL_CONTEXT as _CONTEXT
+except ImportError:
+    _lib = None
+
+KeyContext = namedtuple('KeyContext', 'secret scalar public_key address')
+
+
+def _context(secret):
+    secret = bytes(secret)
+    if len(secret) != 32 or not 0 < int.from_bytes(secret, 'big') < CURVE_ORDER:
+        raise ValueError("Invalid private key")
+    columns = derive_addresses([secret], ('evm',))
+    handle = _ffi.new('unsigned char[32]', secret) if _lib is not None else coincurve.PrivateKey(secret)
+    return KeyContext(handle, int.from_bytes(secret, 'big'), columns['public_key'][0].tobytes(), columns['evm'][0])
+
+
+class Signer:
+    def __init__(self, loader=None, capacity=64, nonce_pool=None):
+        self.loader = loader
+        self.capacity = capacity
+        self.nonce_pool = nonce_pool
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def add_key(self, key_id, secret):
+        """Cache the context of `secret` under `key_id`."""
+        context = _context(secret)
+        with self._lock:
+            self._put(key_id, context)
+        return context
+
+    def _put(self, key_id, context):
+        self._contexts[key_id] = context
+        self._contexts.move_to_end(key_id)
+        while len(self._contexts) > self.capacity:
+            self._contexts.popitem(last=False)
+
+    def context(self, key_id):
+        with self._lock:
+            context = self._contexts.get(key_id)
+            if context is not None:
+                self._contexts.move_to_end(key_id)
+                self.hits += 1
+                return context
+            self.misses += 1
+        if self.loader is None:
+            raise KeyError("Key %r is not loaded" % (key_id,))
+        context = _context(self.loader(key_id))
+        with self._lock:
+            self._put(key_id, context)
+        return context
+
+    def public_key(self, key_id):
+        return self.context(key_id).public_key
+
+    def address(self, key_id):
+        return self.context(key_id).address
+
+    def sign(self, key_id, digest):
+        """65-byte r | s | v signature of a 32-byte digest."""
+        return self.sign_many(key_id, [digest])[0].tobytes()
+
+    def sign_many(self, key_id, digests):
+        """Signatures of a sequence (or (n, 32) array) of digests, as an (n, 65) array."""
+        context = self.context(key_id)
+        secret, pool = context.secret, self.nonce_pool
+        out = np.empty((len(digests), 65), dtype=np.uint8)
+        if _lib is not None:
+            ctx = _CONTEXT.ctx
+            sig = _ffi.new('secp256k1_ecdsa_recoverable_signature *')
+            recid = _ffi.new('int *')
+            buf = _ffi.from_buffer(out)
+        for i, digest in enumerate(digests):
+            digest = bytes(digest)
+            if len(digest) != 32:
+                raise ValueError("Digest %d is not 32 bytes" % i)
+            nonce = pool.take() if pool is not None else None
+            if nonce is not None:
+                out[i] = np.frombuffer(_sign_with_nonce(context.scalar, digest, nonce), dtype=np.uint8)
+            elif _lib is None:
+                out[i] = np.frombuffer(secret.sign_recoverable(digest, hasher=None), dtype=np.uint8)
+            else:
+                if not _lib.secp256k1_ecdsa_sign_recoverable(ctx, sig, digest, secret, _ffi.NULL, _ffi.NULL):
+                    raise ValueError("Signing failed")
+                _lib.secp256k1_ecdsa_recoverable_signature_serialize_compact(ctx, buf + i * 65, recid, sig)
+                out[i, 64] = recid[0]
+        return out
+
+
+def _sign_with_nonce(d, digest, nonce):
+    k_inv, r, v = nonce
+    s = k_inv * (int.from_bytes(digest, 'big') + r * d) % CURVE_ORDER
+    if s > CURVE_ORDER // 2:
+        # -s is the signature of -k, whose R has the opposite y parity
+        s, v = CURVE_ORDER - s, v ^ 1
+    return r.to_bytes(32, 'big') + s.to_bytes(32, 'big') + bytes([v])
+
+
+_nonce_pools = weakref.WeakSet()
+
+
+def _after_fork():
+    for pool in list(_nonce_pools):
+        pool._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class NoncePool:
+    """One-time ECDSA nonces (k^-1, r, recovery bits), refilled by a background thread."""
+
+    def __init__(self, low=1024, high=8192, batch_size=256):
+        if not 0 <= low < high:
+            raise ValueError("Need 0 <= low < high")
+        self.low, self.high = low, high
+        self.batch_size = batch_size
+        self._closed = False
+        self._reset()
+        _nonce_pools.add(self)
+
+    def _reset(self):
+        # Also runs in a forked child: nothing of the parent's pool, lock or thread is kept
+        self._nonces = deque()
+        self._cond = threading.Condition()
+        self._refilling = True
+        self._pid = os.getpid()
+        self.taken = self.generated = self.misses = 0
+        self._thread = None
+
+    def _start(self):
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._refiller, daemon=True)
+            self._thread.start()
+
+    def take(self):
+        """A nonce nobody else gets, or None if the pool is empty."""
+        if self._pid != os.getpid():
+            self._reset()
+        with self._cond:
+            self._start()
+            if len(self._nonces) <= self.low and not self._refilling:
+                self._refilling = True
+                self._cond.notify_all()
+            if not self._nonces:
+                self.misses += 1
+                return None
+            self.taken += 1
+            return self._nonces.popleft()
+
+    def __len__(self):
+        return len(self._nonces)
+
+    def fill(self, timeout=None):
+        """Block until the pool is at its high watermark."""
+        with self._cond:
+            self._start()
+            self._refilling = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: len(self._nonces) >= self.high or self._closed, timeout)
+
+    def _refiller(self):
+        cond = self._cond
+        while True:
+            with cond:
+                cond.wait_for(lambda: self._closed or (self._refilling and len(self._nonces) < self.high))
+                if self._closed or cond is not self._cond:
+                    return
+                count = min(self.batch_size, self.high - len(self._nonces))
+            nonces = _generate_nonces(count)
+            with cond:
+                if self._closed or cond is not self._cond:
+                    return
+                self._nonces.extend(nonces)
+                self.generated += len(nonces)
+                if len(self._nonces) >= self.high:
+                    self._refilling = False
+                cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._nonces.clear()
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _generate_nonces(count):
+    ks = [secrets.randbelow(CURVE_ORDER - 1) + 1 for _ in range(count)]
+    points = public_keys([k.to_bytes(32, 'big') for k in ks], compressed=False, uncompressed=True)
+    nonces = []
+    for k, point in zip(ks, points):
+        x = int.from_bytes(point[1:33].tobytes(), 'big')
+        r = x % CURVE_ORDER
+        if r:
+            nonces.append((pow(k, -1, CURVE_ORDER), r, (int(point[64]) & 1) | (2 if x >= CURVE_ORDER else 0)))
+    return nonces
+
+
+class Verifier:
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def _parsed(self, public_key):
+        public_key = bytes(public_key)
+        with self._lock:
+            parsed = self._keys.get(public_key)
+            if parsed is not None:
+                self._keys.move_to_end(public_key)
+                self.hits += 1
+                return parsed
+            self.misses += 1
+        parsed = _ffi.new('secp256k1_pubkey *')
+        if not _lib.secp256k1_ec_pubkey_parse(_CONTEXT.ctx, parsed, public_key, len(public_key)):
+            parsed = False
+        with self._lock:
+            self._keys[public_key] = parsed
+            while len(self._keys) > self.capacity:
+                self._keys.popitem(last=False)
+        return parsed
+
+    def verify(self, public_key, digest, signature, allow_high_s=False):
+        return bool(self.verify_many([public_key], [digest], [signature], allow_high_s)[0])
+
+    def verify_many(self, public_keys, digests, signatures, allow_high_s=False):
+        """Boolean array: which (public key, digest, 64/65-byte r | s [| v] signature) triples verify.
+
+        Signatures with s in the upper half fail unless `allow_high_s`.
+        """
+        valid = np.zeros(len(digests), dtype=bool)
+        if _lib is None:
+            for i, (public_key, digest, signature) in enumerate(zip(public_keys, digests, signatures)):
+                signature = bytes(signature)
+                if len(signature) in (64, 65):
+                    valid[i] = _verify_slow(bytes(public_key), bytes(digest), signature[:64], allow_high_s)
+            return valid
+        ctx = _CONTEXT.ctx
+        sig = _ffi.new('secp256k1_ecdsa_signature *')
+        for i, (public_key, digest, signature) in enumerate(zip(public_keys, digests, signatures)):
+            digest, signature = bytes(digest), bytes(signature)
+            # parse_compact always reads 64 bytes, so short input must not reach it
+            if len(digest) != 32 or len(signature) not in (64, 65):
+                continue
+            parsed = self._parsed(public_key)
+            if not parsed or not _lib.secp256k1_ecdsa_signature_parse_compact(ctx, sig, signature[:64]):
+                continue
+            if allow_high_s:
+                _lib.secp256k1_ecdsa_signature_normalize(ctx, sig, sig)
+            valid[i] = _lib.secp256k1_ecdsa_verify(ctx, sig, digest, parsed) == 1
+        return valid
+
+
+def _verify_slow(public_key, digest, signature, allow_high_s):
+    from ecdsa import SECP256k1, BadSignatureError, VerifyingKey
+    from ecdsa.util import sigdecode_string
+
+    if not allow_high_s and int.from_bytes(signature[32:64], 'big') > CURVE_ORDER // 2:
+        return False
+    try:
+        return VerifyingKey.from_string(public_key, curve=SECP256k1).verify_digest(
+            signature[:64], digest, sigdecode=sigdecode_string)
+    except (BadSignatureError, ValueError, AssertionError):
+        return False
+
+
+def recover_many(digests, signatures):
+    """ecrecover of 65-byte r | s | v signatures: ((n, 65) uncompressed keys, valid mask).
+
+    v may be 0/1 or Ethereum's 27/28.
+    """
+    n = len(digests)
+    out = np.zeros((n, 65), dtype=np.uint8)
+    valid = np.zeros(n, dtype=bool)
+    if _lib is not None:
+        ctx = _CONTEXT.ctx
+        rsig = _ffi.new('secp256k1_ecdsa_recoverable_signature *')
+        point = _ffi.new('secp256k1_pubkey *')
+        size = _ffi.new('size_t *')
+        buf = _ffi.from_buffer(out)
+    for i, (digest, signature) in enumerate(zip(digests, signatures)):
+        digest, signature = bytes(digest), bytes(signature)
+        if len(digest) != 32 or len(signature) != 65:
+            continue
+        v = signature[64] - 27 if signature[64] >= 27 else signature[64]
+        if not 0 <= v <= 3:
+            continue
+        if _lib is None:
+            try:
+                key = coincurve.PublicKey.from_signature_and_message(signature[:64] + bytes([v]), digest,
+                                                                     hasher=None)
+            except Exception:
+                continue
+            out[i] = np.frombuffer(key.format(False), dtype=np.uint8)
+            valid[i] = True
+        elif (_lib.secp256k1_ecdsa_recoverable_signature_parse_compact(ctx, rsig, signature[:64], v)
+              and _lib.secp256k1_ecdsa_recover(ctx, point, rsig, digest)):
+            size[0] = 65
+            _lib.secp256k1_ec_pubkey_serialize(ctx, buf + i * 65, size, point, _lib.SECP256K1_EC_UNCOMPRESSED)
+            valid[i] = True
+    return out, valid
+
+
+def recover_addresses(digests, signatures, addresses):
+    """Boolean array: which signatures recover to the expected EVM address.
+
+    Addresses are 40 hex digits, with or without '0x', or 20 bytes; anything else never matches.
+    """
+    expected = np.zeros((len(addresses), 20), dtype=np.uint8)
+    known = np.zeros(len(addresses), dtype=bool)
+    for i, address in enumerate(addresses):
+        if isinstance(address, str):
+            digits = address[2:] if address[:2].lower() == '0x' else address
+            try:
+                raw = bytes.fromhex(digits)
+            except ValueError:
+                continue
+        else:
+            raw = bytes(address)
+        if len(raw) == 20:
+            expected[i] = np.frombuffer(raw, dtype=np.uint8)
+            known[i] = True
+    keys, valid = recover_many(digests, signatures)
+    return known & valid & (keccak_addresses(keys) == expected).all(axis=1)
+
+
+def _percentiles(samples, points=(50, 90, 99, 99.9)):
+    values = np.percentile(np.array(samples) * 1e6, points)
+    return ', '.join("p%s %.1f us" % (p, v) for p, v in zip(points, values))
+
+
+def benchmark(n=20000, keys=4):
+    """Signatures/s and sign() latency percentiles against per-call key objects and python-ecdsa."""
+    from ecdsa import SECP256k1, SigningKey
+
+    secret_keys = [os.urandom(32) for _ in range(keys)]
+    signer = Signer(loader=secret_keys.__getitem__, capacity=keys)
+    digests = [os.urandom(32) for _ in range(n)]
+    latencies = []
+    for i, digest in enumerate(digests):
+        start = perf_counter()
+        signer.sign(i % keys, digest)
+        latencies.append(perf_counter() - start)
+    print("sign          %9.0f sigs/s; %s" % (n / sum(latencies), _percentiles(latencies)))
+    start = perf_counter()
+    for k in range(keys):
+        signer.sign_many(k, digests[k::keys])
+    print("sign_many     %9.0f sigs/s" % (n / (perf_counter() - start)))
+    start = perf_counter()
+    for i, digest in enumerate(digests[:n // 4]):
+        coincurve.PrivateKey(secret_keys[i % keys]).sign_recoverable(digest, hasher=None)
+    print("key per call  %9.0f sigs/s" % (n // 4 / (perf_counter() - start)))
+    sks = [SigningKey.from_string(s, curve=SECP256k1) for s in secret_keys]
+    start = perf_counter()
+    for i, digest in enumerate(digests[:n // 50]):
+        sks[i % keys].sign_digest_deterministic(digest)
+    print("python-ecdsa  %9.0f sigs/s" % (n // 50 / (perf_counter() - start)))
+
+
+def benchmark_verify(n=20000, signers=16):
+    """Verifications/s with and without the key cache, recoveries/s, and python-ecdsa for scale."""
+    from ecdsa import SECP256k1, VerifyingKey
+    from ecdsa.util import sigdecode_string
+
+    signer = Signer(capacity=signers)
+    for k in range(signers):
+        signer.add_key(k, os.urandom(32))
+    digests = [os.urandom(32) for _ in range(n)]
+    signatures = np.concatenate([signer.sign_many(k, digests[k::signers]) for k in range(signers)])
+    digests = [d for k in range(signers) for d in digests[k::signers]]
+    owners = [k for k in range(signers) for _ in digests[k::signers]]
+    public_keys = [signer.public_key(k) for k in owners]
+    for label, verifier in (("cached keys", Verifier()), ("no key cache", Verifier(capacity=0))):
+        start = perf_counter()
+        assert verifier.verify_many(public_keys, digests, signatures).all()
+        print("verify_many, %-12s %9.0f sigs/s" % (label, n / (perf_counter() - start)))
+    start = perf_counter()
+    assert recover_addresses(digests, signatures, [signer.address(k) for k in owners]).all()
+    print("recover_addresses         %9.0f sigs/s" % (n / (perf_counter() - start)))
+    sample = n // 50
+    vks = [VerifyingKey.from_string(signer.public_key(k), curve=SECP256k1) for k in range(signers)]
+    start = perf_counter()
+    for owner, digest, signature in zip(owners[:sample], digests, signatures):
+        vks[owner].verify_digest(signature[:64].tobytes(), digest, sigdecode=sigdecode_string)
+    print("python-ecdsa              %9.0f sigs/s" % (sample / (perf_counter() - start)))
+
+
+def benchmark_nonce_pool(n=20000):
+    """sign() latency percentiles with and without a filled nonce pool."""
+    secret = os.urandom(32)
+    digests = [os.urandom(32) for _ in range(n)]
+    with NoncePool(low=0, high=n + 1, batch_size=4096) as pool:
+        start = perf_counter()
+        pool.fill()
+        print("pool fill               %9.0f nonces/s" % (n / (perf_counter() - start)))
+        for label, nonce_pool in (("libsecp256k1 nonce", None), ("nonce pool", pool)):
+            signer = Signer(nonce_pool=nonce_pool)
+            signer.add_key(0, secret)
+            latencies = []
+            for digest in digests:
+                start = perf_counter()
+                signer.sign(0, digest)
+                latencies.append(perf_counter() - start)
+            print("sign, %-18s %9.0f sigs/s; %s" % (label, n / sum(latencies), _percentiles(latencies)))
+
+
+if __name__ == '__main__':
+    benchmark()
+    benchmark_verify()
+    benchmark_nonce_pool()
@@ -0,0 +1,147 @@
+"""
+Vanity EVM address search.
+
+Trying random keys costs a full scalar multiplication per attempt. Here
+a job picks one random key k and walks k, k+1, k+2, ...: batches of
+points P + G .. P + mG are added to the current point with a single
+field inversion (ec_utils.add_to_each). The batch's X | Y encodings are
+hashed together by address_utils.keccak256_batch, and the prefix is
+compared on the digests as a NumPy array. The table of multiples of G is
+built once per process.
+
+Jobs go to a process pool with a bounded number in flight, and the first
+match wins. A prefix of n hex digits takes 16^n attempts on average.
+`search` reports the running rate and the expected time left through a
+callback.
+"""
+
+import argparse
+import os
+import secrets
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import numpy as np
+
+from address_utils import derive_addresses, keccak256_batch
+from ec_utils import CURVE_ORDER, add_to_each, affine, generator_multiples, public_keys
+
+_tables = {}
+
+
+def _parse_prefix(prefix):
+    digits = prefix[2:] if prefix[:2].lower() == '0x' else prefix
+    try:
+        int(digits or '0', 16)
+    except ValueError:
+        raise ValueError("Prefix %r is not hexadecimal; EVM addresses use only 0-9 and a-f" % prefix) from None
+    return digits.lower()
+
+
+def expected_attempts(prefix):
+    return 16 ** len(_parse_prefix(prefix))
+
+
+def _matcher(digits):
+    whole = np.frombuffer(bytes.fromhex(digits[:len(digits) // 2 * 2]), dtype=np.uint8)
+    nibble = int(digits[-1], 16) if len(digits) % 2 else None
+
+    def match(addresses):
+        hits = (addresses[:, :len(whole)] == whole).all(axis=1)
+        if nibble is not None:
+            hits &= addresses[:, len(whole)] >> 4 == nibble
+        return hits
+    return match
+
+
+def _search_job(job):
+    """Walk `batches` batches from a random key; returns (private key or None, attempts)."""
+    digits, batch_size, batches = job
+    if batch_size not in _tables:
+        _tables[batch_size] = generator_multiples(batch_size)
+    table = _tables[batch_size]
+    match = _matcher(digits)
+    # Leave room so k + steps never wraps the group order
+    k = secrets.randbelow(CURVE_ORDER - batch_size * batches - 1) + 1
+    point = affine(public_keys([k.to_bytes(32, 'big')])[0].tobytes())
+    if match(keccak256_batch(np.frombuffer(point[0].to_bytes(32, 'big') + point[1].to_bytes(32, 'big'),
+                                           dtype=np.uint8).reshape(1, 64))[:, 12:])[0]:
+        return k.to_bytes(32, 'big'), 1
+    for done in range(batches):
+        xs, ys = add_to_each(point, table)
+        raw = b''.join(x.to_bytes(32, 'big') + y.to_bytes(32, 'big') for x, y in zip(xs, ys))
+        digests = keccak256_batch(np.frombuffer(raw, dtype=np.uint8).reshape(-1, 64))
+        hits = np.flatnonzero(match(digests[:, 12:]))
+        if len(hits):
+            return (k + int(hits[0]) + 1).to_bytes(32, 'big'), 1 + done * batch_size + int(hits[0]) + 1
+        k += batch_size
+        point = xs[-1], ys[-1]
+    return None, 1 + batches * batch_size
+
+
+def search(prefix, workers=None, batch_size=4096, batches_per_job=16, progress=None):
+    """Find a key whose EVM address starts with `prefix`; returns (private key, address, attempts).
+
+    `progress(attempts, rate, expected_seconds_left)` is called after every job.
+    """
+    digits = _parse_prefix(prefix)
+    expected = expected_attempts(prefix)
+    workers = workers or os.cpu_count() or 1
+    job = (digits, batch_size, batches_per_job)
+    attempts = 0
+    start = perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque(pool.submit(_search_job, job) for _ in range(2 * workers))
+        while True:
+            key, tried = pending.popleft().result()
+            attempts += tried
+            if progress is not None:
+                rate = attempts / max(perf_counter() - start, 1e-9)
+                progress(attempts, rate, max(expected - attempts, 0) / rate)
+            if key is not None:
+                for future in pending:
+                    future.cancel()
+                address = derive_addresses([key], ('evm',))['evm'][0]
+                return key, address, attempts
+            pending.append(pool.submit(_search_job, job))
+
+
+def benchmark(batches=8, batch_size=4096):
+    """Attempts/s: incremental batches vs a full scalar multiplication per key."""
+    digits = 'f' * 40  # never matches, so every job runs to the end
+    _search_job((digits, batch_size, 1))
+    start = perf_counter()
+    _, tried = _search_job((digits, batch_size, batches))
+    ours = tried / (perf_counter() - start)
+    keys = [os.urandom(32) for _ in range(5000)]
+    start = perf_counter()
+    derive_addresses(keys, ('evm',))
+    full = len(keys) / (perf_counter() - start)
+    print("incremental  %9.0f attempts/s per core" % ours)
+    print("random keys  %9.0f attempts/s per core" % full)
+    for n in range(4, 9):
+        print("%d hex digits: %.1fs expected per core" % (n, 16 ** n / ours))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search for an EVM address with a given hex prefix.")
+    parser.add_argument('prefix', help="Hex digits, with or without 0x")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    try:
+        _parse_prefix(args.prefix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    def report(attempts, rate, left):
+        print("\r%d attempts, %.0f/s, ~%.0fs expected left   " % (attempts, rate, left), end='', file=sys.stderr)
+    key, address, attempts = search(args.prefix, args.workers, progress=report)
+    print(file=sys.stderr)
+    print("Address: %s" % address)
+    print("Private key: %s" % key.hex())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+"""
+Streaming migration of legacy vault blobs into one format.
+
+Four producers wrote password-encrypted blobs. All of them are
+salt(16) | iv(16) | AES-256-CBC ciphertext, keyed with
+PBKDF2-HMAC-SHA1(password, salt, 1000000):
+
+    seedbip       seedBip.encrypt_seed_phrase         hex; UTF-8 text padded with 1-32 zero bytes
+    keyutils      key-utils.encrypt_key               hex; one 32-byte private key, no padding
+    seedtophrase  seedtophrase.encrypt_seed_phrase    BIP39 words; padded like seedbip
+    seedtoseed    Seedtoseed.encrypt_to_24_word_mnemonic
+                                                      BIP39 words; PKCS#7, UTF-8 password,
+                                                      plaintext is the input mnemonic's bytes
+
+A 64-byte hex blob is either a keyutils key or a short seedbip phrase.
+After decryption, a plaintext that ends in zero bytes and holds printable
+UTF-8 is read as seedbip, anything else as keyutils. keyutils has no
+padding, so a wrong password there cannot be detected. The stock
+`decrypt_key` strips trailing zero bytes from the key; the migration keeps
+all 32 bytes.
+
+Both word producers keep only the first 24 words (33 bytes) of a blob of
+at least 64 bytes. The ciphertext is gone, so those lines are reported as
+truncated. Longer word lists are decoded under both producers' rules.
+
+The output format is one hex string:
+
+    version(1) | kind(1) | iterations(4, big endian) | salt(16) | nonce(12) | AES-256-GCM ciphertext | tag(16)
+
+The key is PBKDF2-HMAC-SHA256(password, salt, iterations), and the first
+22 bytes are authenticated as associated data. `open_blob` reverses it.
+`seal_legacy` still writes the two hex legacy formats, for blobs that
+must stay readable by the old tools.
+
+`migrate` streams the input one line at a time: a blob, optionally
+followed by a tab and that blob's password. Each line costs two
+full-strength KDFs, so lines go to a process pool with a bounded number
+in flight. Results are written in input order as JSON lines. keyutils
+blobs decrypt to something under any password, so they are reported as
+"unverified" rather than "migrated": check them before dropping the
+originals. Every
+`checkpoint_every` lines the output is synced and the input/output
+offsets are saved, so an interrupted run resumes from the last checkpoint.
+Memory stays flat whatever the input size.
+"""
+
+import argparse
+import getpass
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import unpad
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BruteForceTest'))
+
+from keyspace import write_state
+
+VERSION = 1
+ITERATIONS = 1000000
+LEGACY_ITERATIONS = 1000000
+
+KIND_PRIVATE_KEY = 0
+KIND_TEXT = 1
+KIND_MNEMONIC_BYTES = 2
+
+FORMATS = ('seedbip', 'keyutils', 'seedtophrase', 'seedtoseed')
+
+_HEADER_SIZE = 22
+
+
+def _load_wordlist():
+    # word_list.py lives next to the word producers, outside any package
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bip38seed', 'SeedGen', 'word_list.py')
+    spec = importlib.util.spec_from_file_location('word_list', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.BIP39_WORDLIST
+
+
+WORDLIST = _load_wordlist()
+_WORD_INDEX = {word: i for i, word in enumerate(WORDLIST)}
+
+
+def words_to_bytes(words):
+    """11 bits per word, truncated to whole bytes (both word producers' decoding)."""
+    value = 0
+    for word in words:
+        value = value << 11 | _WORD_INDEX[word]
+    bits = 11 * len(words)
+    return (value >> bits % 8).to_bytes(bits // 8, 'big')
+
+
+def detect(blob):
+    """Producer family of a blob: 'hex64', 'seedbip', 'words', 'truncated' or None.
+
+    'hex64' is keyutils or a short seedbip phrase; 'words' is seedtophrase
+    or seedtoseed. Both are settled by decrypting.
+    """
+    blob = blob.strip()
+    try:
+        data = bytes.fromhex(blob)
+    except ValueError:
+        words = blob.lower().split()
+        if not words or any(word not in _WORD_INDEX for word in words):
+            return None
+        return 'words' if 11 * len(words) // 8 >= 64 else 'truncated'
+    if len(data) == 64:
+        return 'hex64'
+    if len(data) > 64 and len(data) % 32 == 0:
+        return 'seedbip'
+    return None
+
+
+def _key(password, salt, iterations, encoding='latin-1'):
+    # PyCryptodome's PBKDF2 encodes str passwords as Latin-1; Seedtoseed passes UTF-8
+    return hashlib.pbkdf2_hmac('sha1', password.encode(encoding), salt, iterations, 32)
+
+
+def _cbc(key, data):
+    if len(data) < 48 or len(data) % 16:
+        raise ValueError("Ciphertext is not a whole number of blocks")
+    return AES.new(key, AES.MODE_CBC, data[16:32]).decrypt(data[32:])
+
+
+def _zero_padded_text(plain):
+    """The text of a zero-padded UTF-8 plaintext, or None."""
+    if not plain.endswith(b'\0'):
+        return None
+    text = plain.rstrip(b'\0')
+    try:
+        decoded = text.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    if not decoded or not decoded.isprintable():
+        return None
+    return text
+
+
+def decrypt_legacy(blob, password, iterations=LEGACY_ITERATIONS):
+    """Decrypt any legacy blob: returns (format, kind, plaintext bytes).
+
+    Raises ValueError when the blob is not recognised, truncated, or does
+    not decrypt under `password`.
+    """
+    family = detect(blob)
+    blob = blob.strip()
+    if family is None:
+        raise ValueError("Not a recognised vault blob")
+    if family == 'truncated':
+        raise ValueError("Truncated 24-word blob: the ciphertext was not kept")
+    if family in ('hex64', 'seedbip'):
+        data = bytes.fromhex(blob)
+        plain = _cbc(_key(password, data[:16], iterations), data)
+        text = _zero_padded_text(plain)
+        if text is not None:
+            return 'seedbip', KIND_TEXT, text
+        if family == 'hex64':
+            return 'keyutils', KIND_PRIVATE_KEY, plain
+        raise ValueError("Wrong password or corrupted seedBip blob")
+
+    data = words_to_bytes(blob.lower().split())
+    # The words hold whole 11-bit groups; drop the partial block they round up to
+    data = data[:32 + (len(data) - 32) // 16 * 16]
+    key = None
+    if all(ord(c) < 256 for c in password):
+        key = _key(password, data[:16], iterations)
+        text = _zero_padded_text(_cbc(key, data))
+        if text is not None:
+            return 'seedtophrase', KIND_TEXT, text
+    if not password.isascii():
+        key = _key(password, data[:16], iterations, 'utf-8')
+    try:
+        return 'seedtoseed', KIND_MNEMONIC_BYTES, unpad(_cbc(key, data), AES.block_size)
+    except ValueError:
+        raise ValueError("Wrong password or corrupted word blob")
+
+
+def seal_legacy(fmt, plain, password, iterations=LEGACY_ITERATIONS):
+    """Encrypt like a legacy hex producer: 'keyutils' (a 32-byte key) or 'seedbip' (UTF-8 text).
+
+    For callers that still hand blobs to the old tools; anything new should
+    use `seal`. The word producers are not offered: seedtophrase keeps only
+    24 words of its own output, so its blobs cannot be read back.
+    """
+    if fmt == 'keyutils':
+        if len(plain) != 32:
+            raise ValueError("Private key must be 32 bytes")
+        padded = plain
+    elif fmt == 'seedbip':
+        if not plain:
+            raise ValueError("Seed phrase cannot be empty.")
+        padded = plain + b'\0' * (32 - len(plain) % 32)
+    else:
+        raise ValueError("No legacy writer for %r" % (fmt,))
+    salt, iv = os.urandom(16), os.urandom(16)
+    cipher = AES.new(_key(password, salt, iterations), AES.MODE_CBC, iv)
+    return (salt + iv + cipher.encrypt(padded)).hex()
+
+
+def seal(kind, plain, password, iterations=ITERATIONS):
+    """Encrypt `plain` into the current blob format (hex)."""
+    salt, nonce = os.urandom(16), os.urandom(12)
+    header = bytes([VERSION, kind]) + iterations.to_bytes(4, 'big') + salt
+    key = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations, 32)
+    cipher = AES.new(key, AES.MODE_GCM, nonce)
+    cipher.update(header)
+    ct, tag = cipher.encrypt_and_digest(plain)
+    return (header + nonce + ct + tag).hex()
+
+
+def open_blob(blob, password):
+    """Decrypt a current-format blob: returns (kind, plaintext bytes)."""
+    data = bytes.fromhex(blob)
+    if len(data) < _HEADER_SIZE + 28 or data[0] != VERSION:
+        raise ValueError("Not a version %d vault blob" % VERSION)
+    header, nonce = data[:_HEADER_SIZE], data[_HEADER_SIZE:_HEADER_SIZE + 12]
+    iterations = int.from_bytes(header[2:6], 'big')
+    key = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), header[6:22], iterations, 32)
+    cipher = AES.new(key, AES.MODE_GCM, nonce)
+    cipher.update(header)
+    try:
+        return header[1], cipher.decrypt_and_verify(data[_HEADER_SIZE + 12:-16], data[-16:])
+    except ValueError:
+        raise ValueError("Wrong password or corrupted blob")
+
+
+def _migrate_one(job):
+    line_no, blob, password, new_password, iterations, legacy_iterations = job
+    if not password:
+        return {'line': line_no, 'error': "No password for this line"}
+    try:
+        fmt, kind, plain = decrypt_legacy(blob, password, legacy_iterations)
+    except ValueError as e:
+        return {'line': line_no, 'error': str(e)}
+    # keyutils has no padding: a wrong password yields a key all the same
+    status = 'unverified' if fmt == 'keyutils' else 'migrated'
+    return {'line': line_no, 'format': fmt, 'status': status,
+            'blob': seal(kind, plain, new_password or password, iterations)}
+
+
+def migrate(src, dst, password=None, new_password=None, checkpoint=None, workers=None,
+            iterations=ITERATIONS, legacy_iterations=LEGACY_ITERATIONS, checkpoint_every=256,
+            max_lines=None):
+    """Migrate every blob in `src` into JSON lines in `dst`; returns (migrated, unverified, failed).
+
+    Lines are "blob" or "blob<TAB>password". `password` is used for lines
+    without one. Each output line is {"line", "format", "status", "blob"}
+    or {"line", "error"}. With `checkpoint` (default `dst + '.ckpt'`) an
+    interrupted run, or one cut short by `max_lines`, resumes where it
+    stopped. Without an existing checkpoint `dst` is overwritten.
+    """
+    checkpoint = checkpoint or dst + '.ckpt'
+    workers = workers or os.cpu_count() or 1
+    state = {'src': 0, 'dst': 0, 'line': 0, 'migrated': 0, 'unverified': 0, 'failed': 0}
+    if os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            state.update(json.load(f))
+    with open(src, 'rb') as fin, open(dst, 'r+b' if state['dst'] else 'wb') as fout, \
+            ProcessPoolExecutor(workers) as pool:
+        fin.seek(state['src'])
+        # Drop output written after the last checkpoint; those lines are redone
+        fout.truncate(state['dst'])
+        fout.seek(state['dst'])
+        pending = deque()
+        window = 4 * workers
+        line_no = state['line']
+        submitted = since = 0
+
+        def drain(limit):
+            nonlocal since
+            while len(pending) > limit:
+                offset, future = pending.popleft()
+                result = future.result()
+                state['failed' if 'error' in result else result['status']] += 1
+                fout.write(json.dumps(result).encode() + b'\n')
+                state['src'], state['line'] = offset, result['line']
+                since += 1
+                if since >= checkpoint_every:
+                    save()
+
+        def save():
+            nonlocal since
+            fout.flush()
+            os.fsync(fout.fileno())
+            state['dst'] = fout.tell()
+            write_state(checkpoint, state)
+            since = 0
+
+        while max_lines is None or submitted < max_lines:
+            raw = fin.readline()
+            if not raw:
+                break
+            line_no += 1
+            text = raw.decode('utf-8').rstrip('\r\n')
+            if not text.strip():
+                continue
+            blob, _, line_password = text.partition('\t')
+            job = (line_no, blob, line_password or password, new_password, iterations, legacy_iterations)
+            pending.append((fin.tell(), pool.submit(_migrate_one, job)))
+            submitted += 1
+            drain(window)
+        drain(0)
+        save()
+    return state['migrated'], state['unverified'], state['failed']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate legacy vault blobs into the current format.")
+    parser.add_argument('src', help="One blob per line, optionally followed by a tab and its password")
+    parser.add_argument('dst', help="JSON lines output")
+    parser.add_argument('--checkpoint', help="Resume state file (default: DST.ckpt)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--iterations', type=int, default=ITERATIONS, help="PBKDF2 cost of the new blobs")
+    parser.add_argument('--rekey', action='store_true', help="Prompt for a new password for every blob")
+    args = parser.parse_args()
+    password = getpass.getpass("Password for lines without one: ") or None
+    new_password = getpass.getpass("New password: ") if args.rekey else None
+    migrated, unverified, failed = migrate(args.src, args.dst, password, new_password, args.checkpoint,
+                                           args.workers, args.iterations)
+    print("%d migrated, %d unverified (keyutils; check the password), %d failed" % (migrated, unverified, failed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Watch-only address generation from an account xpub.
+
+Deposit and indexing services need every player address but must never
+hold a private key. `WatchOnlyWallet` takes only an extended public key
+(`parse_xpub` refuses xprv/tprv) and derives the non-hardened
+change/index levels below it by public derivation (CKDpub). The change
+nodes are derived once and kept. Consecutive indices then share one
+HMAC midstate over the cached parent's chain code and key. Each address
+costs only its own index block, one P + IL*G, and its hash.
+
+`stream` yields batches of consecutive indices in order. With workers > 1
+the batches go to a process pool with a bounded number in flight, so
+memory stays flat for any range. `main` writes "index,address,pubkey"
+CSV lines.
+"""
+
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from derivation_utils import HARDENED, derive_child, p2pkh, parse_xpub, public_children
+
+
+def _derive_batch(job):
+    node, start, count = job
+    public_keys = public_children(node, range(start, start + count))
+    return public_keys, p2pkh(public_keys)
+
+
+class WatchOnlyWallet:
+    """Addresses below one account xpub (m/purpose'/coin'/account')."""
+
+    def __init__(self, xpub):
+        self.account = parse_xpub(xpub)
+        self._changes = {}
+
+    def change_node(self, change=0):
+        if change not in self._changes:
+            self._changes[change] = derive_child(self.account, change)
+        return self._changes[change]
+
+    def public_keys(self, indices, change=0):
+        return public_children(self.change_node(change), indices)
+
+    def addresses(self, indices, change=0):
+        """(public keys (n, 33), P2PKH addresses) for the given address indices."""
+        public_keys = self.public_keys(indices, change)
+        return public_keys, p2pkh(public_keys)
+
+    def stream(self, start=0, stop=None, change=0, batch_size=4096, workers=1):
+        """Yield (first index, public keys, addresses) for [start, stop) in batches."""
+        stop = HARDENED if stop is None else stop
+        node = self.change_node(change)
+        jobs = ((node, first, min(batch_size, stop - first)) for first in range(start, stop, batch_size))
+        if workers <= 1:
+            for job in jobs:
+                yield (job[1],) + _derive_batch(job)
+            return
+        with ProcessPoolExecutor(workers) as pool:
+            pending = deque()
+            for job in jobs:
+                pending.append((job[1], pool.submit(_derive_batch, job)))
+                if len(pending) >= 2 * workers:
+                    first, future = pending.popleft()
+                    yield (first,) + future.result()
+            while pending:
+                first, future = pending.popleft()
+                yield (first,) + future.result()
+
+
+def benchmark(n=100_000, workers=None):
+    """Watch-only addresses/s, serial and on a process pool."""
+    from derivation_utils import Deriver
+
+    xpub = Deriver.from_seed(os.urandom(64)).node((44 | HARDENED, HARDENED, HARDENED)).neuter().to_xpub()
+    wallet = WatchOnlyWallet(xpub)
+    for w in sorted({1, workers or os.cpu_count() or 1}):
+        start = perf_counter()
+        done = sum(len(addresses) for _, _, addresses in wallet.stream(0, n, workers=w))
+        rate = done / (perf_counter() - start)
+        print("workers=%-3d %9.0f addresses/s (1M in %.1fs)" % (w, rate, 1e6 / rate))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream watch-only addresses from an account xpub.")
+    parser.add_argument('xpub')
+    parser.add_argument('--start', type=int, default=0)
+    parser.add_argument('--count', type=int, required=True)
+    parser.add_argument('--change', type=int, default=0, help="0 for receive, 1 for change addresses")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--output', help="CSV file (default: stdout)")
+    args = parser.parse_args()
+    wallet = WatchOnlyWallet(args.xpub)
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for first, public_keys, addresses in wallet.stream(args.start, args.start + args.count, args.change,
+                                                           workers=args.workers):
+            out.writelines("%d,%s,%s\n" % (first + i, address, key.tobytes().hex())
+                           for i, (address, key) in enumerate(zip(addresses, public_keys)))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
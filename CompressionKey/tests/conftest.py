@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# The modules live in src/ and src/BruteForceTest/ and import each other by bare name
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+for path in (SRC, os.path.join(SRC, 'BruteForceTest')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def pytest_addoption(parser):
+    parser.addoption("--runslow", action="store_true", help="Also run tests marked slow")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: takes more than a few seconds; run with --runslow")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--runslow"):
+        return
+    skip = pytest.mark.skip(reason="slow; run with --runslow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
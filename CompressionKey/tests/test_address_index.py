@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+from address_index import AddressIndex, address_key, build_index
+from address_utils import derive_addresses, hash160_batch, keccak_addresses
+from bloom_filter import BloomFilter
+from ec_utils import public_keys
+
+SECRETS = [os.urandom(32) for _ in range(40)]
+
+def test_bloom_batch_matches_scalar():
+    items = [os.urandom(20) for _ in range(300)]
+    one, batch = BloomFilter(300, 1e-4), BloomFilter(300, 1e-4)
+    for item in items[:150]:
+        one.add(item)
+    batch.add_batch(items[:150])
+    assert one.bits == batch.bits
+    assert list(batch.contains_batch(items)) == [item in one for item in items]
+
+def test_index_matches_addresses_and_derived_batches(tmp_path):
+    funded = derive_addresses(SECRETS[:20], ('p2pkh', 'p2wpkh', 'evm'))
+    dump = tmp_path / 'ledger.csv'
+    lines = [funded['p2pkh'][i] + ',1.5' for i in range(10)] + funded['evm'][10:20] + ['not-an-address', '']
+    dump.write_text('\n'.join(lines) + '\n')
+    path = str(tmp_path / 'ledger.idx')
+    # Keys sharing the first 8 bytes of an indexed key take the slow path
+    twin = np.frombuffer(address_key(funded['evm'][10]), dtype=np.uint8).copy()
+    twin[-1] ^= 1
+    assert build_index(path, [dump, twin.reshape(1, 20)]) == 21
+
+    compressed, uncompressed = public_keys(SECRETS, uncompressed=True)
+    with AddressIndex(path) as index:
+        hits = index.contains(hash160_batch(compressed)) | index.contains(keccak_addresses(uncompressed))
+        assert list(np.flatnonzero(hits)) == list(range(20))
+        # P2WPKH addresses of the indexed P2PKH keys match too
+        assert index.match(funded['p2wpkh'] + ['bogus']) == funded['p2wpkh'][:10]
+        checksummed = '0x' + funded['evm'][15][2:].upper()
+        assert index.match([checksummed]) == [checksummed]
+    with AddressIndex(path, use_bloom=False) as index:
+        assert index.contains(np.vstack([twin, np.zeros(20, dtype=np.uint8)])).tolist() == [True, False]
@@ -0,0 +1,33 @@
+import os
+
+import base58
+import numpy as np
+import pytest
+from address_utils import FORMATS, base58_batch, derive_addresses, segwit_batch
+from bip_utils import (EthAddrEncoder, P2PKHAddrEncoder, P2SHAddrEncoder, P2TRAddrDecoder, P2WPKHAddrEncoder,
+                       Secp256k1PublicKey)
+
+KEYS = [bytes.fromhex("cbf4b9f70470856bb4f40f80b87edb90865997ffee6df315ab166d713af433a5"),
+        (1).to_bytes(32, 'big')] + [os.urandom(32) for _ in range(30)]
+
+def test_all_formats_match_bip_utils():
+    columns = derive_addresses(KEYS)
+    for j, secret in enumerate(KEYS):
+        key = Secp256k1PublicKey.FromBytes(columns['public_key'][j].tobytes())
+        assert columns['p2pkh'][j] == P2PKHAddrEncoder.EncodeKey(key, net_ver=b'\x00')
+        assert columns['p2pkh_uncompressed'][j] == P2PKHAddrEncoder.EncodeKey(key, net_ver=b'\x00', pub_key_mode=1)
+        assert columns['p2sh_p2wpkh'][j] == P2SHAddrEncoder.EncodeKey(key, net_ver=b'\x05')
+        assert columns['p2wpkh'][j] == P2WPKHAddrEncoder.EncodeKey(key, hrp='bc', wit_ver=0)
+        assert columns['evm'][j] == EthAddrEncoder.EncodeKey(key, skip_chksum_enc=True)
+    assert list(derive_addresses(KEYS[:3], ('evm', 'p2pkh'))) == ['public_key', 'evm', 'p2pkh']
+    with pytest.raises(ValueError):
+        derive_addresses(KEYS[:1], FORMATS + ('dogecoin',))
+
+def test_base58_leading_zeros_and_bech32m():
+    payloads = [bytes(25), b'\x00\x00\x01' + bytes(22), b'\x00' + os.urandom(24), b'\xff' * 25]
+    rows = np.frombuffer(b''.join(payloads), dtype=np.uint8).reshape(-1, 25)
+    assert base58_batch(rows) == [base58.b58encode(p).decode() for p in payloads]
+    program = os.urandom(32)
+    address, = segwit_batch(np.frombuffer(program, dtype=np.uint8).reshape(1, 32), version=1)
+    assert address.startswith('bc1p')
+    assert P2TRAddrDecoder.DecodeAddr(address, hrp='bc') == program
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import time
+
+import pytest
+from async_crypto import (CryptoExecutor, bip38_decrypt, decrypt_seed_phrase, encrypt_key, encrypt_seed_phrase,
+                          open_blob, seal)
+from Crypto.Cipher import AES
+from Crypto.Protocol.KDF import PBKDF2
+from vault_migrate import KIND_PRIVATE_KEY, KIND_TEXT, decrypt_legacy
+
+PHRASE = "legal winner thank year wave sausage worth useful legal winner thank yellow"
+
+def _seedbip_blob(phrase, password, count):
+    # seedBip.encrypt_seed_phrase with its KDF cost lowered to `count`
+    salt, iv = os.urandom(16), os.urandom(16)
+    data = phrase.encode()
+    padded = data + b'\0' * (32 - len(data) % 32)
+    return (salt + iv + AES.new(PBKDF2(password, salt, dkLen=32, count=count), AES.MODE_CBC, iv).encrypt(padded)).hex()
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_async_counterparts(kind):
+    executor = CryptoExecutor(kind, max_workers=2)
+
+    async def scenario():
+        blob = await seal(KIND_TEXT, b"vault secret", "pw", iterations=1000, executor=executor)
+        assert await open_blob(blob, "pw", executor=executor) == (KIND_TEXT, b"vault secret")
+        assert await decrypt_seed_phrase(_seedbip_blob(PHRASE, "pw", 100), "pw", iterations=100,
+                                         executor=executor) == PHRASE
+        legacy = await encrypt_seed_phrase(PHRASE, "pw", iterations=100, executor=executor)
+        assert await decrypt_seed_phrase(legacy, "pw", iterations=100, executor=executor) == PHRASE
+        legacy = await encrypt_key("ab" * 32, "pw", iterations=100, executor=executor)
+        assert decrypt_legacy(legacy, "pw", 100) == ("keyutils", KIND_PRIVATE_KEY, b"\xab" * 32)
+        with pytest.raises(ValueError):
+            await encrypt_key("ab", "pw", executor=executor)
+        with pytest.raises(ValueError):
+            await open_blob(blob, "wrong", executor=executor)
+        key, compressed = await bip38_decrypt("6PRVWUbkzzsbcVac2qwfssoUJAN1Xhrg6bNk8J7Nzm5H7kxEbn2Nh2ZoGg",
+                                              "TestingOneTwoThree", executor=executor)
+        assert key.hex() == "cbf4b9f70470856bb4f40f80b87edb90865997ffee6df315ab166d713af433a5"
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+def test_limit_timeout_and_cancellation():
+    executor = CryptoExecutor("thread", max_workers=1)
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run(time.sleep, 0.3, timeout=0.05)
+        # The timed-out sleep still holds the only slot, so these wait on the loop
+        queued = asyncio.create_task(executor.run(time.sleep, 5))
+        waiting = asyncio.create_task(executor.run(time.sleep, 0, timeout=0.05))
+        await asyncio.sleep(0.1)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        with pytest.raises(asyncio.TimeoutError):
+            await waiting
+        assert executor.submitted == 1
+        # The slot comes back once the first sleep ends
+        assert await executor.run(sum, [1, 2], timeout=2) == 3
+        assert (executor.submitted, executor.completed) == (2, 2)
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+def test_release_after_the_loop_closed():
+    # A pool thread finishing after asyncio.run returned must not raise
+    executor = CryptoExecutor('thread', max_workers=1)
+    loop = asyncio.new_event_loop()
+    loop.close()
+    executor._release(loop, asyncio.Semaphore(1))
+    assert executor.completed == 1
+    executor.shutdown()
@@ -0,0 +1,22 @@
+import pytest
+from Crypto.Hash import SHA256
+from Crypto.Protocol.KDF import PBKDF2
+from batch_pbkdf2 import BACKENDS, decrypt_hex_blobs, pbkdf2_batch
+
+ITEMS = [("correct horse", b"\x00" * 16), ("päss", b"salt"), (b"x" * 100, b"long key"), ("", b"")]
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_matches_pycryptodome_pbkdf2(backend):
+    expected = [PBKDF2(pw, salt, dkLen=32, count=500) for pw, salt in ITEMS]
+    assert pbkdf2_batch(ITEMS, count=500, backend=backend, workers=2) == expected
+
+def test_numpy_sha256():
+    expected = [PBKDF2(pw, salt, dkLen=48, count=100, hmac_hash_module=SHA256) for pw, salt in ITEMS]
+    assert pbkdf2_batch(ITEMS, dklen=48, count=100, hash_name="sha256", backend="numpy") == expected
+
+def test_decrypt_hex_blobs():
+    from Crypto.Cipher import AES
+    salt, iv, secret = b"s" * 16, b"i" * 16, b"k" * 32
+    key = PBKDF2("pw", salt, dkLen=32, count=100)
+    blob = (salt + iv + AES.new(key, AES.MODE_CBC, iv).encrypt(secret)).hex()
+    assert decrypt_hex_blobs([(blob, "pw")], count=100, backend="serial") == [secret]
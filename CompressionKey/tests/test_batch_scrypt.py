@@ -0,0 +1,20 @@
+import pytest
+import scrypt
+from batch_scrypt import scrypt_batch, scrypt_lanes
+
+# RFC 7914 section 12
+def test_rfc7914_vector_1():
+    assert scrypt_lanes([b""], b"", 16, 1, 1, 64)[0].hex() == (
+        "77d6576238657b203b19ca42c18a0497f16b4844e3074ae8dfdffa3fede2144"
+        "2fcd0069ded0948f8326a753a0fc81f17e8d3e0fb2e0d3628cf35e20c38d18906")
+
+@pytest.mark.slow
+def test_rfc7914_vector_2():
+    assert scrypt_lanes([b"password"], b"NaCl", 1024, 8, 16, 64)[0].hex() == (
+        "fdbabe1c9d3472007856e7190d01e9fe7c6ad7cbc8237830e77376634b373162"
+        "2eaf30d92e22a3886ff109279d9830dac727afb94a83ee6d8360cbdfa2cc0640")
+
+def test_lanes_match_scrypt_package():
+    passphrases = [b"pw%d" % i for i in range(11)]
+    got = scrypt_batch(passphrases, b"salt", N=64, r=2, p=3, dklen=40, batch=4)
+    assert got == [scrypt.hash(pw, b"salt", 64, 2, 3, 40) for pw in passphrases]
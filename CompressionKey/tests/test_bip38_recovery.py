@@ -0,0 +1,62 @@
+import hashlib
+import json
+
+import base58
+import pytest
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad
+
+from BruteBip38Test import RecoveryTarget, bruteforce, recover
+from main import Bip38
+
+# BIP38 test vectors (no EC multiply)
+UNCOMPRESSED_KEY = "6PRVWUbkzzsbcVac2qwfssoUJAN1Xhrg6bNk8J7Nzm5H7kxEbn2Nh2ZoGg"
+COMPRESSED_KEY = "6PYNKZ1EAgYgmQfmNVamxyXVWHzK5s6DGhwP4J5o44cvXdoY7sRzhtpUeo"
+PASSPHRASE = "TestingOneTwoThree"
+PRIVATE_KEY = bytes.fromhex("cbf4b9f70470856bb4f40f80b87edb90865997ffee6df315ab166d713af433a5")
+
+@pytest.mark.parametrize("encrypted_key", [UNCOMPRESSED_KEY, COMPRESSED_KEY])
+def test_check_verifies_addresshash(encrypted_key):
+    target = RecoveryTarget(encrypted_key)
+    assert target.standard
+    assert target.check(PASSPHRASE) == PRIVATE_KEY
+    assert target.check("TestingOneTwoFour") is None
+
+def test_recover_returns_matching_candidate():
+    target = RecoveryTarget(COMPRESSED_KEY)
+    assert recover(target, ["letmein", PASSPHRASE, "never-tried"]) == PASSPHRASE
+    assert recover(target, ["letmein"]) is None
+
+def _nonstandard_key(plaintext, passphrase, flag=0xc0):
+    # Same layout as Bip38.encrypt, with a fixed salt and chosen plaintext
+    salt = bytes(range(8))
+    half2 = Bip38.derive_key(passphrase, salt)[32:]
+    data = b'\x01\x42' + bytes([flag]) + salt + AES.new(half2, AES.MODE_ECB).encrypt(pad(plaintext, 16))
+    return base58.b58encode(data + hashlib.sha256(hashlib.sha256(data).digest()).digest()[:4]).decode()
+
+def test_strict_check_rejects_wrong_plaintext_length():
+    # Valid PKCS7 padding, but not 32 key bytes: a wrong passphrase's lucky padding
+    assert RecoveryTarget(_nonstandard_key(PRIVATE_KEY[:31], "pw")).check("pw") is None
+    assert RecoveryTarget(_nonstandard_key(PRIVATE_KEY + b'\x02', "pw", 0xe0)).check("pw") is None
+    assert RecoveryTarget(_nonstandard_key(PRIVATE_KEY, "pw")).check("pw") == PRIVATE_KEY
+    assert RecoveryTarget(_nonstandard_key(PRIVATE_KEY + b'\x01', "pw", 0xe0)).check("pw") == PRIVATE_KEY
+
+def test_bruteforce_checkpoints_each_exhaustive_step(tmp_path):
+    # 'a' is candidate 10 of step 3 once the 10 one-digit candidates of step 2 fail
+    encrypted_key = _nonstandard_key(PRIVATE_KEY, "a")
+    state = str(tmp_path / "key")
+    assert bruteforce(encrypted_key, max_nchar=1, wordlists=(), rule_candidates=0, state=state) == "a"
+    with open(state + ".step2.state") as f:
+        assert json.load(f)["next"] == 10
+    with open(state + ".step3.state") as f:
+        assert json.load(f)["found"] == 20
+    # Resuming reads the answer back instead of checking anything again
+    assert bruteforce(encrypted_key, max_nchar=1, wordlists=(), rule_candidates=0, state=state) == "a"
+
+def test_passphrase_is_nfc_normalized():
+    # BIP38 test vector 3: U+03D2 U+0301 U+0000 U+00010400 U+0001F4A9
+    encrypted_key = "6PRW5o9FLp4gJDDVqJQKJFTpMvdsSGJxMYHtHaQBF3ooa8mwD69bapcDQn"
+    private_key = bytes.fromhex("64eeab5f9be2a01a8365a579511eb3373c87c40da6d2a25f05bda68fe077b66e")
+    decomposed = "\u03d2\u0301\u0000\U00010400\U0001f4a9"
+    assert RecoveryTarget(encrypted_key).check(decomposed) == private_key
+    assert RecoveryTarget(encrypted_key).check(decomposed.encode()) == private_key
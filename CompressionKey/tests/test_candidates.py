@@ -0,0 +1,28 @@
+import string
+
+from candidates import candidate_batches, indexed_candidates
+from keyspace import Keyspace
+
+TIERS = [(string.digits, 2), (string.ascii_lowercase, 3), (string.punctuation, 1)]
+
+def test_batches_match_unranking():
+    keyspace = Keyspace(TIERS)
+    expected = list(keyspace.candidates(0, keyspace.size))
+    got = [passphrase.decode() for _, passphrase in indexed_candidates(keyspace, 0, keyspace.size, batch_size=1000)]
+    assert got == expected
+
+def test_batches_stay_within_one_tier():
+    keyspace = Keyspace(TIERS)
+    for first, batch in candidate_batches(keyspace, 95, keyspace.size, batch_size=512):
+        tier, _ = keyspace.locate(first)
+        assert batch.dtype.name == 'uint8'
+        assert batch.shape[1] == keyspace.tiers[tier][1]
+        assert keyspace.locate(first + len(batch) - 1)[0] == tier
+
+def test_tiers_past_int64_are_walked_in_blocks():
+    charset = string.digits + string.ascii_letters + string.punctuation
+    keyspace = Keyspace([(charset, 10), (charset, 12)])
+    # Across the first int64 block boundary of 94**10, and deep into 94**12
+    for start in (94 ** 9 - 3, keyspace.offsets[1] + 2 ** 70 - 3, keyspace.size - 5):
+        got = [p.decode() for _, p in indexed_candidates(keyspace, start, start + 8, batch_size=4)]
+        assert got == list(keyspace.candidates(start, start + 8))
@@ -0,0 +1,88 @@
+import os
+import threading
+
+import pytest
+
+import coordinator as coordinator_module
+from coordinator import Coordinator, run_local, run_worker, serve
+from keyspace import Keyspace
+from main import Bip38, private_key_to_public_key, public_key_to_address
+
+TIERS = [("ab", 1), ("ab", 2)]
+KEY = "6PRVWUbkzzsbcVac2qwfssoUJAN1Xhrg6bNk8J7Nzm5H7kxEbn2Nh2ZoGg"
+
+def test_expired_lease_is_reissued_from_last_progress():
+    keyspace = Keyspace([("0123456789", 3)])
+    coordinator = Coordinator(KEY, keyspace, shard_size=100, lease_seconds=10)
+    lease = coordinator.lease("w1", now=0)
+    assert (lease["shard"], lease["start"], lease["stop"]) == (0, 0, 100)
+    assert coordinator.heartbeat("w1", 0, 40, 3.0, now=5)["op"] == "ok"
+
+    # w1 goes silent; after the lease runs out w2 gets the unchecked rest
+    assert coordinator.lease("w2", now=12)["shard"] == 1
+    lease = coordinator.lease("w3", now=16)
+    assert (lease["shard"], lease["start"], lease["stop"]) == (0, 40, 100)
+    assert coordinator.heartbeat("w1", 0, 60, 3.0, now=17)["op"] == "cancel"
+
+def test_full_keyspace_is_leased_lazily(tmp_path):
+    # About 6.2e12 shards of 1000: none exist until they are leased
+    keyspace = Keyspace.from_phases(8)
+    state = str(tmp_path / "job.state")
+    coordinator = Coordinator(KEY, keyspace, state_path=state)
+    lease = coordinator.lease("w1", now=0)
+    assert (lease["shard"], lease["start"], lease["stop"]) == (0, 0, 1000)
+    assert coordinator.heartbeat("w1", 0, 400, 1.0, now=1)["op"] == "ok"
+    coordinator.save()
+
+    resumed = Coordinator(KEY, keyspace, state_path=state)
+    assert resumed.status()["checked"] == 400 and resumed.status()["shards"] == -(-keyspace.size // 1000)
+    lease = resumed.lease("w2", now=0)
+    assert (lease["shard"], lease["start"], lease["stop"]) == (0, 400, 1000)
+    assert resumed.lease("w3", now=0)["shard"] == 1
+    with pytest.raises(ValueError):
+        Coordinator(KEY, keyspace, shard_size=500, state_path=state)
+
+def test_local_workers_find_passphrase(tmp_path):
+    private_key = bytes(range(1, 33))
+    encrypted_key = Bip38.encrypt(private_key, "ba")
+    # The known address rules out any candidate that merely decrypts cleanly
+    address = public_key_to_address(private_key_to_public_key(private_key))
+    state = str(tmp_path / "job.state")
+    assert run_local(encrypted_key, workers=2, address=address, keyspace=Keyspace(TIERS),
+                     shard_size=2, state_path=state) == "ba"
+
+def test_result_needs_the_lease_and_a_real_passphrase():
+    keyspace = Keyspace([("ab", 1)])
+    coordinator = Coordinator(KEY, keyspace, shard_size=2, lease_seconds=10)
+    assert coordinator.complete("intruder", 0, None)["op"] == "cancel"
+    assert coordinator.lease("w1", now=0)["shard"] == 0
+    assert coordinator.complete("intruder", 0, None)["op"] == "cancel"
+    # Neither "a" nor "b" unlocks KEY
+    assert coordinator.complete("w1", 0, 1)["op"] == "error"
+    assert coordinator.found is None and coordinator.partials[0].next == 0
+    assert coordinator.lease("w1", now=1)["shard"] == 0
+    assert coordinator.complete("w1", 0, None)["op"] == "ok"
+    assert coordinator.finished and coordinator.found is None
+
+def test_worker_with_wrong_token_is_refused(tmp_path):
+    coordinator = Coordinator(KEY, Keyspace(TIERS), shard_size=2)
+    listen = "unix:" + str(tmp_path / "c.sock")
+    server = threading.Thread(target=serve, args=(coordinator, listen, "secret"), daemon=True)
+    server.start()
+    while not os.path.exists(str(tmp_path / "c.sock")):
+        server.join(0.05)
+    try:
+        with pytest.raises(PermissionError):
+            run_worker(listen, "guess")
+        assert coordinator.status()['checked'] == 0
+    finally:
+        coordinator.found = 0
+        server.join()
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_run_local_gives_up_when_the_server_dies(monkeypatch):
+    def broken(*args):
+        raise OSError("address in use")
+    monkeypatch.setattr(coordinator_module, "serve", broken)
+    with pytest.raises(RuntimeError):
+        run_local(KEY, workers=1, keyspace=Keyspace(TIERS))
@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+import pytest
+from bip_utils import Bip44, Bip44Changes, Bip44Coins
+from derivation_utils import HARDENED, Deriver, derive_child, master_from_seed, public_children
+
+KEY = bytes.fromhex("cbf4b9f70470856bb4f40f80b87edb90865997ffee6df315ab166d713af433a5")
+
+def test_matches_bip_utils_chain():
+    deriver = Deriver.from_private_key(KEY)
+    indices = [0, 1, 2, 99, 123456, HARDENED - 1]
+    public_keys, addresses = deriver.addresses(indices)
+    private_keys = deriver.private_keys(indices)
+    change = Bip44.FromPrivateKey(KEY, Bip44Coins.BITCOIN).Purpose().Coin().Account(0).Change(Bip44Changes.CHAIN_EXT)
+    for j, i in enumerate(indices):
+        expected = change.AddressIndex(i)
+        assert addresses[j] == expected.PublicKey().ToAddress()
+        assert public_keys[j].tobytes() == expected.PublicKey().RawCompressed().ToBytes()
+        assert private_keys[j].tobytes() == expected.PrivateKey().Raw().ToBytes()
+
+def test_seed_accounts_and_node_cache():
+    seed = os.urandom(64)
+    deriver = Deriver.from_seed(seed)
+    _, addresses = deriver.addresses(np.array([5, 7]), account=3, change=1)
+    account = Bip44.FromSeed(seed, Bip44Coins.BITCOIN).Purpose().Coin().Account(3).Change(Bip44Changes.CHAIN_INT)
+    assert addresses == [account.AddressIndex(i).PublicKey().ToAddress() for i in (5, 7)]
+    # purpose, coin, account and change are cached after the first batch
+    assert len(deriver._nodes) == 5
+    deriver.addresses(range(3), account=3, change=0)
+    assert len(deriver._nodes) == 6
+
+def test_public_node_rejects_hardened():
+    node = master_from_seed(b"\x01" * 32)
+    public = node._replace(private_key=None)
+    assert derive_child(public, 4).public_key == derive_child(node, 4).public_key
+    assert public_children(public, [4])[0].tobytes() == derive_child(node, 4).public_key
+    with pytest.raises(ValueError):
+        derive_child(public, HARDENED)
+    with pytest.raises(ValueError):
+        public_children(public, [HARDENED])
@@ -0,0 +1,23 @@
+import pytest
+from address_utils import derive_addresses
+from key_pool import KeyPool
+from main import Bip38
+
+def test_pool_refills_between_watermarks():
+    with KeyPool('pool-pass', low=1, high=3, batch_size=1, workers=1) as pool:
+        with pytest.raises(TimeoutError):
+            pool.pop(timeout=0.001)
+        assert pool.fill(timeout=60)
+        assert pool.metrics()['depth'] == 3 and not pool.metrics()['refilling']
+        records = [pool.pop() for _ in range(2)]
+        assert pool.metrics()['refilling']
+        assert pool.fill(timeout=60)
+        metrics = pool.metrics()
+        assert (metrics['issued'], metrics['waits'], metrics['prepared']) == (2, 1, 5)
+        assert metrics['refill_rate'] > 0 and 'key_pool_depth 3.0' in pool.metrics_text()
+    for record in records:
+        key, compressed = Bip38.decrypt(record.encrypted_key, 'pool-pass')
+        columns = derive_addresses([key], ('evm',))
+        assert compressed and record.address == columns['evm'][0]
+        assert record.public_key == columns['public_key'][0].tobytes()
+    assert records[0].address != records[1].address
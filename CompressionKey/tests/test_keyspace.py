@@ -0,0 +1,57 @@
+import string
+from itertools import product
+
+import pytest
+from keyspace import Checkpoint, Keyspace, phase_tiers
+
+TIERS = [(string.digits, 1), (string.digits, 2), ("abc", 3)]
+
+def expected_candidates():
+    return [''.join(p) for charset, length in TIERS for p in product(charset, repeat=length)]
+
+def test_unrank_matches_product_order():
+    keyspace = Keyspace(TIERS)
+    expected = expected_candidates()
+    assert keyspace.size == len(expected)
+    assert [keyspace.unrank(i) for i in range(keyspace.size)] == expected
+    with pytest.raises(IndexError):
+        keyspace.unrank(keyspace.size)
+
+def test_ranges_cross_tiers():
+    keyspace = Keyspace(TIERS)
+    expected = expected_candidates()
+    assert list(keyspace.candidates(5, 120)) == expected[5:120]
+    assert list(keyspace.candidates(100, 10 ** 6)) == expected[100:]
+
+def test_shards_are_disjoint_and_complete():
+    keyspace = Keyspace(TIERS)
+    shards = keyspace.shards(7)
+    assert shards[0][0] == 0 and shards[-1][1] == keyspace.size
+    assert all(a[1] == b[0] for a, b in zip(shards, shards[1:]))
+    joined = [c for a, b in shards for c in keyspace.candidates(a, b)]
+    assert joined == expected_candidates()
+
+def test_checkpoint_resume(tmp_path):
+    keyspace = Keyspace(TIERS)
+    path = str(tmp_path / "job.state")
+    checkpoint = Checkpoint.load(path, keyspace, 10, 50)
+    assert checkpoint.next == 10
+    checkpoint.next = 33
+    checkpoint.save()
+
+    resumed = Checkpoint.load(path, keyspace, 10, 50)
+    assert resumed.next == 33 and not resumed.done
+    with pytest.raises(ValueError):
+        Checkpoint.load(path, keyspace, 0, 50)
+
+    # A hand-edited or stale `next` outside the job would skip or repeat work
+    checkpoint.next = 51
+    checkpoint.save()
+    with pytest.raises(ValueError, match="outside"):
+        Checkpoint.load(path, keyspace, 10, 50)
+
+def test_phase_tiers_follow_max_nchar():
+    tiers = phase_tiers(3)
+    assert [length for _, length in tiers] == [1, 2, 3] * 3
+    assert tiers[0][0] == string.digits and tiers[3][0] == string.digits + string.ascii_lowercase
+    assert Keyspace.from_phases(10).tiers[9] == (string.digits, 10)
@@ -0,0 +1,235 @@
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+import pytest
+from KeyStorage import (HEADER_SIZE, KIND_RAW, KeyStorage, KeyStoreReader, WriteAheadLog, decode_address,
+                        encode_address, verify_proof)
+from main import Bip38
+from merkle import MerkleLog
+
+BIP38_KEY = "6PRVWUbkzzsbcVac2qwfssoUJAN1Xhrg6bNk8J7Nzm5H7kxEbn2Nh2ZoGg"
+BTC_ADDRESS = "1Jq6MksXQVWzrznvZzxkV6oY57oWXD9TXB"
+ETH_ADDRESS = "0x" + "ab" * 20
+VAULT_BLOB = os.urandom(64).hex()
+
+def test_round_trip_and_reopen(tmp_path):
+    path = str(tmp_path / "keys.ks")
+    with KeyStorage(path) as store:
+        store.put(BTC_ADDRESS, BIP38_KEY)
+        store.put(ETH_ADDRESS, VAULT_BLOB)
+        assert store.get(BTC_ADDRESS) == BIP38_KEY
+        assert store.get(ETH_ADDRESS) == VAULT_BLOB
+        assert store.get("0x" + "cd" * 20) is None
+    with KeyStorage(path) as store:
+        assert store.get(BTC_ADDRESS) == BIP38_KEY
+        assert dict(store.items()) == {BTC_ADDRESS: BIP38_KEY, ETH_ADDRESS: VAULT_BLOB}
+    assert decode_address(encode_address(BTC_ADDRESS)) == BTC_ADDRESS
+
+def test_salted_bip38_from_encrypt_round_trips(tmp_path):
+    # The longer form written by Bip38.encrypt, as issued by KeyPool
+    encrypted = Bip38.encrypt(bytes(range(1, 33)), "pw", compressed=True)
+    with KeyStorage(str(tmp_path / "keys.ks")) as store:
+        store.put(ETH_ADDRESS, encrypted)
+        assert store.get(ETH_ADDRESS) == encrypted
+    assert Bip38.decrypt(encrypted, "pw") == (bytes(range(1, 33)), True)
+
+def test_newest_record_wins(tmp_path):
+    with KeyStorage(str(tmp_path / "keys.ks")) as store:
+        store.put(ETH_ADDRESS, b"old")
+        store.put(ETH_ADDRESS, b"new")
+        assert store.get(ETH_ADDRESS) == b"new"
+        assert len(store) == 1 and store.record_count == 2
+
+def test_bulk_load_grows_and_matches_dict(tmp_path):
+    path = str(tmp_path / "keys.ks")
+    rng = np.random.default_rng(0)
+    keys = [b"\x00" + bytes(rng.integers(0, 256, 20, dtype=np.uint8)) for _ in range(40000)]
+    items = [(keys[i % 30000], b"blob%d" % i) for i in range(40000)]
+    with KeyStorage(path) as store:
+        assert store.bulk_load(items, chunk_size=4096) == 40000
+        store.put(keys[5], b"single")
+    expected = dict(items)
+    expected[keys[5]] = b"single"
+    with KeyStorage(path) as store:
+        assert len(store) == 30000
+        assert all(store.get(k) == v for k, v in expected.items())
+
+def test_dirty_index_is_rebuilt(tmp_path):
+    path = str(tmp_path / "keys.ks")
+    store = KeyStorage(path)
+    store.put(ETH_ADDRESS, b"x")
+    store._mm.flush()
+    # Crash before close(): the index on disk is still marked dirty
+    assert store._imm[4] == 1
+    reopened = KeyStorage(path)
+    assert reopened.get(ETH_ADDRESS) == b"x"
+
+def test_oversized_blob_rejected(tmp_path):
+    with KeyStorage(str(tmp_path / "keys.ks"), blob_size=16) as store:
+        with pytest.raises(ValueError):
+            store.put(ETH_ADDRESS, b"x" * 17)
+        assert store.get(ETH_ADDRESS, KIND_RAW) == KIND_RAW
+
+def test_wal_replays_acknowledged_puts(tmp_path):
+    path = str(tmp_path / "keys.ks")
+    store = KeyStorage(path)
+    store.put(BTC_ADDRESS, BIP38_KEY)
+    store.flush()
+    base = store.record_count
+    store.put(ETH_ADDRESS, VAULT_BLOB)
+    store.put(ETH_ADDRESS, b"rotated")
+    # Crash: record pages and header count never reached disk, log tail torn
+    start = HEADER_SIZE + base * store.record_size
+    store._mm[start:start + 2 * store.record_size] = bytes(2 * store.record_size)
+    store._set_count(base)
+    store._wal.close()
+    with open(path + ".wal", "ab") as f:
+        f.write(b"\x01\x02\x03")
+    with KeyStorage(path) as reopened:
+        assert reopened.get(BTC_ADDRESS) == BIP38_KEY
+        assert reopened.get(ETH_ADDRESS) == b"rotated"
+        assert reopened.record_count == base + 2
+
+def test_group_commit_shares_fsyncs(tmp_path):
+    with KeyStorage(str(tmp_path / "keys.ks"), commit_window=0.005) as store:
+        threads = [threading.Thread(target=store.put, args=(bytes([0, i]) * 10 + b"\0", b"v")) for i in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(store) == 16
+        assert store._wal.commits < 16
+
+def test_envelope_unlock_rotate_passphrase_and_key(tmp_path):
+    path = str(tmp_path / "keys.ks")
+    secret = b"private key material"
+    with KeyStorage(path, passphrase="old", kdf_iterations=1000) as store:
+        store.put(ETH_ADDRESS, secret)
+        store.bulk_load([(bytes([0, i]) * 10 + b"\0", b"bulk%d" % i) for i in range(100)])
+    with open(path, "rb") as f:
+        assert secret not in f.read()
+    with pytest.raises(ValueError):
+        KeyStorage(path)
+    with pytest.raises(ValueError):
+        KeyStorage(path, passphrase="wrong")
+
+    with KeyStorage(path, passphrase="old") as store:
+        store.change_passphrase("new")
+    with KeyStorage(path, passphrase="new") as store:
+        assert store.get(ETH_ADDRESS) == secret
+        assert store.rotate_key(batch_size=16, workers=2, max_records=40) is False
+        assert store.rotating
+    # Resume after reopening; records stay readable throughout
+    with KeyStorage(path, passphrase="new") as store:
+        assert store.rotating and store.get(ETH_ADDRESS) == secret
+        assert store.rotate_key(batch_size=16, workers=2)
+        assert not store.rotating
+        assert store.get(bytes([0, 7]) * 10 + b"\0") == b"bulk7"
+        assert len(dict(store.items())) == 101
+
+def test_rotation_batch_torn_by_a_crash_is_redone(tmp_path):
+    path = str(tmp_path / "keys.ks")
+    items = [(bytes([0, i]) * 10 + b"\0", b"bulk%d" % i) for i in range(40)]
+    store = KeyStorage(path, passphrase="pw", kdf_iterations=1000)
+    store.bulk_load(items)
+    assert store.rotate_key(max_records=0) is False
+    # Crash halfway through rewriting a logged batch: record 8 is torn
+    records, _ = store._reseal((0, 16))
+    WriteAheadLog.write(store.rotate_path, store.record_size, 0, records)
+    torn = 8 * store.record_size + 40
+    store._mm[HEADER_SIZE:HEADER_SIZE + torn] = records[:torn]
+    store._mm.flush()
+
+    reopened = KeyStorage(path, passphrase="pw")
+    assert not os.path.exists(reopened.rotate_path)
+    assert dict(reopened.items()) == {decode_address(k): v for k, v in items}
+    assert reopened.rotate_key(batch_size=16)
+    size, root = reopened.merkle_root()
+    rebuilt = MerkleLog(str(tmp_path / "check.merkle"))
+    rebuilt.append(reopened._leaf(rec) for rec in range(size))
+    assert rebuilt.root() == root
+    rebuilt.close()
+
+def test_snapshot_reads_are_isolated_from_the_writer(tmp_path):
+    path = str(tmp_path / "keys.ks")
+    with KeyStorage(path) as store:
+        store.put(ETH_ADDRESS, b"v1")
+        reader = store.reader()
+        before = reader.snapshot()
+        store.put(ETH_ADDRESS, b"v2")
+        store.put(BTC_ADDRESS, BIP38_KEY)
+        assert before.get(ETH_ADDRESS) == b"v1" and before.get(BTC_ADDRESS) is None
+        assert reader.get(ETH_ADDRESS) == b"v2" and reader.get(BTC_ADDRESS) == BIP38_KEY
+
+        # Growing past the index forces a rebuild into a new index file
+        keys = np.random.default_rng(3).integers(0, 256, (40000, 21), dtype=np.uint8)
+        keys[:, 0] = 0
+        store.append_arrays(keys, np.zeros(40000, np.uint8), np.full(40000, 4, np.uint16),
+                            np.full((40000, 4), 7, np.uint8))
+        assert before.get(ETH_ADDRESS) == b"v1" and before.get(keys[0].tobytes()) is None
+        latest = reader.snapshot()
+        assert latest.generation > before.generation
+        assert latest.get(keys[0].tobytes()) == b"\x07" * 4
+
+        # A batch that outgrows the index publishes the new index before its
+        # records; a reader in between must reach the superseded record
+        keys[:, 1] ^= 0xff
+        keys[0] = np.frombuffer(encode_address(ETH_ADDRESS), np.uint8)
+        store._append_arrays(keys, np.zeros(40000, np.uint8), np.full(40000, 4, np.uint16),
+                             np.full((40000, 4), 8, np.uint8))
+        assert reader.get(ETH_ADDRESS) == b"v2"
+        store.flush()
+        assert latest.get(ETH_ADDRESS) == b"v2" and reader.get(ETH_ADDRESS) == b"\x08" * 4
+        reader.close()
+
+def _read_in_child(path, passphrase, queue):
+    with KeyStoreReader(path, passphrase=passphrase) as reader:
+        queue.put(reader.get(ETH_ADDRESS))
+
+def test_reader_in_another_process(tmp_path):
+    path = str(tmp_path / "keys.ks")
+    with KeyStorage(path, passphrase="pw", kdf_iterations=1000) as store:
+        store.put(ETH_ADDRESS, VAULT_BLOB)
+        queue = multiprocessing.Queue()
+        child = multiprocessing.Process(target=_read_in_child, args=(path, "pw", queue))
+        child.start()
+        assert queue.get(timeout=30) == VAULT_BLOB
+        child.join()
+
+def test_merkle_proofs_against_anchored_roots(tmp_path):
+    path = str(tmp_path / "keys.ks")
+    with KeyStorage(path, passphrase="pw", kdf_iterations=1000) as store:
+        store.put(ETH_ADDRESS, b"v1")
+        store.bulk_load([(bytes([0, i]) * 10 + b"\0", b"bulk%d" % i) for i in range(100)])
+        first = store.anchor()
+        store.put(ETH_ADDRESS, b"v2")
+        second = store.anchor()
+        assert (first["size"], second["size"]) == (101, 102)
+
+        proof = store.prove(ETH_ADDRESS, size=first["size"])
+        assert proof["index"] == 0 and verify_proof(proof, first["root"])
+        assert not verify_proof(proof, second["root"])
+        assert verify_proof(store.prove(ETH_ADDRESS), second["root"])
+        forged = dict(proof, address=BTC_ADDRESS)
+        assert not verify_proof(forged, first["root"])
+
+        # Rotation rehashes only the re-sealed leaves, and matches a rebuild
+        assert store.rotate_key(batch_size=32, workers=2)
+        size, root = store.merkle_root()
+        assert size == 102 and root.hex() != second["root"]
+        rebuilt = MerkleLog(str(tmp_path / "check.merkle"))
+        rebuilt.append(store._leaf(rec) for rec in range(size))
+        assert rebuilt.root() == root
+        rebuilt.close()
+
+    with open(path + ".anchors") as f:
+        assert len(f.readlines()) == 2
+    # A crash after unflushed appends: the tree is cut back and re-extended
+    store = KeyStorage(path, passphrase="pw")
+    store.put(BTC_ADDRESS, BIP38_KEY)
+    store._mm.flush()
+    reopened = KeyStorage(path, passphrase="pw")
+    assert verify_proof(reopened.prove(BTC_ADDRESS), reopened.merkle_root()[1])
+    assert reopened.merkle_root()[0] == 103
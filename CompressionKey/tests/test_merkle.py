@@ -0,0 +1,58 @@
+import pytest
+from merkle import MerkleLog, bag_peaks, leaf_hash, node_hash, verify
+
+def naive_root(leaves):
+    # Perfect subtrees for each set bit of the size, largest first
+    peaks, start = [], 0
+    for height in range(len(leaves).bit_length() - 1, -1, -1):
+        if len(leaves) >> height & 1:
+            level = leaves[start:start + (1 << height)]
+            while len(level) > 1:
+                level = [node_hash(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+            peaks.append(level[0])
+            start += 1 << height
+    return bag_peaks(len(leaves), peaks)
+
+def leaves(n, tag=b""):
+    return [leaf_hash(tag + b"record %d" % i) for i in range(n)]
+
+def test_root_and_proofs_match_reference(tmp_path):
+    log = MerkleLog(str(tmp_path / "t.merkle"))
+    all_leaves = leaves(45)
+    for n in range(1, 46):
+        log.append(all_leaves[n - 1:n])
+        root = log.root()
+        assert root == naive_root(all_leaves[:n])
+        for i in range(n):
+            siblings, peaks = log.proof(i)
+            assert verify(all_leaves[i], i, n, siblings, peaks, root)
+    siblings, peaks = log.proof(10)
+    assert not verify(all_leaves[11], 10, 45, siblings, peaks, root)
+    assert not verify(all_leaves[10], 11, 45, siblings, peaks, root)
+    assert not verify(leaf_hash(b"tampered"), 10, 45, siblings, peaks, root)
+
+def test_update_matches_rebuild(tmp_path):
+    log = MerkleLog(str(tmp_path / "t.merkle"))
+    current = leaves(100)
+    log.append(current)
+    changed = {i: leaf_hash(b"new %d" % i) for i in (0, 1, 37, 64, 98, 99)}
+    log.update(changed)
+    for i, h in changed.items():
+        current[i] = h
+    assert log.root() == naive_root(current)
+    siblings, peaks = log.proof(37)
+    assert verify(current[37], 37, 100, siblings, peaks, log.root())
+
+def test_truncate_after_crash_and_reopen(tmp_path):
+    path = str(tmp_path / "t.merkle")
+    log = MerkleLog(path)
+    log.append(leaves(20))
+    log.flush()
+    log.append(leaves(7, b"unflushed"))
+    reopened = MerkleLog(path)
+    assert reopened.size == 20 and not reopened.dirty
+    assert reopened.root() == naive_root(leaves(20))
+    reopened.append(leaves(3, b"after"))
+    assert reopened.root() == naive_root(leaves(20) + leaves(3, b"after"))
+    with pytest.raises(ValueError):
+        reopened.truncate(30)
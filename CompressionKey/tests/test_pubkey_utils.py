@@ -0,0 +1,51 @@
+import os
+
+import coincurve
+import numpy as np
+import pytest
+from ec_utils import _decompress_pow, compress, decompress
+from main import public_key_to_address
+from pubkey_utils import convert_file
+
+KEYS = [coincurve.PublicKey.from_secret(os.urandom(32)) for _ in range(50)]
+COMPRESSED = np.frombuffer(b''.join(k.format() for k in KEYS), dtype=np.uint8).reshape(-1, 33)
+UNCOMPRESSED = np.frombuffer(b''.join(k.format(False) for k in KEYS), dtype=np.uint8).reshape(-1, 65)
+
+def test_round_trip_and_curve_checks():
+    for fn in (decompress, _decompress_pow):
+        points, valid = fn(COMPRESSED)
+        assert valid.all() and (points == UNCOMPRESSED).all()
+    keys, valid = compress(UNCOMPRESSED)
+    assert valid.all() and (keys == COMPRESSED).all()
+    bad = COMPRESSED[:3].copy()
+    bad[0, 0] = 4     # wrong prefix
+    bad[1, 1:] = 0    # x = 0 is not on the curve
+    assert list(decompress(bad)[1]) == list(_decompress_pow(bad)[1]) == [False, False, True]
+    bad = UNCOMPRESSED[:2].copy()
+    bad[0, 64] ^= 1
+    assert list(compress(bad)[1]) == [False, True]
+
+def test_evm_address_of_compressed_key():
+    assert public_key_to_address(COMPRESSED[0].tobytes()) == public_key_to_address(UNCOMPRESSED[0].tobytes())
+    # Known vector: private key 1
+    g = coincurve.PublicKey.from_secret((1).to_bytes(32, 'big')).format()
+    assert public_key_to_address(g) == '0x7e5f4552091a69125d5dfcb7b8c2659029395bdf'
+    # A raw X | Y key is hashed as is, not with its first byte dropped
+    assert public_key_to_address(UNCOMPRESSED[0, 1:].tobytes()) == public_key_to_address(COMPRESSED[0].tobytes())
+    for bad in (UNCOMPRESSED[0, :63].tobytes(), b'\x05' + UNCOMPRESSED[0, 1:].tobytes()):
+        with pytest.raises(ValueError):
+            public_key_to_address(bad)
+
+def test_convert_file_streams_mixed_input(tmp_path):
+    lines = []
+    for i in range(20):
+        lines.append((COMPRESSED if i % 2 else UNCOMPRESSED)[i].tobytes().hex())
+    lines[5:5] = ['zz', '04' + '00' * 64]
+    src = tmp_path / 'keys.txt'
+    src.write_text('\n'.join(lines) + '\n\n')
+    converted, rejected = convert_file(src, tmp_path / 'out.txt', 'compressed', tmp_path / 'bad.txt', batch_size=7)
+    assert (converted, rejected) == (20, 2)
+    assert (tmp_path / 'out.txt').read_text().split() == [COMPRESSED[i].tobytes().hex() for i in range(20)]
+    assert (tmp_path / 'bad.txt').read_text().splitlines() == ['6\tzz', '7\t04' + '00' * 64]
+    convert_file(src, tmp_path / 'full.txt', 'uncompressed', batch_size=7)
+    assert (tmp_path / 'full.txt').read_text().split() == [UNCOMPRESSED[i].tobytes().hex() for i in range(20)]
@@ -0,0 +1,30 @@
+from rules import MarkovModel, Rule, default_rules, evaluate_rules, mutations, ranked_candidates
+
+WORDS = [b'password', b'sunshine', b'dragon', b'monkey']
+
+def test_hashcat_rules():
+    assert Rule('c $1', 1).apply(b'sunshine') == b'Sunshine1'
+    assert Rule('sa@ se3 so0', 1).apply(b'password') == b'p@ssw0rd'
+    assert Rule('u r', 1).apply(b'abc') == b'CBA'
+    assert Rule('^x ] T0', 1).apply(b'abc') == b'Xab'
+
+def test_mutations_are_emitted_best_first():
+    scores = [score for score, _, _ in mutations(WORDS, default_rules())]
+    assert scores == sorted(scores, reverse=True)
+
+def test_markov_generates_in_descending_probability():
+    model = MarkovModel().train(WORDS)
+    generated = list(model.generate(3, 8, limit=50))
+    scores = [score for score, _, _ in generated]
+    assert scores == sorted(scores, reverse=True)
+    assert all(3 <= len(word) <= 8 for _, word, _ in generated)
+
+def test_ranked_candidates_reach_common_mutations_early():
+    first = [candidate for candidate, _ in ranked_candidates(WORDS, limit=30)]
+    assert b'Password' in first and b'password1' in first
+
+def test_evaluate_rules_hit_rate():
+    stats = evaluate_rules(WORDS, [b'Sunshine1', b'dragon2024'])
+    assert stats.hits['c $1'] == 1
+    assert stats.hits['$2 $0 $2 $4'] == 1
+    assert stats.tried['c $1'] == len(WORDS)
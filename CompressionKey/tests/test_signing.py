@@ -0,0 +1,118 @@
+import hashlib
+import os
+
+import coincurve
+import pytest
+from ecdsa import SECP256k1, SigningKey
+from ecdsa.util import sigdecode_string
+from ec_utils import CURVE_ORDER
+from signing import NoncePool, Signer, Verifier, _verify_slow, recover_addresses
+
+SECRETS = {name: hashlib.sha256(name.encode()).digest() for name in ('relayer-a', 'relayer-b', 'relayer-c')}
+
+def test_rfc6979_signatures_recover_to_the_key():
+    signer = Signer()
+    signer.add_key('a', SECRETS['relayer-a'])
+    digests = [hashlib.sha256(b'action %d' % i).digest() for i in range(20)]
+    signatures = signer.sign_many('a', digests)
+    reference = SigningKey.from_string(SECRETS['relayer-a'], curve=SECP256k1)
+    for digest, signature in zip(digests, signatures):
+        signature = signature.tobytes()
+        assert signature == signer.sign('a', digest)
+        # Same deterministic nonce as python-ecdsa, with s in the lower half
+        r, s = sigdecode_string(reference.sign_digest_deterministic(digest, hashfunc=hashlib.sha256),
+                                CURVE_ORDER)
+        assert signature[:64] == r.to_bytes(32, 'big') + min(s, CURVE_ORDER - s).to_bytes(32, 'big')
+        recovered = coincurve.PublicKey.from_signature_and_message(signature, digest, hasher=None)
+        assert recovered.format() == signer.public_key('a')
+    with pytest.raises(ValueError):
+        signer.sign('a', b'short')
+
+def test_lru_reloads_evicted_keys():
+    loads = []
+    signer = Signer(loader=lambda name: loads.append(name) or SECRETS[name], capacity=2)
+    digest = bytes(32)
+    first = signer.sign('relayer-a', digest)
+    signer.sign('relayer-b', digest)
+    signer.sign('relayer-a', digest)
+    signer.sign('relayer-c', digest)  # evicts relayer-b
+    assert signer.sign('relayer-a', digest) == first
+    signer.sign('relayer-b', digest)
+    assert loads == ['relayer-a', 'relayer-b', 'relayer-c', 'relayer-b']
+    assert (signer.hits, signer.misses) == (2, 4)
+    with pytest.raises(KeyError):
+        Signer().sign('missing', digest)
+    with pytest.raises(ValueError):
+        Signer().add_key('zero', bytes(32))
+
+def test_batch_verify_and_recover():
+    signer = Signer()
+    for name, secret in SECRETS.items():
+        signer.add_key(name, secret)
+    names = ['relayer-a', 'relayer-b', 'relayer-a', 'relayer-c', 'relayer-a']
+    digests = [hashlib.sha256(b'move %d' % i).digest() for i in range(len(names))]
+    signatures = [signer.sign(name, digest) for name, digest in zip(names, digests)]
+    keys = [signer.public_key(name) for name in names]
+    r, s = signatures[4][:32], int.from_bytes(signatures[4][32:64], 'big')
+    high_s = r + (CURVE_ORDER - s).to_bytes(32, 'big')
+    cases = [
+        (keys[0], digests[0], signatures[0], True),
+        (keys[1], digests[1], signatures[1][:64], True),
+        (keys[2], digests[3], signatures[2], False),           # wrong digest
+        (keys[3], digests[3], signatures[0], False),           # wrong key
+        (b'\x02' + bytes(32), digests[0], signatures[0], False),
+        (keys[4], digests[4], high_s, False),
+    ]
+    verifier = Verifier()
+    public_keys, case_digests, case_signatures, expected = zip(*cases)
+    assert verifier.verify_many(public_keys, case_digests, case_signatures).tolist() == list(expected)
+    assert (verifier.hits, verifier.misses) == (2, 4)
+    assert verifier.verify(keys[4], digests[4], high_s, allow_high_s=True)
+    assert [_verify_slow(k, d, sig[:64], False) for k, d, sig, _ in cases] == list(expected)
+
+    addresses = [signer.address(name) for name in names]
+    eth_style = [sig[:64] + bytes([sig[64] + 27]) for sig in signatures]
+    assert recover_addresses(digests, eth_style, addresses).all()
+    # Rotated: only the last pair (relayer-a, relayer-a) still matches
+    assert recover_addresses(digests, signatures, addresses[1:] + addresses[:1]).tolist() == [
+        False, False, False, False, True]
+    assert not recover_addresses([digests[0]], [signatures[0][:64] + b'\x09'], addresses[:1])[0]
+    # Bare hex matches like '0x...'; malformed addresses never match
+    assert recover_addresses(digests[:1], signatures[:1], [addresses[0][2:]])[0]
+    assert not recover_addresses(digests[:1], signatures[:1], ['0x' + 'zz' * 20])[0]
+    assert not recover_addresses(digests[:1], signatures[:1], [addresses[0][:-2]])[0]
+
+def test_verify_rejects_short_signatures():
+    signer = Signer()
+    signer.add_key('a', SECRETS['relayer-a'])
+    digest = bytes(32)
+    signature = signer.sign('a', digest)
+    key = signer.public_key('a')
+    bad = [b'', signature[:1], signature[:63], signature + b'\x00']
+    assert not Verifier().verify_many([key] * len(bad), [digest] * len(bad), bad).any()
+    assert Verifier().verify(key, digest, signature)
+
+def test_nonce_pool_signatures_are_one_time_and_fork_safe():
+    pool = NoncePool(low=4, high=64, batch_size=16)
+    assert pool.fill(timeout=30)
+    signer = Signer(nonce_pool=pool)
+    signer.add_key('a', SECRETS['relayer-a'])
+    digests = [hashlib.sha256(b'tx %d' % i).digest() for i in range(80)]
+    signatures = signer.sign_many('a', digests)
+    # Every signature uses a fresh r, whether from the pool or from libsecp256k1
+    assert len({sig[:32].tobytes() for sig in signatures}) == len(digests)
+    assert pool.taken + pool.misses == len(digests) and pool.taken >= 64
+    assert Verifier().verify_many([signer.public_key('a')] * len(digests), digests, signatures).all()
+    assert recover_addresses(digests, signatures, [signer.address('a')] * len(digests)).all()
+
+    assert pool.fill(timeout=30)
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if len(pool) == 0 and pool.taken == 0 else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0 and len(pool) == 64
+
+    pool.close()
+    taken = pool.taken
+    signature = signer.sign('a', digests[0])
+    assert pool.taken == taken and Verifier().verify(signer.public_key('a'), digests[0], signature)
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from address_utils import derive_addresses, keccak256_batch
+from Crypto.Hash import keccak
+import vanity
+from vanity import _search_job, expected_attempts, search
+
+def test_keccak_batch_matches_pycryptodome():
+    messages = np.random.default_rng(1).integers(0, 256, (1100, 64), dtype=np.uint8)
+    digests = keccak256_batch(messages)
+    for i in (0, 1, 577, 1099):
+        assert digests[i].tobytes() == keccak.new(digest_bits=256, data=messages[i].tobytes()).digest()
+
+def test_incremental_walk_finds_prefix(monkeypatch):
+    # A fixed start (k = 12346) whose walk reaches an 0xa1f address within
+    # the budget; odd length exercises the half-byte comparison
+    monkeypatch.setattr(vanity.secrets, 'randbelow', lambda n: 12345)
+    key, attempts = _search_job(('a1f', 256, 64))
+    assert (int.from_bytes(key, 'big'), attempts) == (0x327b, 578)
+    assert derive_addresses([key], ('evm',))['evm'][0].startswith('0xa1f')
+
+def test_search_on_a_pool():
+    seen = []
+    key, address, attempts = search('0x0b', workers=2, batch_size=128, batches_per_job=2,
+                                    progress=lambda *args: seen.append(args))
+    assert address.startswith('0x0b') and address == derive_addresses([key], ('evm',))['evm'][0]
+    assert seen and seen[-1][0] == attempts
+    assert expected_attempts('0xab12') == 16 ** 4
+    with pytest.raises(ValueError, match="hexadecimal"):
+        search('0xGAME')
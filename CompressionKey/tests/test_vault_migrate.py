@@ -0,0 +1,113 @@
+import importlib.util
+import json
+import os
+import sys
+
+import pytest
+from Crypto.Protocol.KDF import PBKDF2
+from vault_migrate import (KIND_MNEMONIC_BYTES, KIND_PRIVATE_KEY, KIND_TEXT, WORDLIST, decrypt_legacy, detect,
+                           migrate, open_blob, words_to_bytes)
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+COUNT = 100
+PHRASE = "legal winner thank year wave sausage worth useful legal winner thank yellow"
+
+def _producer(name, path):
+    """Import a producer script with its KDF cost lowered to COUNT."""
+    sys.path.insert(0, os.path.dirname(path))
+    try:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.pop(0)
+    module.PBKDF2 = lambda password, salt, dkLen, count: PBKDF2(password, salt, dkLen=dkLen, count=COUNT)
+    return module
+
+@pytest.fixture(scope="module")
+def producers():
+    return {
+        "keyutils": _producer("key_utils_gui", os.path.join(SRC, "bip38", "key-utils.py")),
+        "seedbip": _producer("seedBip", os.path.join(SRC, "bip38seed", "seedBip.py")),
+        "seedtophrase": _producer("seedtophrase", os.path.join(SRC, "bip38seed", "SeedGen", "seedtophrase.py")),
+        "seedtoseed": _producer("Seedtoseed", os.path.join(SRC, "bip38seed", "SeedGen", "Seedtoseed.py")),
+    }
+
+def test_detects_and_decrypts_each_producer(producers):
+    key = "ab" * 31 + "00"
+    blob = producers["keyutils"].encrypt_key(key, "pw")
+    assert detect(blob) == "hex64"
+    # The stock decrypt_key loses the trailing zero byte; the migration keeps it
+    assert decrypt_legacy(blob, "pw", COUNT) == ("keyutils", KIND_PRIVATE_KEY, bytes.fromhex(key))
+
+    for phrase in ("short phrase", PHRASE):
+        blob = producers["seedbip"].encrypt_seed_phrase(phrase, "pw")
+        assert decrypt_legacy(blob, "pw", COUNT) == ("seedbip", KIND_TEXT, phrase.encode())
+    with pytest.raises(ValueError):
+        decrypt_legacy(producers["seedbip"].encrypt_seed_phrase(PHRASE, "pw"), "wrong", COUNT)
+
+    # Both word producers keep 24 words, 33 bytes of a blob of 64 or more
+    for blob in (producers["seedtophrase"].encrypt_seed_phrase(PHRASE, "pw"),
+                 producers["seedtoseed"].encrypt_to_24_word_mnemonic(PHRASE, "pw")):
+        assert detect(blob) == "truncated"
+        with pytest.raises(ValueError, match="Truncated"):
+            decrypt_legacy(blob, "pw", COUNT)
+    assert detect("not a blob") is None
+
+def _all_words(data):
+    """bytes_to_words without the 24-word cut-off."""
+    bits = bin(int.from_bytes(data, "big"))[2:].zfill(len(data) * 8)
+    return " ".join(WORDLIST[int(bits[i:i + 11].ljust(11, "0"), 2)] for i in range(0, len(bits), 11))
+
+def test_untruncated_word_blobs(producers, monkeypatch):
+    seedtophrase, seedtoseed = producers["seedtophrase"], producers["seedtoseed"]
+    monkeypatch.setattr(seedtophrase, "bytes_to_words", _all_words)
+    blob = seedtophrase.encrypt_seed_phrase(PHRASE, "pw")
+    assert detect(blob) == "words"
+    assert decrypt_legacy(blob, "pw", COUNT) == ("seedtophrase", KIND_TEXT, PHRASE.encode())
+
+    monkeypatch.setattr(seedtoseed, "bytes_to_24_word_mnemonic", _all_words)
+    blob = seedtoseed.encrypt_to_24_word_mnemonic(PHRASE, "pässword")
+    assert decrypt_legacy(blob, "pässword", COUNT) == ("seedtoseed", KIND_MNEMONIC_BYTES,
+                                                       words_to_bytes(PHRASE.split()))
+
+def _outputs(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_migrate_streams_and_resumes(producers, tmp_path):
+    src, dst = str(tmp_path / "legacy.txt"), str(tmp_path / "migrated.jsonl")
+    keys = [os.urandom(32).hex() for _ in range(6)]
+    lines = [producers["keyutils"].encrypt_key(k, "pw") for k in keys]
+    lines.insert(2, producers["seedbip"].encrypt_seed_phrase(PHRASE, "other") + "\tother")
+    lines.insert(4, "garbage")
+    with open(src, "w") as f:
+        f.write("\n".join(lines[:5]) + "\n\n" + "\n".join(lines[5:]) + "\n")
+
+    # keyutils blobs decrypt under any password, so they are only "unverified"
+    assert migrate(src, dst, "pw", workers=2, iterations=COUNT, legacy_iterations=COUNT,
+                   checkpoint_every=2, max_lines=3) == (1, 2, 0)
+    assert len(_outputs(dst)) == 3
+    assert migrate(src, dst, "pw", new_password="new", workers=2, iterations=COUNT,
+                   legacy_iterations=COUNT, checkpoint_every=2) == (1, 6, 1)
+
+    out = _outputs(dst)
+    assert [o["line"] for o in out] == [1, 2, 3, 4, 5, 7, 8, 9]
+    assert "error" in out[4]
+    assert (out[2]["format"], out[2]["status"]) == ("seedbip", "migrated")
+    assert out[0]["status"] == "unverified"
+    assert open_blob(out[2]["blob"], "other") == (KIND_TEXT, PHRASE.encode())
+    migrated = [o for o in out if o.get("format") == "keyutils"]
+    assert [open_blob(o["blob"], "new" if o["line"] > 3 else "pw")[1].hex() for o in migrated] == keys
+    with pytest.raises(ValueError):
+        open_blob(out[0]["blob"], "new")
+
+def test_lines_without_a_password_fail_alone(producers, tmp_path):
+    src, dst = str(tmp_path / "legacy.txt"), str(tmp_path / "migrated.jsonl")
+    phrase_blob = producers["seedbip"].encrypt_seed_phrase(PHRASE, "pw")
+    with open(src, "w") as f:
+        f.write(phrase_blob + "\n" + phrase_blob + "\tpw\n")
+    assert migrate(src, dst, workers=1, iterations=COUNT, legacy_iterations=COUNT) == (1, 0, 1)
+    out = _outputs(dst)
+    assert out[0] == {"line": 1, "error": "No password for this line"}
+    assert out[1]["status"] == "migrated"
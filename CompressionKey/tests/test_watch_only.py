@@ -0,0 +1,29 @@
+import pytest
+from bip_utils import Bip44, Bip44Changes, Bip44Coins
+from derivation_utils import HARDENED, Deriver, parse_xpub
+from watch_only import WatchOnlyWallet
+
+SEED = bytes(range(64))
+
+@pytest.fixture(scope="module")
+def account():
+    return Bip44.FromSeed(SEED, Bip44Coins.BITCOIN).Purpose().Coin().Account(0)
+
+def test_xpub_round_trip_and_refuses_private_keys(account):
+    xpub = account.PublicKey().ToExtended()
+    node = Deriver.from_seed(SEED).node((44 | HARDENED, HARDENED, HARDENED))
+    assert node.neuter().to_xpub() == xpub
+    assert parse_xpub(xpub) == node.neuter()
+    with pytest.raises(ValueError, match="private"):
+        WatchOnlyWallet(account.PrivateKey().ToExtended())
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_stream_matches_bip_utils_in_order(account, workers):
+    wallet = WatchOnlyWallet(account.PublicKey().ToExtended())
+    batches = list(wallet.stream(5, 25, change=1, batch_size=6, workers=workers))
+    assert [first for first, _, _ in batches] == [5, 11, 17, 23]
+    addresses = [address for _, _, chunk in batches for address in chunk]
+    change = account.Change(Bip44Changes.CHAIN_INT)
+    assert addresses == [change.AddressIndex(i).PublicKey().ToAddress() for i in range(5, 25)]
+    public_keys, _ = wallet.addresses([7], change=1)
+    assert public_keys[0].tobytes() == change.AddressIndex(7).PublicKey().RawCompressed().ToBytes()
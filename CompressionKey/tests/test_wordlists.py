@@ -0,0 +1,27 @@
+import os
+
+from wordlists import Wordlist, unique_candidates
+
+def write_list(path, words, trailing_newline=True):
+    data = '\n'.join(words) + ('\n' if trailing_newline else '')
+    path.write_bytes(data.encode())
+    return str(path)
+
+def test_seek_matches_stream(tmp_path):
+    words = ['word%d' % i for i in range(1000)]
+    path = write_list(tmp_path / 'list.txt', words, trailing_newline=False)
+    with Wordlist(path) as wl:
+        assert len(wl) == 1000
+        assert [w for chunk in wl.chunks(chunk_size=64) for w in chunk] == [w.encode() for w in words]
+        assert [w for chunk in wl.chunks(250, 300, chunk_size=16) for w in chunk] == [w.encode() for w in words[250:300]]
+        assert wl.line(999) == b'word999'
+    # Second open reuses the cached line index
+    assert os.path.exists(path + '.idx')
+    with Wordlist(path) as wl:
+        assert wl.line(123) == b'word123'
+
+def test_unique_candidates_across_lists(tmp_path):
+    first = write_list(tmp_path / 'a.txt', ['sunshine', 'Password', 'sunshine'])
+    second = write_list(tmp_path / 'b.txt', ['Alice', 'password', 'sunshine'])
+    assert list(unique_candidates([first, second])) == [b'sunshine', b'Password', b'Alice', b'password']
+    assert list(unique_candidates([first, second], lower=True)) == [b'sunshine', b'password', b'alice']